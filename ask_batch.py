@@ -0,0 +1,55 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import argparse
+import json
+import logging
+import sys
+
+logging.basicConfig(level=logging.WARNING)
+
+
+def _read_questions(input_file):
+    for line in input_file:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield line
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Answers questions serialized in JSON lines like '
+                                                 '{"q": "Who is the president of France?", "lang": "en"} '
+                                                 'and writes the answers in JSON lines in the same order')
+    parser.add_argument('input', nargs='?', type=argparse.FileType('r', encoding='utf-8'), default=sys.stdin,
+                        help='the questions file (default: standard input)')
+    parser.add_argument('output', nargs='?', type=argparse.FileType('w', encoding='utf-8'), default=sys.stdout,
+                        help='the answers file (default: standard output)')
+    parser.add_argument('--accept-language', default='en', help='the language of the formatted results')
+    parser.add_argument('--workers', type=int, default=8, help='the number of questions processed at the same time')
+    args = parser.parse_args()
+
+    # Uses the same configuration as the server
+    from flask_server import _request_handler
+
+    for answer in _request_handler.ask_batch(_read_questions(args.input), args.accept_language, args.workers):
+        args.output.write(json.dumps(answer) + '\n')
+        args.output.flush()
@@ -0,0 +1,38 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+import argparse
+import logging
+
+from platypus_qa import SAMPLE_QUESTIONS, WikidataKnowledgeBase
+
+logging.basicConfig(level=logging.INFO)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stores the Wikidata relations vocabulary in a file that could be '
+                                                 'used as WIKIDATA_VOCABULARY_FILE by the server')
+    parser.add_argument('output', help='the file to write')
+    parser.add_argument('--languages', nargs='+', default=sorted(SAMPLE_QUESTIONS.keys()),
+                        help='the language codes to export (default: the languages with sample questions)')
+    parser.add_argument('--sparql-endpoint', default='https://query.wikidata.org/sparql',
+                        help='the Wikidata SPARQL endpoint to use')
+    args = parser.parse_args()
+
+    WikidataKnowledgeBase('', wikidata_sparql_endpoint_uri=args.sparql_endpoint) \
+        .save_vocabulary(args.output, args.languages)
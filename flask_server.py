@@ -17,16 +17,22 @@ GNU Affero General Public License for more details.
 You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
+import gc
+import json
 import logging
 
-from flask import Flask, request
+from flask import Flask, request, Response, stream_with_context
 from flask import redirect
 from flask.json import jsonify
 from flask_cors import CORS
 from flask_swaggerui import build_static_blueprint, render_swaggerui
 
 from platypus_qa import QAHandler, SAMPLE_QUESTIONS, SyntaxNetParser, SpacyParser, CoreNLPParser, WikidataKnowledgeBase
+from platypus_qa.cache import SQLiteDictCache, DummyDictCache, SingleFlightCache
+from platypus_qa.database.entity_cache import EntityCache
+from platypus_qa.database.formula import dnf_statistics
 from platypus_qa.logs import DummyDictLogger, JsonFileDictLogger
+from platypus_qa.qa import SharedExecutor
 from platypus_qa.request_handler import SimpleWikidataSparqlHandler, DisambiguatedWikidataSparqlHandler, RequestHandler
 
 logging.basicConfig(level=logging.INFO)
@@ -40,19 +46,68 @@ CORS(app)
 _request_logger = JsonFileDictLogger(app.config['REQUEST_LOGGING_FILE']) \
     if app.config.get('REQUEST_LOGGING_FILE') else DummyDictLogger()
 
-_parsers = [
-    SpacyParser(),
-    CoreNLPParser([app.config['CORE_NLP_URL']]),
-    SyntaxNetParser([app.config['SYNTAXNET_URL']])
-]
+_sparql_cache = SQLiteDictCache(app.config['SPARQL_CACHE_FILE']) \
+    if app.config.get('SPARQL_CACHE_FILE') else DummyDictCache()
+
+_parse_cache = SQLiteDictCache(app.config['PARSE_CACHE_FILE']) \
+    if app.config.get('PARSE_CACHE_FILE') else DummyDictCache()
+
+_entity_cache = EntityCache(app.config.get('ENTITY_CACHE_MAX_SIZE', 64 * 1024 * 1024))
+
+_individuals_cache = SingleFlightCache(app.config.get('INDIVIDUALS_CACHE_MAX_SIZE', 64 * 1024 * 1024),
+                                       app.config.get('INDIVIDUALS_NEGATIVE_TTL', 60))
+
+_executor = SharedExecutor(app.config.get('EXECUTOR_MAX_WORKERS', 16))
+_parsing_executor = SharedExecutor(app.config.get('PARSING_EXECUTOR_MAX_WORKERS', 16))
+
+_core_nlp_parser = CoreNLPParser(app.config.get('CORE_NLP_URLS', [app.config['CORE_NLP_URL']]),
+                                 parse_cache=_parse_cache, model_version=app.config.get('CORE_NLP_MODEL_VERSION', ''),
+                                 pool_size=app.config.get('PARSER_POOL_SIZE', 16),
+                                 timeout=app.config.get('PARSER_TIMEOUT', 10))
+_syntaxnet_parser = SyntaxNetParser(app.config.get('SYNTAXNET_URLS', [app.config['SYNTAXNET_URL']]),
+                                    parse_cache=_parse_cache,
+                                    model_version=app.config.get('SYNTAXNET_MODEL_VERSION', ''),
+                                    pool_size=app.config.get('PARSER_POOL_SIZE', 16),
+                                    timeout=app.config.get('PARSER_TIMEOUT', 10))
+_parsers = [SpacyParser(), _core_nlp_parser, _syntaxnet_parser]
 _compacted_wikidata_kb = WikidataKnowledgeBase(app.config['WIKIDATA_KNOWLEDGE_BASE_URL'],
-                                               compacted_individuals=True, preload_languages=SAMPLE_QUESTIONS.keys())
+                                               compacted_individuals=True, preload_languages=SAMPLE_QUESTIONS.keys(),
+                                               sparql_cache=_sparql_cache,
+                                               vocabulary_file=app.config.get('WIKIDATA_VOCABULARY_FILE'),
+                                               entity_fetch_concurrency=app.config.get('ENTITY_FETCH_CONCURRENCY', 8),
+                                               entity_cache=_entity_cache,
+                                               entity_search_limit=app.config.get('ENTITY_SEARCH_LIMIT', 1000),
+                                               individuals_limits=app.config.get('INDIVIDUALS_LIMITS', ()),
+                                               sparql_concurrency=app.config.get('SPARQL_CONCURRENCY', 4),
+                                               individuals_cache=_individuals_cache)
 _wikidata_kb = WikidataKnowledgeBase(app.config['WIKIDATA_KNOWLEDGE_BASE_URL'],
-                                     compacted_individuals=False, preload_languages=SAMPLE_QUESTIONS.keys())
-_simple_wikidata_sparql_handler = SimpleWikidataSparqlHandler(QAHandler(_parsers, _wikidata_kb), _wikidata_kb)
-_disambiguated_wikidata_sparql_handler = DisambiguatedWikidataSparqlHandler(QAHandler(_parsers, _wikidata_kb, True),
-                                                                            _wikidata_kb)
-_request_handler = RequestHandler(QAHandler(_parsers, _compacted_wikidata_kb), _request_logger)
+                                     compacted_individuals=False, preload_languages=SAMPLE_QUESTIONS.keys(),
+                                     sparql_cache=_sparql_cache,
+                                     vocabulary_file=app.config.get('WIKIDATA_VOCABULARY_FILE'),
+                                     entity_fetch_concurrency=app.config.get('ENTITY_FETCH_CONCURRENCY', 8),
+                                     entity_cache=_entity_cache,
+                                     entity_search_limit=app.config.get('ENTITY_SEARCH_LIMIT', 1000),
+                                     individuals_limits=app.config.get('INDIVIDUALS_LIMITS', ()),
+                                     sparql_concurrency=app.config.get('SPARQL_CONCURRENCY', 4),
+                                     individuals_cache=_individuals_cache)
+_parser_hedging_delays = app.config.get('PARSER_HEDGING_DELAYS')
+_simple_wikidata_sparql_handler = SimpleWikidataSparqlHandler(
+    QAHandler(_parsers, _wikidata_kb, executor=_executor, parser_hedging_delays=_parser_hedging_delays,
+              parsing_executor=_parsing_executor),
+    _wikidata_kb)
+_disambiguated_wikidata_sparql_handler = DisambiguatedWikidataSparqlHandler(
+    QAHandler(_parsers, _wikidata_kb, True, executor=_executor, parser_hedging_delays=_parser_hedging_delays,
+              parsing_executor=_parsing_executor),
+    _wikidata_kb, executor=_executor)
+_request_handler = RequestHandler(
+    QAHandler(_parsers, _compacted_wikidata_kb, executor=_executor, parser_hedging_delays=_parser_hedging_delays,
+              parsing_executor=_parsing_executor),
+    _request_logger)
+
+# The preloaded vocabulary is never modified: keep it out of the garbage collector so that the pages shared with
+# forked workers (gunicorn --preload) are not copied
+if hasattr(gc, 'freeze'):
+    gc.freeze()
 
 
 @app.route('/', methods=['GET'])
@@ -62,6 +117,20 @@ def root():
 
 @app.route('/v0/ask', methods=['GET'])
 def ask():
+    # Results are streamed as soon as they are found if the client asks for NDJSON or Server-Sent Events
+    mimetype = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson', 'text/event-stream'])
+    if mimetype == 'application/x-ndjson' or mimetype == 'text/event-stream':
+        results = _request_handler.ask_stream(
+            request.args['q'],
+            request.args.get('lang', 'und'),
+            str(request.accept_languages)
+        )
+        if mimetype == 'text/event-stream':
+            lines = ('data: {}\n\n'.format(json.dumps(result)) for result in results)
+        else:
+            lines = (json.dumps(result) + '\n' for result in results)
+        return Response(stream_with_context(lines), mimetype=mimetype)
+
     return jsonify(_request_handler.ask(
         request.args['q'],
         request.args.get('lang', 'und'),
@@ -69,6 +138,23 @@ def ask():
     ))
 
 
+@app.route('/v0/ask-batch', methods=['POST'])
+def ask_batch():
+    def questions():
+        for line in request.stream:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line.decode('utf-8'))
+                except ValueError:
+                    yield line.decode('utf-8', 'replace')
+
+    answers = _request_handler.ask_batch(questions(), str(request.accept_languages),
+                                         app.config.get('BATCH_MAX_WORKERS', 8))
+    return Response(stream_with_context(json.dumps(answer) + '\n' for answer in answers),
+                    mimetype='application/x-ndjson')
+
+
 @app.route('/v0/samples', methods=['GET'])
 def samples():
     lang = request.accept_languages.best_match(list(SAMPLE_QUESTIONS.keys()))
@@ -85,6 +171,23 @@ def disambiguated_wikidata_sparql():
     return _disambiguated_wikidata_sparql_handler.build_sparql()
 
 
+@app.route('/v0/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        'entity_cache': _entity_cache.stats,
+        'executor': _executor.stats,
+        'formula': dnf_statistics(),
+        'individuals_cache': _individuals_cache.stats,
+        'parse_cache': _parse_cache.stats,
+        'parser_backends': {
+            'core_nlp': _core_nlp_parser.backend_stats,
+            'syntaxnet': _syntaxnet_parser.backend_stats
+        },
+        'parsing_executor': _parsing_executor.stats,
+        'sparql_cache': _sparql_cache.stats
+    })
+
+
 @app.route('/v0')
 def v0root():
     return render_swaggerui(swagger_spec_path='/v0/swagger.json')
@@ -22,7 +22,7 @@ import logging
 import re
 from collections import defaultdict
 from itertools import chain, product
-from typing import List, Iterable, Set
+from typing import List, Iterable, Set, Optional
 
 from platypus_qa.analyzer.case_words import get_case_word_from_str
 from platypus_qa.analyzer.literal_parser import parse_literal
@@ -31,6 +31,7 @@ from platypus_qa.database.formula import VariableFormula, Select, AndFormula, Eq
     ExistsFormula, Term, Type
 from platypus_qa.database.model import KnowledgeBase
 from platypus_qa.database.owl import Class, owl_Thing, rdfs_Literal
+from platypus_qa.deadline import check_deadline
 from platypus_qa.nlp.model import Sentence, NLPParser, Token, SimpleToken
 from platypus_qa.nlp.universal_dependencies import UDDependency, UDPOSTag
 
@@ -84,11 +85,17 @@ _meaningless_roots = {
 
 
 class GrammaticalAnalyzer:
-    def __init__(self, parser: NLPParser, knowledge_base: KnowledgeBase, language_code: str):
+    def __init__(self, parser: NLPParser, knowledge_base: KnowledgeBase, language_code: str,
+                 individuals_limit: Optional[int] = None):
+        """
+        :param individuals_limit: maximal number of individuals to consider for a label
+        """
         self._parser = parser
         self._knowledge_base = knowledge_base
         self._language_code = language_code
+        self._individuals_limit = individuals_limit
         self._variable_counter = 0
+        self.individuals_pruned = False  # if the limit has made the analysis drop some individuals
 
     def analyze(self, text: str) -> List[Term]:
         sentences = self._parser.parse(text, self._language_code)
@@ -106,6 +113,7 @@ class GrammaticalAnalyzer:
         return [result for result in results if result]
 
     def _analyze_tree(self, node: Token, expected_type: Type = Type.from_entity(owl_Thing)) -> Set[Select]:
+        check_deadline()
         _logger.info('main {}'.format(node.word))
         possibles = set()
 
@@ -137,7 +145,7 @@ class GrammaticalAnalyzer:
         # We try other nodes
         question_word = None
         type_constraints = None
-        left_children_to_parse = node.left_children
+        left_children_to_parse = list(node.left_children)
         question_nodes = []
         for child in node.left_children:
             question_nodes.extend(child.subtree)
@@ -154,7 +162,7 @@ class GrammaticalAnalyzer:
                 left_children_to_parse = self._nodes_after(left_children_to_parse, child)
                 break
 
-        children_to_parse = self._filter_not_main_dependencies(left_children_to_parse + node.right_children)
+        children_to_parse = self._filter_not_main_dependencies(chain(left_children_to_parse, node.right_children))
         _logger.info('question word {}'.format(question_word))
         _logger.info('main children {}'.format(' '.join(str([str(node) for node in children_to_parse]))))
 
@@ -354,10 +362,15 @@ class GrammaticalAnalyzer:
                 for relation in relations}
 
     def _individuals_for_nodes(self, nodes, type_filter: Class = owl_Thing) -> List[Select]:
+        check_deadline()
+        label = self._nodes_to_string(nodes)
         individuals = self._knowledge_base.individuals_from_label(
-            self._nodes_to_string(nodes), self._language_code, type_filter)
+            label, self._language_code, type_filter, limit=self._individuals_limit)
+        if self._individuals_limit is not None and not self.individuals_pruned:
+            count = self._knowledge_base.individuals_count(label, self._language_code, type_filter)
+            self.individuals_pruned = count is None or count > self._individuals_limit
         _logger.info(
-            'individual: {} with result {}'.format(self._nodes_to_string(nodes), [str(i) for i in individuals]))
+            'individual: {} with result {}'.format(label, [str(i) for i in individuals]))
         return individuals
 
     def _relations_for_nodes(self, nodes, nounified_patterns=None, range: Type = Type.top()) -> List[Select]:
@@ -373,6 +386,7 @@ class GrammaticalAnalyzer:
         return list(set(relations))
 
     def _find_relations_with_pattern(self, label, nounified_patterns=None, range: Type = Type.top()) -> List[Select]:
+        check_deadline()
         if nounified_patterns is None:
             nounified_patterns = ('{}',)
         relations = self._knowledge_base.relations_from_labels(
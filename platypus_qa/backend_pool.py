@@ -0,0 +1,242 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Sequence
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from platypus_qa.deadline import request_timeout
+
+_logger = logging.getLogger('backend_pool')
+
+
+class _Backend:
+    def __init__(self, url: str, pool_size: int):
+        self.url = url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.outstanding = 0
+        self.latency = None  # Exponentially weighted moving average in seconds
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+    def is_available(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+    def stats(self, now: float) -> dict:
+        return {
+            'url': self.url,
+            'outstanding': self.outstanding,
+            'latency': self.latency,
+            'consecutive_failures': self.consecutive_failures,
+            'ejected': not self.is_available(now)
+        }
+
+
+class BackendPool:
+    """
+    Servers providing the same HTTP service.
+
+    Each request is sent to the available server with the fewest outstanding requests, ties being broken by the
+    moving average of their latencies. A server is ejected for ejection_time seconds after max_failures consecutive
+    failures (connection errors, timeouts and 5xx responses). If all the servers are ejected, the one that would be
+    back the first is used.
+    If a request is not answered after the hedging_percentile of the recent latencies, it is sent again to another
+    server and the first successful response is returned. At most max_hedged_in_flight hedged requests are running at
+    the same time: they are not cancelled when the other request succeeds.
+    """
+
+    _latency_decay = 0.3
+    _latency_window = 256
+    _hedging_min_samples = 20
+
+    def __init__(self, urls: Sequence[str], pool_size: int = 16, max_failures: int = 3, ejection_time: float = 30,
+                 hedging_percentile: Optional[float] = 95, timeout: Optional[float] = 10,
+                 max_hedged_in_flight: Optional[int] = None):
+        """
+        :param pool_size: the maximal number of connections kept open with each server
+        :param hedging_percentile: None to disable hedging
+        :param timeout: time in seconds after which a server that has not answered has failed. It is shortened by the
+        deadline of the request but the server has not failed if this shorter timeout expires. It should be lower
+        than the usual request deadlines in order to detect the servers that hang. None to never time out.
+        :param max_hedged_in_flight: pool_size if not set
+        """
+        if not urls:
+            raise ValueError('A backend pool requires at least one server')
+        self._backends = [_Backend(url, pool_size) for url in urls]
+        self._max_failures = max_failures
+        self._ejection_time = ejection_time
+        self._hedging_percentile = hedging_percentile
+        self._latencies = deque(maxlen=self._latency_window)
+        self._lock = threading.Lock()
+        self._timeout = timeout
+        self._max_hedged_in_flight = max_hedged_in_flight if max_hedged_in_flight is not None else pool_size
+        self._hedged = 0
+        self._hedged_in_flight = 0
+        self._hedges_skipped = 0
+        self._executor = ThreadPoolExecutor(max_workers=2 * pool_size) \
+            if hedging_percentile is not None and len(urls) > 1 else None
+
+    def post(self, **kwargs) -> requests.Response:
+        """
+        Sends a POST request to one of the servers. The arguments are the ones of requests.Session.post except url
+        and timeout.
+        :raise requests.RequestException if no server has answered
+        :raise DeadlineExceeded if the deadline of the request has already expired
+        """
+        kwargs = dict(kwargs, timeout=request_timeout(self._timeout))
+        hedging_delay = self._hedging_delay()
+        if hedging_delay is None:
+            return self._post(self._acquire(), kwargs)
+
+        first = self._acquire()
+        futures = {self._submit(first, kwargs)}
+        try:
+            done, _ = wait(futures, hedging_delay)
+            if not done and self._reserve_hedge():
+                second = self._acquire(exclude=first)
+                if second is None:
+                    self._end_hedge()
+                else:
+                    with self._lock:
+                        self._hedged += 1
+                    hedge = self._submit(second, kwargs)
+                    hedge.add_done_callback(lambda _: self._end_hedge())
+                    futures.add(hedge)
+
+            # The first successful response is returned. The other request is not stopped but its result is ignored
+            result = None
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None and not self._is_failure(future.result()):
+                        return future.result()
+                    result = future
+            return result.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _submit(self, backend: _Backend, kwargs: dict) -> Future:
+        future = self._executor.submit(self._post, backend, kwargs)
+
+        def release_if_cancelled(future):
+            # _post has never run and could not release the server
+            if future.cancelled():
+                self._release(backend, 0, None)
+
+        future.add_done_callback(release_if_cancelled)
+        return future
+
+    def _reserve_hedge(self) -> bool:
+        with self._lock:
+            if self._hedged_in_flight >= self._max_hedged_in_flight:
+                self._hedges_skipped += 1
+                return False
+            self._hedged_in_flight += 1
+            return True
+
+    def _end_hedge(self):
+        with self._lock:
+            self._hedged_in_flight -= 1
+
+    def _post(self, backend: _Backend, kwargs: dict) -> requests.Response:
+        start = time.monotonic()
+        failed = True
+        try:
+            response = backend.session.post(backend.url, **kwargs)
+            failed = self._is_failure(response)
+            return response
+        except requests.Timeout:
+            # A timeout shortened by the deadline of the request does not tell anything about the server
+            if self._timeout is None or kwargs['timeout'] != self._timeout:
+                failed = None
+            raise
+        finally:
+            self._release(backend, time.monotonic() - start, failed)
+
+    @staticmethod
+    def _is_failure(response: requests.Response) -> bool:
+        return response.status_code >= 500
+
+    def _acquire(self, exclude: Optional[_Backend] = None) -> Optional[_Backend]:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [backend for backend in self._backends if backend is not exclude]
+            if not candidates:
+                return None
+            available = [backend for backend in candidates if backend.is_available(now)]
+            if available:
+                backend = min(available, key=lambda backend: (backend.outstanding, backend.latency or 0))
+            elif exclude is not None:
+                return None  # No need to hedge with an ejected server
+            else:
+                backend = min(candidates, key=lambda backend: backend.ejected_until)
+            backend.outstanding += 1
+            return backend
+
+    def _release(self, backend: _Backend, latency: float, failed: Optional[bool]):
+        """
+        :param failed: None if the request outcome does not tell if the server is working
+        """
+        with self._lock:
+            backend.outstanding -= 1
+            if failed is None:
+                return
+            if failed:
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= self._max_failures:
+                    backend.ejected_until = time.monotonic() + self._ejection_time
+                    _logger.warning('Server {} ejected after {} failures'.format(
+                        backend.url, backend.consecutive_failures))
+            else:
+                backend.consecutive_failures = 0
+                backend.ejected_until = 0.0
+                backend.latency = latency if backend.latency is None else \
+                    self._latency_decay * latency + (1 - self._latency_decay) * backend.latency
+                self._latencies.append(latency)
+
+    def _hedging_delay(self) -> Optional[float]:
+        if self._executor is None:
+            return None
+        with self._lock:
+            if len(self._latencies) < self._hedging_min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self._hedging_percentile / 100))]
+
+    @property
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'backends': [backend.stats(now) for backend in self._backends],
+                'hedged_requests': self._hedged,
+                'hedged_in_flight': self._hedged_in_flight,
+                'hedges_skipped': self._hedges_skipped
+            }
@@ -0,0 +1,265 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+from typing import Any, Callable, Dict, Hashable
+
+from platypus_qa.deadline import check_deadline, request_timeout
+
+_logger = logging.getLogger('cache')
+
+# Result given to the calls waiting for a computation whose deadline has expired
+_owner_timed_out = object()
+
+
+class DictCache:
+    """
+    Cache of JSON serializable values indexed by strings
+    """
+
+    def get(self, key: str):
+        """
+        :return: the cached value or None if there is no valid value for this key
+        """
+        raise NotImplementedError('DictCache.get is not implemented')
+
+    def set(self, key: str, value):
+        raise NotImplementedError('DictCache.set is not implemented')
+
+    @property
+    def stats(self) -> dict:
+        return {}
+
+
+class DummyDictCache(DictCache):
+    def get(self, key: str):
+        return None
+
+    def set(self, key: str, value):
+        pass
+
+
+class SQLiteDictCache(DictCache):
+    """
+    Cache stored in a SQLite file. It could be shared by all the processes of a host.
+    Entries expire after ttl seconds and the least recently used entries are evicted when the size of the stored
+    values is greater than max_size bytes.
+    """
+
+    _eviction_check_period = 64
+    _access_update_period = 60
+
+    def __init__(self, file_name: str, ttl: float = 24 * 3600, max_size: int = 256 * 1024 * 1024):
+        self._file_name = file_name
+        self._ttl = ttl
+        self._max_size = max_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._sets_since_eviction_check = 0
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS cache ('
+                               'key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, '
+                               'expires REAL NOT NULL, accessed REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)')
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections should not be shared between threads or forked processes
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = sqlite3.connect(self._file_name, timeout=10)
+            self._local.connection.execute('PRAGMA journal_mode=WAL')
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def get(self, key: str):
+        now = time.time()
+        try:
+            with self._connection() as connection:
+                row = connection.execute('SELECT value, expires, accessed FROM cache WHERE key = ?',
+                                         (key,)).fetchone()
+                if row is not None and row[1] < now:
+                    connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+                    row = None
+                if row is not None and row[2] + self._access_update_period < now:
+                    connection.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        except sqlite3.Error as e:
+            _logger.warning('SQLite cache error: {}'.format(e))
+            row = None
+
+        with self._lock:
+            if row is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return None if row is None else json.loads(row[0])
+
+    def set(self, key: str, value):
+        now = time.time()
+        serialization = json.dumps(value)
+        try:
+            with self._connection() as connection:
+                connection.execute('INSERT OR REPLACE INTO cache(key, value, size, expires, accessed) '
+                                   'VALUES (?, ?, ?, ?, ?)',
+                                   (key, serialization, len(key) + len(serialization), now + self._ttl, now))
+            with self._lock:
+                self._sets_since_eviction_check += 1
+                do_eviction = self._sets_since_eviction_check >= self._eviction_check_period
+                if do_eviction:
+                    self._sets_since_eviction_check = 0
+            if do_eviction:
+                self.evict()
+        except sqlite3.Error as e:
+            _logger.warning('SQLite cache error: {}'.format(e))
+
+    def evict(self):
+        """
+        Removes expired entries and then the least recently used ones until the size limit is respected
+        """
+        with self._connection() as connection:
+            connection.execute('DELETE FROM cache WHERE expires < ?', (time.time(),))
+            excess = connection.execute('SELECT TOTAL(size) FROM cache').fetchone()[0] - self._max_size
+            evicted_keys = []
+            for key, size in connection.execute('SELECT key, size FROM cache ORDER BY accessed'):
+                if excess <= 0:
+                    break
+                evicted_keys.append((key,))
+                excess -= size
+            connection.executemany('DELETE FROM cache WHERE key = ?', evicted_keys)
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses}
+
+
+def _estimated_size(value, depth: int = 3) -> int:
+    """
+    :return: an estimation of the memory used by value in bytes: the objects referenced by value are only considered
+    up to depth levels
+    """
+    size = sys.getsizeof(value)
+    if depth > 0:
+        if isinstance(value, (list, tuple, set, frozenset)):
+            size += sum(_estimated_size(item, depth - 1) for item in value)
+        elif isinstance(value, dict):
+            size += sum(_estimated_size(key, depth - 1) + _estimated_size(item, depth - 1)
+                        for key, item in value.items())
+        elif hasattr(value, '__dict__'):
+            size += _estimated_size(vars(value), depth - 1)
+    return size
+
+
+class SingleFlightCache:
+    """
+    In memory cache of the results of a function.
+    Concurrent calls for a missing key share the same computation and failures are not cached. If the computation
+    fails because the deadline of the call running it has expired, the other calls run it again under their own
+    deadline.
+    Empty results are cached only for negative_ttl seconds. The least recently used results are evicted when their
+    estimated size is greater than max_size bytes and when there are more than max_negative_size empty results.
+    """
+
+    def __init__(self, max_size: int = 64 * 1024 * 1024, negative_ttl: float = 60, max_negative_size: int = 8192,
+                 size_of: Callable[[Any], int] = _estimated_size):
+        self._max_size = max_size
+        self._negative_ttl = negative_ttl
+        self._max_negative_size = max_negative_size
+        self._size_of = size_of
+        self._values = OrderedDict()  # key -> (size, value)
+        self._size = 0
+        self._negative_values = OrderedDict()  # key -> (expiration time, value)
+        self._in_flight = {}  # type: Dict[Hashable, Future]
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._negative_hits = 0
+        self._coalesced = 0
+        self._misses = 0
+
+    def get(self, key: Hashable, compute: Callable[[], Any]):
+        """
+        :return: the cached value for key or the one returned by compute
+        """
+        while True:
+            with self._lock:
+                if key in self._values:
+                    self._values.move_to_end(key)
+                    self._hits += 1
+                    return self._values[key][1]
+                if key in self._negative_values:
+                    expiration, value = self._negative_values[key]
+                    if expiration > time.monotonic():
+                        self._negative_hits += 1
+                        return value
+                    del self._negative_values[key]
+                future = self._in_flight.get(key)
+                if future is None:
+                    future = Future()
+                    self._in_flight[key] = future
+                    self._misses += 1
+                    break
+                self._coalesced += 1
+
+            value = future.result(request_timeout())
+            if value is not _owner_timed_out:
+                return value
+            # The deadline of the call computing the value has expired: we try again if ours has not
+            check_deadline()
+
+        try:
+            value = compute()
+        except TimeoutError:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_result(_owner_timed_out)
+            raise
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        size = self._size_of(value) if value else 0
+        with self._lock:
+            del self._in_flight[key]
+            if value:
+                self._values[key] = (size, value)
+                self._size += size
+                while self._size > self._max_size and self._values:
+                    self._size -= self._values.popitem(last=False)[1][0]
+            else:
+                self._negative_values[key] = (time.monotonic() + self._negative_ttl, value)
+                while len(self._negative_values) > self._max_negative_size:
+                    self._negative_values.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self._hits, 'negative_hits': self._negative_hits, 'coalesced': self._coalesced,
+                    'misses': self._misses, 'entries': len(self._values), 'size': self._size}
@@ -0,0 +1,177 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple, Dict
+
+# Properties that depend on the language even if their values are not language tagged
+_localized_keys = {'name', 'description', 'alternateName', 'detailedDescription'}
+
+# Regional variants that are different languages for Wikidata. The other ones are reduced to their language
+_regional_languages = {'pt-br', 'zh-cn', 'zh-hans', 'zh-hant', 'zh-hk', 'zh-tw'}
+
+
+@lru_cache(maxsize=1024)
+def language_chain(accept_language: Optional[str]) -> Tuple[str, ...]:
+    """
+    :return: the languages of an Accept-Language header by decreasing preference, e.g. ('en', 'fr') for
+    "en-US,en;q=0.9,fr;q=0.8"
+    """
+    if not accept_language:
+        return ()
+    ranges = []
+    for position, item in enumerate(accept_language.split(',')):
+        parts = item.strip().split(';')
+        tag = parts[0].strip().lower()
+        quality = 1.0
+        for parameter in parts[1:]:
+            name, _, value = parameter.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if tag and tag != '*' and quality > 0:
+            ranges.append((-quality, position, tag))
+
+    languages = []
+    for _, _, tag in sorted(ranges):
+        if tag not in _regional_languages:
+            tag = tag.split('-')[0]
+        if tag not in languages:
+            languages.append(tag)
+    return tuple(languages)
+
+
+class _CachedEntity:
+    __slots__ = ('base', 'slices', 'languages', 'chains', 'size')
+
+    def __init__(self):
+        self.base = {}  # Values not depending on the language
+        self.slices = {}  # type: Dict[str, dict]
+        self.languages = set()  # Languages with a complete slice: they have been the preferred language of a request
+        self.chains = set()  # Lists of languages already requested
+        self.size = 0
+
+    def can_build(self, languages: Tuple[str, ...]) -> bool:
+        return languages in self.chains or self.languages.issuperset(languages)
+
+
+class EntityCache:
+    """
+    Cache of the JSON-LD representations of entities indexed by IRI.
+    The language dependent values are stored by language so that the cached representations are shared between all
+    the lists of languages that have already been requested for an entity. For each property, the value in the most
+    preferred language is used.
+    The least recently used entities are evicted when the estimated size of the cached values is greater than
+    max_size bytes.
+    """
+
+    def __init__(self, max_size: int = 64 * 1024 * 1024):
+        self._max_size = max_size
+        self._entities = OrderedDict()  # type: OrderedDict[str, _CachedEntity]
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, iri: str, languages: Tuple[str, ...]) -> Optional[dict]:
+        """
+        :return: the representation of the entity or None if the cache does not know it for these languages
+        """
+        with self._lock:
+            entity = self._entities.get(iri)
+            if entity is None or not entity.can_build(languages):
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entities.move_to_end(iri)
+            return self._build(entity, languages)
+
+    def add(self, iri: str, languages: Tuple[str, ...], representation: dict,
+            served_language: Optional[str] = None) -> dict:
+        """
+        Stores the representation returned for the given languages.
+        :param served_language: the language of the values that are not language tagged, by default the first one of
+        languages
+        :return: the representation of the entity built from the cache content
+        """
+        if served_language is None:
+            served_language = languages[0] if languages else 'und'
+        base = {}
+        slices = {}
+        for key, value in representation.items():
+            values = value if isinstance(value, list) else [value]
+            if values and all(isinstance(item, dict) and '@language' in item for item in values):
+                for item in values:
+                    slices.setdefault(item['@language'].lower(), {}).setdefault(key, []).append(item)
+            elif key in _localized_keys:
+                slices.setdefault(served_language.lower(), {})[key] = values
+            else:
+                base[key] = value
+        # The slice of the preferred language is complete even if empty. The other ones only contain the values
+        # missing from the preferred language
+        if languages:
+            slices.setdefault(languages[0], {})
+
+        with self._lock:
+            entity = self._entities.pop(iri, None)
+            if entity is None:
+                entity = _CachedEntity()
+            else:
+                self._size -= entity.size
+            entity.base.update(base)
+            for language, values in slices.items():
+                if languages and language == languages[0]:
+                    entity.slices[language] = values
+                else:
+                    entity.slices.setdefault(language, {}).update(values)
+            if languages:
+                entity.languages.add(languages[0])
+            entity.chains.add(languages)
+            entity.size = len(iri) + len(json.dumps(entity.base)) + len(json.dumps(entity.slices))
+            self._entities[iri] = entity
+            self._size += entity.size
+            while self._size > self._max_size and len(self._entities) > 1:
+                _, evicted = self._entities.popitem(last=False)
+                self._size -= evicted.size
+            return self._build(entity, languages)
+
+    @staticmethod
+    def _build(entity: _CachedEntity, languages: Sequence[str]) -> dict:
+        result = dict(entity.base)
+        # The values of the not requested languages are only used if the entity has no value in a requested one
+        for language in reversed(list(entity.slices.keys())):
+            if language not in languages:
+                result.update(entity.slices[language])
+        for language in reversed(languages):
+            result.update(entity.slices.get(language, {}))
+        for key, values in result.items():
+            if key not in entity.base:
+                result[key] = values[0] if len(values) == 1 else list(values)
+        return result
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses, 'entities': len(self._entities), 'size': self._size}
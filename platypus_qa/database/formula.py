@@ -19,8 +19,9 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 import logging
+from collections import Counter
 from copy import copy
-from functools import reduce
+from functools import reduce, lru_cache
 from itertools import chain, product
 from typing import Union, List, Iterable, FrozenSet, Generic, TypeVar, Optional, Callable, Any
 
@@ -221,13 +222,21 @@ class _AtomicType(Type):
     _set_owl_Nothing = frozenset((owl_Nothing,))
     _set_owl_Thing = frozenset((owl_Thing,))
     _set_rdfs_Literal = frozenset((rdfs_Literal,))
+    _instances = {}
 
-    def __init__(self, entity: Iterable[Iterable[Class]] = (), literal: Iterable[Iterable[Datatype]] = ()):
+    def __new__(cls, entity: Iterable[Iterable[Class]] = (), literal: Iterable[Iterable[Datatype]] = ()):
         """
-        Private constructor, use static factory methods
+        Private constructor, use static factory methods.
+        Types are interned: equal types are the same object.
         """
-        self._entity = self._simplify_class(entity)
-        self._literal = self._simplify_datatype(literal)
+        key = (cls._simplify_class(entity), cls._simplify_datatype(literal))
+        instance = cls._instances.get(key)
+        if instance is None:
+            instance = super(_AtomicType, cls).__new__(cls)
+            instance._entity, instance._literal = key
+            instance._hash = hash(key[0]) ^ hash(key[1])
+            instance = cls._instances.setdefault(key, instance)
+        return instance
 
     @staticmethod
     def _simplify_class(union: Iterable[Iterable[Class]]) -> FrozenSet[FrozenSet[Class]]:
@@ -281,20 +290,32 @@ class _AtomicType(Type):
 
     def __or__(self, other: Type) -> Type:
         if isinstance(other, _AtomicType):
-            return _AtomicType(chain(self._entity, other._entity), chain(self._literal, other._literal))
+            return _AtomicType._join(self, other)
         else:
             return other.__or__(self)
 
     def __and__(self, other: Type) -> Type:
         if isinstance(other, _AtomicType):
-            return _AtomicType(
-                [chain(*t) for t in product(self._entity, other._entity)],
-                [chain(*t) for t in product(self._literal, other._literal)]
-            )
+            return _AtomicType._meet(self, other)
         else:
             return other.__and__(self)
 
+    @staticmethod
+    @lru_cache(maxsize=8192)
+    def _join(left: '_AtomicType', right: '_AtomicType') -> '_AtomicType':
+        return _AtomicType(chain(left._entity, right._entity), chain(left._literal, right._literal))
+
+    @staticmethod
+    @lru_cache(maxsize=8192)
+    def _meet(left: '_AtomicType', right: '_AtomicType') -> '_AtomicType':
+        return _AtomicType(
+            [chain(*t) for t in product(left._entity, right._entity)],
+            [chain(*t) for t in product(left._literal, right._literal)]
+        )
+
     def __eq__(self, other):
+        if self is other:
+            return True
         other = self._to_type(other)
         if isinstance(other, _AtomicType):
             return self._entity == other._entity and self._literal == other._literal
@@ -332,7 +353,10 @@ class _AtomicType(Type):
         ))
 
     def __hash__(self) -> int:
-        return hash(self._entity) ^ hash(self._literal)
+        return self._hash
+
+    def __reduce__(self):
+        return _AtomicType, (self._entity, self._literal)
 
 
 _literal_type = Type.from_entity(rdfs_Literal)
@@ -367,7 +391,44 @@ class _TypeForVariables(dict):
         return '\n'.join('T({}) = {}'.format(k, v) for k, v in self.items())
 
 
+def _cached(attribute: str):
+    """
+    Caches the result of a method without arguments into attribute.
+    Terms are immutable so it is computed only once.
+    """
+
+    def decorator(function):
+        def wrapper(self):
+            try:
+                return getattr(self, attribute)
+            except AttributeError:
+                value = function(self)
+                setattr(self, attribute, value)
+                return value
+
+        return wrapper
+
+    return decorator
+
+
+def _fast_equality(function):
+    """
+    Decorator for __eq__ avoiding the structural comparison when the terms are the same or have different hashes
+    """
+
+    def wrapper(self, other) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, Term) or hash(self) != hash(other):
+            return False
+        return function(self, other)
+
+    return wrapper
+
+
 class Term:
+    __slots__ = ('_cached_hash', '_cached_type', '_cached_score', '_cached_variables_types')
+
     @property
     def type(self) -> Type:
         raise NotImplementedError('Term.type is not implemented')
@@ -418,6 +479,8 @@ class Term:
 
 
 class Formula(Term):
+    __slots__ = ()
+
     def __bool__(self) -> bool:
         return True  # Currently the only false formula is the formula "⊥"
 
@@ -464,6 +527,8 @@ class Formula(Term):
 
 
 class VariableFormula(Formula):
+    __slots__ = ('name',)
+
     def __init__(self, name: str):
         self.name = name
 
@@ -492,6 +557,8 @@ class VariableFormula(Formula):
 
 
 class ValueFormula(Formula):
+    __slots__ = ('term', '_original_str')
+
     def __init__(self, term: Union[Entity, Literal], original_str: Optional[str] = None):
         self.term = term
         self._original_str = original_str
@@ -500,6 +567,7 @@ class ValueFormula(Formula):
         return self
 
     @property
+    @_cached('_cached_type')
     def type(self) -> Type:
         if isinstance(self.term, Entity):
             return reduce(lambda a, b: a & b, (Type.from_entity(type_) for type_ in self.term.types))
@@ -509,6 +577,7 @@ class ValueFormula(Formula):
             raise ValueError('Unexpected term in ValueFormula: {}'.format(self.term))
 
     @property
+    @_cached('_cached_score')
     def score(self) -> int:
         if isinstance(self.term, Entity):
             return self.term.score
@@ -528,6 +597,7 @@ class ValueFormula(Formula):
     def __eq__(self, other) -> bool:
         return isinstance(other, ValueFormula) and self.term == other.term
 
+    @_cached('_cached_hash')
     def __hash__(self) -> int:
         return hash(self.term)
 
@@ -537,6 +607,8 @@ false_formula = ValueFormula(XSDBooleanLiteral(False))
 
 
 class ZeroOrMorePathFormula(Formula):
+    __slots__ = ('path',)
+
     def __init__(self, path: Formula):
         self.path = path
 
@@ -544,10 +616,12 @@ class ZeroOrMorePathFormula(Formula):
         return ZeroOrMorePathFormula(self.path.substitute(var, formula))
 
     @property
+    @_cached('_cached_type')
     def type(self) -> Type:
         return _property_type  # TODO: improve?
 
     @property
+    @_cached('_cached_score')
     def score(self) -> int:
         return self.path.score
 
@@ -557,11 +631,14 @@ class ZeroOrMorePathFormula(Formula):
     def __eq__(self, other) -> bool:
         return isinstance(other, ValueFormula) and self.path == other.path
 
+    @_cached('_cached_hash')
     def __hash__(self) -> int:
         return 2 * hash(self.path)
 
 
 class BinaryArithmeticOperatorFormula(Formula):
+    __slots__ = ('left', 'right')
+
     def __init__(self, left: Formula, right: Formula):
         if left.type & _numeric_type == Type.bottom():
             raise ValueError('Arithmetic operators expects numeric left operand')
@@ -576,6 +653,7 @@ class BinaryArithmeticOperatorFormula(Formula):
             self.right.substitute(var, formula)
         )
 
+    @_cached('_cached_variables_types')
     def _variables_types(self) -> _TypeForVariables:
         # TODO: What if we uses these operators on other things than arithmetic values?
         result = self.left._variables_types() & self.right._variables_types()
@@ -586,10 +664,12 @@ class BinaryArithmeticOperatorFormula(Formula):
         return result
 
     @property
+    @_cached('_cached_type')
     def type(self) -> Type:
         return _numeric_type
 
     @property
+    @_cached('_cached_score')
     def score(self) -> int:
         return max(self.left.score, self.right.score)
 
@@ -598,45 +678,83 @@ class BinaryArithmeticOperatorFormula(Formula):
         self.left.explore(function)
         self.right.explore(function)
 
+    @_fast_equality
     def __eq__(self, other) -> bool:
         return isinstance(other, type(self)) and self.left == other.left and self.right == other.right
 
+    @_cached('_cached_hash')
     def __hash__(self) -> int:
         return hash(self.left) ^ hash(self.right)
 
 
 class SymmetricArithmeticBinaryOperatorFormula(BinaryArithmeticOperatorFormula):
+    __slots__ = ()
+
+    @_fast_equality
     def __eq__(self, other) -> bool:
         return isinstance(other, type(self)) and (self.left == other.left and self.right == other.right or
                                                   self.left == other.right and self.right == other.left)
 
+    @_cached('_cached_hash')
     def __hash__(self) -> int:
         return hash(self.left) ^ hash(self.right)
 
 
 class AddFormula(SymmetricArithmeticBinaryOperatorFormula):
+    __slots__ = ()
+
     def __str__(self):
         return '({} + {})'.format(self.left, self.right)
 
 
 class SubFormula(BinaryArithmeticOperatorFormula):
+    __slots__ = ()
+
     def __str__(self):
         return '({} - {})'.format(self.left, self.right)
 
 
 class MulFormula(SymmetricArithmeticBinaryOperatorFormula):
+    __slots__ = ()
+
     def __str__(self):
         return '({} * {})'.format(self.left, self.right)
 
 
 class DivFormula(BinaryArithmeticOperatorFormula):
+    __slots__ = ()
+
     def __str__(self):
         return '({} / {})'.format(self.left, self.right)
 
 
+_dnf_max_clauses = 64
+_dnf_statistics = Counter()
+
+
+def dnf_statistics() -> dict:
+    """
+    :return: the number of conjunctions moved to disjunctive normal form ("expanded") and of the ones kept factored
+    because their normal form would have more than _dnf_max_clauses clauses ("factored"). The counters are approximate
+    when formulas are built concurrently.
+    """
+    return dict(_dnf_statistics)
+
+
 class AndFormula(Formula):
+    __slots__ = ('args',)
+
     def __new__(cls, args: List[Formula]):
         # Moves to disjunctive normal form and filters True and False
+        # If the normal form would be too big, the disjunctions are kept factored
+        clauses_count = 1
+        for arg in args:
+            if isinstance(arg, OrFormula):
+                clauses_count *= len(arg.args)
+        if clauses_count > _dnf_max_clauses:
+            _dnf_statistics['factored'] += 1
+            return cls._new_factored(args)
+
         clauses = [[]]
         for arg in args:
             if arg == true_formula:
@@ -649,6 +767,7 @@ class AndFormula(Formula):
                 for clause in clauses:
                     clause.append(arg)
         if len(clauses) > 1:
+            _dnf_statistics['expanded'] += 1
             return OrFormula([AndFormula(clause) for clause in clauses])
 
         if len(clauses[0]) == 0:
@@ -658,6 +777,20 @@ class AndFormula(Formula):
         else:
             return super(AndFormula, cls).__new__(cls)
 
+    @classmethod
+    def _new_factored(cls, args: List[Formula]) -> Formula:
+        filtered_arguments = []
+        for arg in args:
+            if arg == true_formula:
+                continue
+            elif arg == false_formula:
+                return arg
+            else:
+                filtered_arguments.append(arg)
+        if len(filtered_arguments) == 1:
+            return filtered_arguments[0]
+        return super(AndFormula, cls).__new__(cls)
+
     def __init__(self, args: List[Formula]):
         # Flattening
         filtered_arguments = []
@@ -675,13 +808,16 @@ class AndFormula(Formula):
         return AndFormula([arg.substitute(var, formula) for arg in self.args])
 
     @property
+    @_cached('_cached_type')
     def type(self) -> Type:
         return _boolean_type
 
     @property
+    @_cached('_cached_score')
     def score(self) -> int:
         return max(arg.score for arg in self.args)
 
+    @_cached('_cached_variables_types')
     def _variables_types(self) -> _TypeForVariables:
         return reduce(lambda a, b: a & b, (arg._variables_types() for arg in self.args))
 
@@ -693,14 +829,18 @@ class AndFormula(Formula):
     def __str__(self):
         return '({})'.format(' ∧ '.join(str(arg) for arg in self.args))
 
+    @_fast_equality
     def __eq__(self, other) -> bool:
         return isinstance(other, AndFormula) and self.args == other.args
 
+    @_cached('_cached_hash')
     def __hash__(self) -> int:
         return hash(self.args) * 8
 
 
 class OrFormula(Formula):
+    __slots__ = ('args',)
+
     def __new__(cls, args: List[Formula]):
         # Lookup True and False
         filtered_arguments = []
@@ -736,13 +876,16 @@ class OrFormula(Formula):
         return OrFormula([arg.substitute(var, formula) for arg in self.args])
 
     @property
+    @_cached('_cached_type')
     def type(self) -> Type:
         return _boolean_type
 
     @property
+    @_cached('_cached_score')
     def score(self) -> int:
         return max(arg.score for arg in self.args)
 
+    @_cached('_cached_variables_types')
     def _variables_types(self) -> _TypeForVariables:
         return reduce(lambda a, b: a | b, (arg._variables_types() for arg in self.args))
 
@@ -754,14 +897,18 @@ class OrFormula(Formula):
     def __str__(self):
         return '({})'.format(' ∨ '.join(str(arg) for arg in self.args))
 
+    @_fast_equality
     def __eq__(self, other) -> bool:
         return isinstance(other, OrFormula) and self.args == other.args
 
+    @_cached('_cached_hash')
     def __hash__(self) -> int:
         return hash(self.args) * 8 + 3
 
 
 class NotFormula(Formula):
+    __slots__ = ('arg',)
+
     def __new__(cls, arg: Formula):
         if arg == true_formula:
             return false_formula
@@ -783,10 +930,12 @@ class NotFormula(Formula):
         return NotFormula(self.arg.substitute(var, formula))
 
     @property
+    @_cached('_cached_type')
     def type(self) -> Type:
         return _boolean_type
 
     @property
+    @_cached('_cached_score')
     def score(self) -> int:
         return self.arg.score
 
@@ -797,14 +946,18 @@ class NotFormula(Formula):
     def __str__(self):
         return '¬ {}'.format(str(self.arg))
 
+    @_fast_equality
     def __eq__(self, other) -> bool:
         return isinstance(other, NotFormula) and self.arg == other.arg
 
+    @_cached('_cached_hash')
     def __hash__(self) -> int:
         return - hash(self.arg)
 
 
 class EqualityFormula(Formula):
+    __slots__ = ('left', 'right')
+
     def __new__(cls, left: Formula, right: Formula):
         if left == right:
             return true_formula
@@ -824,13 +977,16 @@ class EqualityFormula(Formula):
         return EqualityFormula(self.left.substitute(var, formula), self.right.substitute(var, formula))
 
     @property
+    @_cached('_cached_type')
     def type(self) -> Type:
         return Type.from_entity(xsd_boolean)
 
     @property
+    @_cached('_cached_score')
     def score(self) -> int:
         return max(self.left.score, self.right.score)
 
+    @_cached('_cached_variables_types')
     def _variables_types(self) -> _TypeForVariables:
         result = self.left._variables_types() & self.right._variables_types()
         if isinstance(self.left, VariableFormula):
@@ -847,16 +1003,20 @@ class EqualityFormula(Formula):
     def __str__(self):
         return '[{} = {}]'.format(self.left, self.right)
 
+    @_fast_equality
     def __eq__(self, other) -> bool:
         return isinstance(other, EqualityFormula) and (
             (self.left == other.left and self.right == other.right) or
             (self.left == other.right and self.right == other.left))
 
+    @_cached('_cached_hash')
     def __hash__(self) -> int:
         return hash(self.left) ^ hash(self.right)
 
 
 class BinaryOrderOperatorFormula(Formula):
+    __slots__ = ('left', 'right')
+
     def __new__(cls, left: Formula, right: Formula):
         if cls._get_type_for_ordering(left) == Type.bottom() or cls._get_type_for_ordering(right) == Type.bottom():
             return false_formula  # No order
@@ -872,6 +1032,7 @@ class BinaryOrderOperatorFormula(Formula):
             self.right.substitute(var, formula)
         )
 
+    @_cached('_cached_variables_types')
     def _variables_types(self) -> _TypeForVariables:
         # Only literals has an order and they should be compatible (i.e. has the same broad type)
         result = self.left._variables_types() & self.right._variables_types()
@@ -894,10 +1055,12 @@ class BinaryOrderOperatorFormula(Formula):
         return result_type
 
     @property
+    @_cached('_cached_type')
     def type(self) -> Type:
         return _boolean_type
 
     @property
+    @_cached('_cached_score')
     def score(self) -> int:
         return max(self.left.score, self.right.score)
 
@@ -906,34 +1069,46 @@ class BinaryOrderOperatorFormula(Formula):
         self.left.explore(function)
         self.right.explore(function)
 
+    @_fast_equality
     def __eq__(self, other) -> bool:
         return isinstance(other, type(self)) and self.left == other.left and self.right == other.right
 
+    @_cached('_cached_hash')
     def __hash__(self) -> int:
         return hash(self.left) ^ hash(self.right)
 
 
 class GreaterFormula(BinaryOrderOperatorFormula):
+    __slots__ = ()
+
     def __str__(self):
         return '[{} > {}]'.format(self.left, self.right)
 
 
 class GreaterOrEqualFormula(BinaryOrderOperatorFormula):
+    __slots__ = ()
+
     def __str__(self):
         return '[{} ≥ {}]'.format(self.left, self.right)
 
 
 class LowerFormula(BinaryOrderOperatorFormula):
+    __slots__ = ()
+
     def __str__(self):
         return '[{} < {}]'.format(self.left, self.right)
 
 
 class LowerOrEqualFormula(BinaryOrderOperatorFormula):
+    __slots__ = ()
+
     def __str__(self):
         return '[{} ≤ {}]'.format(self.left, self.right)
 
 
 class ExistsFormula(Formula):
+    __slots__ = ('argument', 'body')
+
     def __new__(cls, argument: VariableFormula, body: Formula):
         if body == true_formula or body == false_formula:
             return body  # TODO: more general, if argument is not used in the body
@@ -973,13 +1148,16 @@ class ExistsFormula(Formula):
         return ExistsFormula(self.argument, self.body.substitute(var, formula))
 
     @property
+    @_cached('_cached_type')
     def type(self) -> Type:
         return _boolean_type
 
     @property
+    @_cached('_cached_score')
     def score(self) -> int:
         return self.body.score
 
+    @_cached('_cached_variables_types')
     def _variables_types(self) -> _TypeForVariables:
         body_types = copy(self.body._variables_types())
         del body_types[self.argument]  # shadowing
@@ -992,14 +1170,22 @@ class ExistsFormula(Formula):
     def __str__(self):
         return '∃ {} {}'.format(self.argument, self.body)
 
+    @_fast_equality
     def __eq__(self, other) -> bool:
-        return isinstance(other, ExistsFormula) and self.body == other.body.substitute(other.argument, self.argument)
+        if not isinstance(other, ExistsFormula):
+            return False
+        if self.argument == other.argument:
+            return self.body == other.body
+        return self.body == other.body.substitute(other.argument, self.argument)
 
+    @_cached('_cached_hash')
     def __hash__(self) -> int:
         return hash(self.body) * 8 + 5
 
 
 class TripleFormula(Formula):
+    __slots__ = ('subject', 'predicate', 'object')
+
     def __new__(cls, subject: Formula, predicate: Formula, _object: Formula):
         if subject.type <= _literal_type or predicate.type & _property_type == Type.bottom():
             return false_formula  # could not be true
@@ -1016,13 +1202,16 @@ class TripleFormula(Formula):
                              self.object.substitute(var, formula))
 
     @property
+    @_cached('_cached_type')
     def type(self) -> Type:
         return _boolean_type
 
     @property
+    @_cached('_cached_score')
     def score(self) -> int:
         return max(self.subject.score, self.object.score)
 
+    @_cached('_cached_variables_types')
     def _variables_types(self) -> _TypeForVariables:
         result = _TypeForVariables()
 
@@ -1051,15 +1240,19 @@ class TripleFormula(Formula):
     def __str__(self):
         return '<{}, {}, {}>'.format(self.subject, self.predicate, self.object)
 
+    @_fast_equality
     def __eq__(self, other) -> bool:
         return isinstance(other, TripleFormula) and self.subject == other.subject and \
                self.predicate == other.predicate and self.object == other.object
 
+    @_cached('_cached_hash')
     def __hash__(self) -> int:
         return hash(self.subject) ^ hash(self.predicate) ^ hash(self.object)
 
 
 class Tuple(Term):
+    __slots__ = ('_elements',)
+
     def __new__(cls, *elements):
         if len(elements) == 1:
             return elements[0]
@@ -1070,16 +1263,19 @@ class Tuple(Term):
         self._elements = elements
 
     @property
+    @_cached('_cached_type')
     def type(self) -> Type:
         return Type.tuple(*(e.type for e in self._elements))
 
     @property
+    @_cached('_cached_score')
     def score(self) -> int:
         return max(e.score for e in self._elements)
 
     def substitute(self, var: VariableFormula, formula: Formula) -> Term:
         return Tuple(*(e.substitute(var, formula) for e in self._elements))
 
+    @_cached('_cached_variables_types')
     def _variables_types(self) -> _TypeForVariables:
         return reduce(lambda a, b: a | b, (e._variables_types() for e in self._elements))
 
@@ -1091,11 +1287,13 @@ class Tuple(Term):
     def __str__(self) -> str:
         return '({})'.format(', '.join(str(e) for e in self._elements))
 
+    @_fast_equality
     def __eq__(self, other) -> bool:
         if not isinstance(other, Tuple):
             return False
         return self._elements == other._elements
 
+    @_cached('_cached_hash')
     def __hash__(self) -> int:
         return hash(self._elements)
 
@@ -1113,6 +1311,8 @@ T = TypeVar('T')
 
 
 class Select(Term, Generic[T]):
+    __slots__ = ('args', 'body')
+
     def __init__(self, args: Union[VariableFormula, Iterable[VariableFormula]], body: Formula):
         if isinstance(args, VariableFormula):
             self.args = args,
@@ -1130,9 +1330,11 @@ class Select(Term, Generic[T]):
         return Select(self.args, self.body.substitute(var, formula))
 
     @property
+    @_cached('_cached_score')
     def score(self) -> int:
         return self.body.score
 
+    @_cached('_cached_variables_types')
     def _variables_types(self) -> _TypeForVariables:
         body_types = copy(self.body._variables_types())
         for arg in self.args:
@@ -1144,6 +1346,7 @@ class Select(Term, Generic[T]):
         self.body.explore(function)
 
     @property
+    @_cached('_cached_type')
     def type(self) -> Type:
         body_types = self.body._variables_types()
         return Type.tuple(*(body_types[arg] for arg in self.args))
@@ -1169,11 +1372,14 @@ class Select(Term, Generic[T]):
     def __bool__(self) -> bool:
         return bool(self.body)
 
+    @_fast_equality
     def __eq__(self, other) -> bool:
         if not isinstance(other, Select):
             return False
         if len(self.args) != len(other.args):
             return False
+        if self.args == other.args:
+            return self.body == other.body
         normalize_body = other.body
         for i in range(len(self.args)):
             normalize_body = normalize_body.substitute(other.args[i], self.args[i])
@@ -1188,6 +1394,7 @@ class Select(Term, Generic[T]):
         """
         return Select([self.args[key]], self.body)
 
+    @_cached('_cached_hash')
     def __hash__(self) -> int:
         return hash(self.body) * 8 + 4
 
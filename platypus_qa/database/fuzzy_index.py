@@ -0,0 +1,69 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from typing import Iterable, Dict
+
+import editdistance
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree allowing to retrieve all the strings at a given Levenshtein distance of a string without
+    computing the distance to all the indexed strings.
+    """
+
+    def __init__(self, words: Iterable[str] = ()):
+        self._root = None
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str):
+        # Nodes are [word, {distance: child node}]
+        if self._root is None:
+            self._root = [word, {}]
+            return
+        node = self._root
+        while True:
+            distance = editdistance.eval(word, node[0])
+            if distance == 0:
+                return
+            if distance not in node[1]:
+                node[1][distance] = [word, {}]
+                return
+            node = node[1][distance]
+
+    def search(self, word: str, max_distance: int) -> Dict[str, int]:
+        """
+        :return: the indexed strings with a distance to word lower or equal to max_distance with their distances
+        """
+        results = {}
+        if self._root is None:
+            return results
+        to_visit = [self._root]
+        while to_visit:
+            node = to_visit.pop()
+            distance = editdistance.eval(word, node[0])
+            if distance <= max_distance:
+                results[node[0]] = distance
+            # By triangular inequality, the matching strings are only in children with these distances
+            for child_distance, child in node[1].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    to_visit.append(child)
+        return results
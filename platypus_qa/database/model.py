@@ -17,13 +17,15 @@ GNU Affero General Public License for more details.
 You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
+import logging
 from itertools import chain
-from typing import List, Union, Iterable, Optional, Tuple
+from typing import List, Union, Iterable, Optional, Tuple, Sequence
 
 from platypus_qa.database.formula import Term, Select, Tuple, VariableFormula, TripleFormula, AndFormula, OrFormula, \
     ExistsFormula, EqualityFormula
 from platypus_qa.database.owl import Literal, Class, owl_Thing, Entity, Property
 
+_logger = logging.getLogger('model')
 
 class QAInterpretationResult:
     def __init__(self, result: Union[Entity, Literal],
@@ -48,9 +50,26 @@ class EvaluationError(Exception):
 
 
 class KnowledgeBase:
-    def individuals_from_label(self, label: str, language_code: str, type_filter: Class = owl_Thing) -> List[Select]:
+    def individuals_from_label(self, label: str, language_code: str, type_filter: Class = owl_Thing,
+                               limit: Optional[int] = None) -> List[Select]:
+        """
+        :param limit: maximal number of individuals to return, the most relevant ones being kept
+        """
         raise NotImplementedError("KnowledgeBase.individuals_from_label is not implemented")
 
+    def individuals_count(self, label: str, language_code: str, type_filter: Class = owl_Thing) -> Optional[int]:
+        """
+        :return: the number of individuals individuals_from_label returns without limit or None if it is not known
+        """
+        return None
+
+    def individuals_limits(self) -> Sequence[Optional[int]]:
+        """
+        :return: the successive limits to use with individuals_from_label. If the analysis with a limit does not find
+        any answer and some individuals have been dropped, it is retried with the next one. None means no limit.
+        """
+        return None,
+
     def relations_from_label(self, label: str, language_code: str) -> List[Select]:
         """
         :return: functions λ s . λ o . X where s is the subject and o the object of the relation
@@ -83,6 +102,20 @@ class KnowledgeBase:
         results = self.evaluate_term(self._add_context_variables(term))
         return QAInterpretation(term, [self._tuple_to_result(result) for result in results])
 
+    def build_interpretations(self, terms: Iterable[Term]) -> List[QAInterpretation]:
+        """
+        Builds the interpretations of several terms, keeping the order of terms.
+        Terms that fail to evaluate are skipped.
+        Knowledge bases able to evaluate multiple terms at once should override it.
+        """
+        interpretations = []
+        for term in terms:
+            try:
+                interpretations.append(self.build_interpretation(term))
+            except EvaluationError as e:
+                _logger.warning(e)
+        return interpretations
+
     @staticmethod
     def _add_context_variables(term: Term) -> Term:
         if not isinstance(term, Select):
@@ -148,5 +181,21 @@ class KnowledgeBase:
         """
         raise NotImplementedError("KnowledgeBase.format_resource is not implemented")
 
+    def format_all_to_jsonld(self, results: Iterable[QAInterpretationResult],
+                             accept_language: str) -> List[Optional[dict]]:
+        """
+        Formats several results, keeping the order of results.
+        Knowledge bases able to format multiple results at once should override it.
+        :return: the formatted results, None for the ones that could not be formatted
+        """
+        formatted_results = []
+        for result in results:
+            try:
+                formatted_results.append(self.format_to_jsonld(result, accept_language))
+            except FormatterError as e:
+                _logger.warning(e)
+                formatted_results.append(None)
+        return formatted_results
+
     def get_label(self, entity: Entity, accept_language: str) -> Optional[str]:
         raise NotImplementedError("KnowledgeBase.get_label is not implemented")
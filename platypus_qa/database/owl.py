@@ -22,6 +22,7 @@ import json
 import re
 from datetime import datetime, timezone, timedelta, date, time
 from decimal import Decimal
+from itertools import chain
 from typing import Sequence, Union, Optional
 
 from pygeoif import geometry
@@ -60,6 +61,7 @@ class Entity:
 
 
 rdfs_Class = None  # Forward declaration
+_owl_Nothing_iri = 'http://www.w3.org/2002/07/owl#Nothing'
 
 
 class Class(Entity):
@@ -69,12 +71,12 @@ class Class(Entity):
         else:
             super().__init__(iri, (rdfs_Class,))
         self._subclass_of = subclass_of
+        # IRIs of the class and of all its super classes
+        self._superclasses_iris = frozenset(chain((iri,), *(super_class._superclasses_iris
+                                                             for super_class in subclass_of)))
 
     def is_subclass_of(self, other: 'Class') -> bool:
-        if self == owl_Nothing:
-            return True
-
-        return self == other or any(super_dt.is_subclass_of(other) for super_dt in self._subclass_of)
+        return other.iri in self._superclasses_iris or _owl_Nothing_iri in self._superclasses_iris
 
 
 rdfs_Class = Class('http://www.w3.org/2000/01/rdf-schema#Class', ())  # Should be the first Class instance created!
@@ -98,9 +100,11 @@ class Datatype(Entity):
     def __init__(self, iri: str, restriction_of: Sequence['Datatype']):
         super().__init__(iri, (rdfs_Datatype,))
         self._restriction_of = restriction_of
+        # IRIs of the datatype and of all the datatypes it is a restriction of
+        self._restricted_iris = frozenset(chain((iri,), *(super_dt._restricted_iris for super_dt in restriction_of)))
 
     def is_restriction_of(self, other: 'Datatype') -> bool:
-        return self == other or any(super_dt.is_restriction_of(other) for super_dt in self._restriction_of)
+        return other.iri in self._restricted_iris
 
 
 rdfs_Literal = Datatype('http://www.w3.org/2000/01/rdf-schema#Literal', ())
@@ -18,26 +18,39 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import gzip
+import hashlib
+import heapq
+import json
 import logging
+import threading
 import urllib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 from json import JSONDecodeError
-from typing import Dict, List, Union, Optional, Tuple, Iterable
+from types import MappingProxyType
+from typing import Dict, List, Union, Optional, Tuple, Iterable, Callable, Sequence
 
-import editdistance
 import requests
 from pygeoif import Point
+from requests.adapters import HTTPAdapter
 
+from platypus_qa.cache import DictCache, DummyDictCache, SingleFlightCache
+from platypus_qa.database.entity_cache import EntityCache, language_chain
+from platypus_qa.database.fuzzy_index import BKTree
 from platypus_qa.database.formula import Term, Select, AndFormula, OrFormula, EqualityFormula, TripleFormula, \
     VariableFormula, Formula, ExistsFormula, ValueFormula, NotFormula, AddFormula, SubFormula, MulFormula, DivFormula, \
     GreaterFormula, GreaterOrEqualFormula, LowerOrEqualFormula, LowerFormula, BinaryOrderOperatorFormula, \
     BinaryArithmeticOperatorFormula, Type, ZeroOrMorePathFormula
-from platypus_qa.database.model import KnowledgeBase, FormatterError, QAInterpretationResult, EvaluationError
+from platypus_qa.database.model import KnowledgeBase, FormatterError, QAInterpretationResult, EvaluationError, \
+    QAInterpretation
 from platypus_qa.database.owl import NamedIndividual, DatatypeProperty, ObjectProperty, owl_Thing, Class, Literal, \
     XSDBooleanLiteral, XSDAnyURILiteral, XSDDateTimeLiteral, xsd_integer, Datatype, Property, XSDDateLiteral, \
     XSDGYearLiteral, XSDGYearMonthLiteral, build_literal, geo_wktLiteral, xsd_string, rdf_langString, \
     xsd_decimal, Entity, xsd_dateTime, rdf_Property, owl_NamedIndividual, xsd_anyURI, xsd_double, xsd_boolean, \
     GeoWKTLiteral, RDFLangStringLiteral
+from platypus_qa.deadline import request_timeout, current_deadline
 
 _logger = logging.getLogger('wikidata')
 
@@ -98,13 +111,15 @@ class _WikidataQuerySparqlBuilder:
         if isinstance(term, Select):
             clauses = self._build_internal(term.body).replace('\n', '\n\t')
 
+            projection = ' '.join(str(arg) for arg in term.args)
             suffix = ' LIMIT 100'
             if do_ranking and term.type[0] & Type.from_entity(owl_Thing) != Type.bottom():
                 clauses += '\n\tOPTIONAL { ' + str(term.args[0]) + ' wikibase:sitelinks ?sitelinksCount . }'
+                # Projected in order to keep the ranking when the query is a branch of a batch
+                projection += ' ?sitelinksCount'
                 suffix = ' ORDER BY DESC(?sitelinksCount) LIMIT 100'
 
-            return 'SELECT DISTINCT {} WHERE {{\n\t{}\n}}{}'.format(
-                ' '.join(str(arg) for arg in term.args), clauses, suffix)
+            return 'SELECT DISTINCT {} WHERE {{\n\t{}\n}}{}'.format(projection, clauses, suffix)
 
         if isinstance(term, Formula):
             if term.type <= Type.from_entity(xsd_boolean):
@@ -112,8 +127,36 @@ class _WikidataQuerySparqlBuilder:
 
         raise EvaluationError('Root term not supported by SPARQL builder {}'.format(term))
 
+    def build_batch(self, terms: List[Select], discriminator: VariableFormula, do_ranking=True) -> str:
+        """
+        Builds a single query evaluating all the terms.
+        Each term is evaluated in its own sub-query and its results are tagged by its position in terms using the
+        discriminator variable. The results are sorted by term and keep the ranking of the sub-queries: the order of
+        the sub-queries results is not kept by the enclosing query.
+        """
+        for term in terms:
+            if not isinstance(term, Select):
+                raise EvaluationError('Only Select terms could be evaluated in batch: {}'.format(term))
+        return self.build_batch_from_queries([self.build(term, do_ranking) for term in terms], discriminator)
+
+    @staticmethod
+    def build_batch_from_queries(queries: List[str], discriminator: VariableFormula) -> str:
+        """
+        Same as build_batch with the queries already built for each term.
+        """
+        branches = []
+        for i, query in enumerate(queries):
+            branches.append('{{\n\t{{\n\t\t{}\n\t}}\n\tBIND({} AS {})\n}}'.format(
+                query.replace('\n', '\n\t\t'), i, discriminator))
+        return 'SELECT * WHERE {{\n\t{}\n}} ORDER BY {} DESC(?sitelinksCount)'.format(
+            ' UNION '.join(branches).replace('\n', '\n\t'), discriminator)
+
     def _build_internal(self, term: Term) -> str:
         if isinstance(term, OrFormula):
+            values_variable = self._values_variable(term)
+            if values_variable is not None:
+                return 'VALUES {} {{ {} }}'.format(values_variable, ' '.join(sorted(
+                    self._serialize_rdf_term(self._value_of_equality(child).term) for child in term.args)))
             return '{{\n\t{}\n}}'.format('\n} UNION {\n\t'.join(
                 sorted(self._build_internal(child).replace('\n', '\n\t') for child in term.args))
             )
@@ -142,6 +185,27 @@ class _WikidataQuerySparqlBuilder:
         else:
             raise EvaluationError('Term not supported by SPARQL builder {}'.format(term))
 
+    @staticmethod
+    def _values_variable(term: OrFormula) -> Optional[VariableFormula]:
+        """
+        :return: the variable if term is a disjunction of equalities between the same variable and values
+        """
+        variables = set()
+        for child in term.args:
+            if not isinstance(child, EqualityFormula):
+                return None
+            if isinstance(child.left, VariableFormula) and isinstance(child.right, ValueFormula):
+                variables.add(child.left)
+            elif isinstance(child.right, VariableFormula) and isinstance(child.left, ValueFormula):
+                variables.add(child.right)
+            else:
+                return None
+        return variables.pop() if len(variables) == 1 else None
+
+    @staticmethod
+    def _value_of_equality(term: EqualityFormula) -> ValueFormula:
+        return term.right if isinstance(term.right, ValueFormula) else term.left
+
     def _serialize_triple_argument(self, value: Formula) -> str:
         if isinstance(value, ValueFormula):
             return self._serialize_rdf_term(value.term)
@@ -280,6 +344,7 @@ _wikidata_to_schema = {
 
 _s = VariableFormula('s')
 _o = VariableFormula('o')
+_batch_discriminator = VariableFormula('platypusBatchBranch')
 
 
 def _relation_for_property(property: Property):
@@ -359,63 +424,199 @@ _type_relations = [
 ]
 
 
+_vocabulary_format_version = 1
+
+
+class _LanguageVocabulary:
+    def __init__(self, relations_for_label: Dict[str, List[Select]], label_for_iri: Dict[str, str]):
+        self.relations_for_label = MappingProxyType(relations_for_label)
+        self.label_for_iri = MappingProxyType(label_for_iri)
+        self.label_index = BKTree(relations_for_label.keys())
+
+
+class _RelationsVocabulary:
+    """
+    Process-wide registry of the relations vocabulary loading each language at most once.
+    The loaded values are never modified so that they could be shared with forked workers using copy-on-write.
+    """
+
+    def __init__(self):
+        self._languages = {}
+        self._language_locks = {}
+        self._property_for_iri = {}
+        self._lock = threading.Lock()
+        self.property_for_iri = MappingProxyType(self._property_for_iri)
+
+    def get(self, language_code: str, loader: Callable[[], _LanguageVocabulary]) -> _LanguageVocabulary:
+        """
+        :param loader: builds the vocabulary of the language if it is not loaded yet.
+        """
+        vocabulary = self._languages.get(language_code)
+        if vocabulary is not None:
+            return vocabulary
+        with self._lock:
+            language_lock = self._language_locks.setdefault(language_code, threading.Lock())
+        with language_lock:
+            vocabulary = self._languages.get(language_code)
+            if vocabulary is None:
+                vocabulary = loader()
+                self._languages[language_code] = vocabulary
+            return vocabulary
+
+    def get_loaded(self, language_code: str) -> Optional[_LanguageVocabulary]:
+        return self._languages.get(language_code)
+
+    def add_property(self, prop: Property) -> Property:
+        with self._lock:
+            return self._property_for_iri.setdefault(prop.iri, prop)
+
+
 class WikidataKnowledgeBase(KnowledgeBase):
     _sparql_builder = _WikidataQuerySparqlBuilder()
-    _relations_for_label = {}
-    _property_for_iri = {}
-    _label_for_iri = {}
+    _vocabulary = _RelationsVocabulary()
 
     def __init__(self, kb_wikidata_uri: str, wikidata_sparql_endpoint_uri: str = 'https://query.wikidata.org/sparql',
-                 compacted_individuals=False, preload_languages: Iterable[str] = ()):
+                 compacted_individuals=False, preload_languages: Iterable[str] = (), sparql_batch_size: int = 16,
+                 sparql_cache: DictCache = DummyDictCache(), vocabulary_file: Optional[str] = None,
+                 entity_fetch_concurrency: int = 8, entity_cache: Optional[EntityCache] = None,
+                 individuals_negative_ttl: float = 60, entity_search_limit: int = 1000,
+                 individuals_limits: Sequence[int] = (), sparql_concurrency: int = 4,
+                 individuals_cache: Optional[SingleFlightCache] = None):
+        """
+        :param sparql_batch_size: maximal number of terms evaluated by a single SPARQL query.
+        :param sparql_concurrency: maximal number of batched SPARQL queries of the same request evaluated at the same
+        time.
+        :param sparql_cache: cache of SPARQL results shared between processes.
+        :param vocabulary_file: relations vocabulary file created by save_vocabulary to load instead of querying
+        Wikidata. The languages of preload_languages missing from it are still loaded from Wikidata.
+        :param entity_fetch_concurrency: maximal number of entities fetched at the same time from the KB service
+        when formatting results.
+        :param entity_cache: cache of the entities representations. It could be shared between knowledge bases using
+        the same KB service.
+        :param individuals_negative_ttl: time in seconds during which labels without individuals are cached. Only
+        used if individuals_cache is not set.
+        :param individuals_cache: cache of the individuals matching a label. It could be shared between knowledge
+        bases using the same entity search.
+        :param entity_search_limit: maximal number of individuals retrieved for a label.
+        :param individuals_limits: increasing numbers of individuals with the most sitelinks considered for a label
+        before considering all of them. An analysis is only retried with more individuals if it finds no answer.
+        """
         self._kb_wikidata_uri = kb_wikidata_uri
         self._wikidata_sparql_endpoint_ui = wikidata_sparql_endpoint_uri
         self._request_session_sparql = requests.Session()
         self._request_session_kb = requests.Session()
+        sparql_concurrency = max(1, sparql_concurrency)
+        sparql_adapter = HTTPAdapter(pool_maxsize=max(sparql_concurrency, 10))
+        self._request_session_sparql.mount('http://', sparql_adapter)
+        self._request_session_sparql.mount('https://', sparql_adapter)
+        self._sparql_executor = ThreadPoolExecutor(max_workers=sparql_concurrency)
+        entity_fetch_concurrency = max(1, entity_fetch_concurrency)
+        # The connection pool should be large enough to allow all the fetches to reuse their connections
+        kb_adapter = HTTPAdapter(pool_maxsize=max(entity_fetch_concurrency, 10))
+        self._request_session_kb.mount('http://', kb_adapter)
+        self._request_session_kb.mount('https://', kb_adapter)
+        self._entity_fetch_executor = ThreadPoolExecutor(max_workers=entity_fetch_concurrency)
+        self._entity_cache = entity_cache if entity_cache is not None else EntityCache()
+        self._individuals_cache = individuals_cache if individuals_cache is not None \
+            else SingleFlightCache(negative_ttl=individuals_negative_ttl)
+        # (label, language, type filter, limit) -> (individuals, terms built from them) for the most recent labels
+        self._individuals_terms = OrderedDict()
+        self._individuals_terms_max_size = 1024
+        self._individuals_terms_lock = threading.Lock()
+        self._entity_search_limit = entity_search_limit
+        self._individuals_limits = tuple(limit for limit in sorted(individuals_limits)
+                                         if limit < entity_search_limit) + (None,)
         self._compacted_individuals = compacted_individuals
+        self._sparql_batch_size = max(1, sparql_batch_size)
+        self._sparql_cache = sparql_cache
 
+        if vocabulary_file is not None:
+            self.load_vocabulary(vocabulary_file)
         for language_code in preload_languages:
-            self._fill_relations_for_label(language_code)
+            self._language_vocabulary(language_code)
 
-
-    @lru_cache(maxsize=8192)
-    def individuals_from_label(self, label: str, language_code: str, type_filter: Class = owl_Thing) -> List[Select]:
-        type_filter = type_filter.iri if type_filter != owl_Thing else None
-        results = self._execute_entity_search(label, language_code, type_filter)
+    def individuals_from_label(self, label: str, language_code: str, type_filter: Class = owl_Thing,
+                               limit: Optional[int] = None) -> List[Select]:
+        items = self._individuals(label, language_code, type_filter)
+        if not items:
+            return []
+        key = (label, language_code, type_filter.iri, limit)
+        with self._individuals_terms_lock:
+            cached = self._individuals_terms.get(key)
+            # The terms are rebuilt if the individuals have been searched again
+            if cached is not None and cached[0] is items:
+                self._individuals_terms.move_to_end(key)
+                return list(cached[1])
+        if limit is not None and len(items) > limit:
+            # Only the individuals with the most sitelinks are kept
+            items_to_build = heapq.nsmallest(limit, items, key=lambda item: -item.score)
+        else:
+            items_to_build = items
+        terms = self._build_individuals_terms(label, items_to_build)
+        with self._individuals_terms_lock:
+            self._individuals_terms[key] = (items, terms)
+            self._individuals_terms.move_to_end(key)
+            while len(self._individuals_terms) > self._individuals_terms_max_size:
+                self._individuals_terms.popitem(last=False)
+        return list(terms)
+
+    def _build_individuals_terms(self, label: str, items: List[_WikidataItem]) -> List[Select]:
         var = self._variable_for_name(label)
         if self._compacted_individuals:
-            if not results:
-                return []
-            return [Select(var, OrFormula(
-                [EqualityFormula(var, ValueFormula(_WikidataItem(result), label)) for result in results]))]
+            return [Select(var, OrFormula([EqualityFormula(var, ValueFormula(item, label)) for item in items]))]
         else:
-            return [Select(var, EqualityFormula(var, ValueFormula(_WikidataItem(result), label))) for result in
-                    results]
+            return [Select(var, EqualityFormula(var, ValueFormula(item, label))) for item in items]
+
+    def individuals_count(self, label: str, language_code: str, type_filter: Class = owl_Thing) -> Optional[int]:
+        return len(self._individuals(label, language_code, type_filter))
+
+    def individuals_limits(self) -> Sequence[Optional[int]]:
+        return self._individuals_limits
+
+    def _individuals(self, label: str, language_code: str, type_filter: Class) -> List[_WikidataItem]:
+        """
+        :return: the individuals matching the label in the order of the search service
+        """
+        type_filter = type_filter.iri if type_filter != owl_Thing else None
+        try:
+            return self._individuals_cache.get((label, language_code, type_filter),
+                                               lambda: self._search_individuals(label, language_code, type_filter))
+        except EvaluationError as e:
+            _logger.warning(e)
+            return []
+
+    def _search_individuals(self, label: str, language_code: str, type_filter: Optional[str]) -> List[_WikidataItem]:
+        return [_WikidataItem(result) for result in self._execute_entity_search(label, language_code, type_filter)]
 
     @lru_cache(maxsize=8192)
     def relations_from_labels(self, labels: Iterable[str], language_code: str) -> List[Select]:
-        if language_code not in self._relations_for_label:
-            self._fill_relations_for_label(language_code)
+        vocabulary = self._language_vocabulary(language_code)
 
         labels = [label.strip().lower() for label in labels]
-        for distance in range(0, 3):
+        relations_by_distance = [set(), set(), set()]
+        for label in labels:
+            if not label:
+                continue
             # we do not want to be fuzzy with too small labels
-            labels_to_match = [l for l in labels if len(l) >= 3 * distance + 1]
-            relations = self._relations_by_edit_distance(labels_to_match, language_code, distance)
+            max_distance = min((len(label) - 1) // 3, len(relations_by_distance) - 1)
+            for ref_label, distance in vocabulary.label_index.search(label, max_distance).items():
+                relations_by_distance[distance].update(vocabulary.relations_for_label[ref_label])
+        for relations in relations_by_distance:
             if relations:
                 return list(relations)
         return []
 
-    def _relations_by_edit_distance(self, input_labels: List[str], language_code: str, distance: int):
-        results = set()
-        for ref_label, properties in self._relations_for_label[language_code].items():
-            for input_label in input_labels:
-                dist = editdistance.eval(input_label, ref_label)
-                if dist == distance:
-                    results.update(properties)
-        return results
+    def _language_vocabulary(self, language_code: str) -> _LanguageVocabulary:
+        return self._vocabulary.get(language_code, lambda: self._load_language_vocabulary(language_code))
 
-    def _fill_relations_for_label(self, language_code: str):
+    def _load_language_vocabulary(self, language_code: str) -> _LanguageVocabulary:
         _logger.info('Loading Wikidata relations for {}'.format(language_code))
+        return self._build_language_vocabulary(language_code, self._fetch_relations_rows(language_code))
+
+    def _fetch_relations_rows(self, language_code: str) -> List[list]:
+        """
+        :return: the relations of a language as [property IRI, property type, property label, labels] lists
+        """
         results = self._execute_sparql_query(
             'SELECT ?directProperty ?propertyType ?label ?propertyLabel { ' +
             '?property wikibase:directClaim ?directProperty ; wikibase:propertyType ?propertyType . ' +
@@ -423,39 +624,72 @@ class WikidataKnowledgeBase(KnowledgeBase):
             'FILTER(LANG(?label) = "' + language_code + '" && ?propertyType != wikibase:WikibaseProperty) ' +
             'SERVICE wikibase:label { bd:serviceParam wikibase:language "' + language_code + '". } }'
         )
-        mapping = {}
-        relations = {}
-        labels = {}
+        rows = {}
         if 'results' in results and 'bindings' in results['results']:
             for result in results['results']['bindings']:
                 property_iri = result['directProperty']['value']
-                property_type = result['propertyType']['value']
-                label = result['label']['value'].lower()
-                labels[property_iri] = result['propertyLabel']['value']
-                if property_iri not in relations:
-                    if property_iri not in self._property_for_iri:
-                        if property_type not in _wikibase_property_types:
-                            _logger.warning('Unknown property type: {}'.format(property_type))
-                            continue
-                        else:
-                            property_type = _wikibase_property_types[property_type]
-                            if isinstance(property_type, Class):
-                                self._property_for_iri[property_iri] = \
-                                    ObjectProperty(property_iri, owl_NamedIndividual, property_type)
-                            elif isinstance(property_type, Datatype):
-                                self._property_for_iri[property_iri] = \
-                                    DatatypeProperty(property_iri, owl_NamedIndividual, property_type)
-                            else:
-                                raise EvaluationError('Unexpected range: {}'.format(property_type))
-                    relations[property_iri] = _relation_for_property(self._property_for_iri[property_iri])
+                if property_iri not in rows:
+                    rows[property_iri] = [property_iri, result['propertyType']['value'], None, []]
+                rows[property_iri][2] = result['propertyLabel']['value']
+                rows[property_iri][3].append(result['label']['value'])
+        return list(rows.values())
+
+    def _build_language_vocabulary(self, language_code: str, rows: Iterable[list]) -> _LanguageVocabulary:
+        mapping = {}
+        labels = {}
+        for property_iri, property_type, property_label, property_labels in rows:
+            labels[property_iri] = property_label
+            prop = self._vocabulary.property_for_iri.get(property_iri)
+            if prop is None:
+                if property_type not in _wikibase_property_types:
+                    _logger.warning('Unknown property type: {}'.format(property_type))
+                    continue
+                else:
+                    property_type = _wikibase_property_types[property_type]
+                    if isinstance(property_type, Class):
+                        prop = ObjectProperty(property_iri, owl_NamedIndividual, property_type)
+                    elif isinstance(property_type, Datatype):
+                        prop = DatatypeProperty(property_iri, owl_NamedIndividual, property_type)
+                    else:
+                        raise EvaluationError('Unexpected range: {}'.format(property_type))
+                    prop = self._vocabulary.add_property(prop)
+            relation = _relation_for_property(prop)
+            for label in property_labels:
                 lower_label = label.lower()
                 if lower_label not in mapping:
                     mapping[lower_label] = []
-                mapping[lower_label].append(relations[property_iri])
+                mapping[lower_label].append(relation)
         for label, relation in _hadcoded_relations.get(language_code, {}).items():
             mapping[label] = [relation]
-        self._relations_for_label[language_code] = mapping
-        self._label_for_iri[language_code] = labels
+        return _LanguageVocabulary(mapping, labels)
+
+    def save_vocabulary(self, file_name: str, language_codes: Iterable[str]):
+        """
+        Fetches the relations vocabulary of the given languages from Wikidata and stores it in a gzipped JSON file
+        that could be loaded later using the vocabulary_file parameter of the constructor.
+        """
+        snapshot = {
+            'version': _vocabulary_format_version,
+            'languages': {language_code: self._fetch_relations_rows(language_code)
+                          for language_code in language_codes}
+        }
+        with gzip.open(file_name, 'wt', encoding='utf-8') as fp:
+            json.dump(snapshot, fp, ensure_ascii=False, separators=(',', ':'))
+
+    def load_vocabulary(self, file_name: str):
+        """
+        Loads the relations vocabulary stored by save_vocabulary. Languages already loaded are not reloaded.
+        """
+        with gzip.open(file_name, 'rt', encoding='utf-8') as fp:
+            snapshot = json.load(fp)
+        if snapshot.get('version') != _vocabulary_format_version:
+            raise ValueError('Unsupported vocabulary file version: {}'.format(snapshot.get('version')))
+        for language_code, rows in snapshot['languages'].items():
+            def load(language_code=language_code, rows=rows):
+                _logger.info('Loading Wikidata relations for {} from {}'.format(language_code, file_name))
+                return self._build_language_vocabulary(language_code, rows)
+
+            self._vocabulary.get(language_code, load)
 
     def type_relations(self) -> List[Select]:
         return _type_relations
@@ -465,15 +699,19 @@ class WikidataKnowledgeBase(KnowledgeBase):
         return VariableFormula(''.join([c for c in name if c.isalnum()]))
 
     def _execute_entity_search(self, label: str, language_code: str, type_filter: Optional[str]):
-        params = {'q': label, 'lang': language_code, 'limit': 1000}  # TODO: configure limit?
+        params = {'q': label, 'lang': language_code, 'limit': self._entity_search_limit}
         if type_filter is not None:
             params['type'] = type_filter
-        response = self._request_session_kb.get(self._kb_wikidata_uri + '/search/simple', params=params)
+        response = self._request_session_kb.get(self._kb_wikidata_uri + '/search/simple', params=params,
+                                                timeout=request_timeout())
+        if response.status_code != 200:
+            raise EvaluationError('Unexpected {} response from Wikidata service: {}'.format(
+                response.status_code, response.text))
         try:
             return [result['result'] for result in response.json().get('member', ())]
         except JSONDecodeError:
-            _logger.warning('Unexpected response from Wikidata service: {}'.format(response))
-            return []
+            # Not an empty result: it should not be cached
+            raise EvaluationError('Unexpected response from Wikidata service: {}'.format(response))
 
     def normalize_for_sparql(self, term: Term) -> Term:
         if isinstance(term, Formula):
@@ -499,13 +737,17 @@ class WikidataKnowledgeBase(KnowledgeBase):
 
     def evaluate_term(self, term: Term) -> List[Tuple[Union[Entity, Literal]]]:
         term = self.normalize_for_sparql(term)
-        query = self._sparql_builder.build(term)
+        return self._evaluate_query(term, self._sparql_builder.build(term))
+
+    def _evaluate_query(self, term: Term, query: str) -> List[Tuple[Union[Entity, Literal]]]:
+        """
+        :param query: the query built from the normalized term
+        """
         results = self._execute_sparql_query(query)
 
         if 'results' in results and 'bindings' in results['results']:
             if isinstance(term, Select):
-                return [tuple(self._sparql_term_to_resource(result[arg.name]) for arg in term.args)
-                        for result in results['results']['bindings']]
+                return [self._binding_to_tuple(term, result) for result in results['results']['bindings']]
             else:
                 raise EvaluationError('Invalid term: {} for query: {}'.format(term, query))
         elif 'boolean' in results:
@@ -513,15 +755,106 @@ class WikidataKnowledgeBase(KnowledgeBase):
         else:
             raise EvaluationError('Unexpected result from Wikidata Query Service {}'.format(results))
 
+    def build_interpretations(self, terms: Iterable[Term]) -> List[QAInterpretation]:
+        """
+        Select terms are merged in UNION queries of at most sparql_batch_size sub-queries evaluated concurrently.
+        """
+        terms = list(terms)
+        interpretations = [None] * len(terms)
+        batch = []
+        for i, term in enumerate(terms):
+            try:
+                normalized = self.normalize_for_sparql(self._add_context_variables(term))
+                if isinstance(normalized, Select):
+                    # Built early in order to check that the term is supported
+                    batch.append((i, normalized, self._sparql_builder.build(normalized)))
+                else:
+                    interpretations[i] = self.build_interpretation(term)
+            except EvaluationError as e:
+                _logger.warning(e)
+
+        chunks = [batch[start:start + self._sparql_batch_size]
+                  for start in range(0, len(batch), self._sparql_batch_size)]
+        if len(chunks) <= 1:
+            chunks_interpretations = [self._evaluate_chunk(terms, chunk) for chunk in chunks]
+        else:
+            deadline = current_deadline()
+
+            def evaluate(chunk):
+                if deadline is None:
+                    return self._evaluate_chunk(terms, chunk)
+                with deadline:
+                    return self._evaluate_chunk(terms, chunk)
+
+            chunks_interpretations = self._sparql_executor.map(evaluate, chunks)
+        for chunk_interpretations in chunks_interpretations:
+            for i, interpretation in chunk_interpretations:
+                interpretations[i] = interpretation
+
+        return [interpretation for interpretation in interpretations if interpretation is not None]
+
+    def _evaluate_chunk(self, terms: List[Term], chunk: List[Tuple[int, Select, str]]) \
+            -> List[Tuple[int, QAInterpretation]]:
+        if len(chunk) == 1:
+            results_by_term = [None]
+        else:
+            results_by_term = self._evaluate_batch([normalized for _, normalized, _ in chunk],
+                                                   [query for _, _, query in chunk])
+        interpretations = []
+        for (i, normalized, query), results in zip(chunk, results_by_term):
+            if results is None:  # No batch or the batch failed, we fall back to the single term evaluation
+                try:
+                    results = self._evaluate_query(normalized, query)
+                except EvaluationError as e:
+                    _logger.warning(e)
+                    continue
+            interpretations.append((i, QAInterpretation(terms[i], [self._tuple_to_result(result)
+                                                                   for result in results])))
+        return interpretations
+
+    def _evaluate_batch(self, terms: List[Select], queries: List[str]) \
+            -> List[Optional[List[Tuple[Union[Entity, Literal]]]]]:
+        """
+        :param queries: the queries built for each term
+        :return: the results of each term or None for all terms if the batch query failed
+        """
+        query = self._sparql_builder.build_batch_from_queries(queries, _batch_discriminator)
+        try:
+            results = self._execute_sparql_query(query)
+        except requests.RequestException as e:
+            _logger.warning('Batch evaluation of {} terms failed: {}'.format(len(terms), e))
+            return [None] * len(terms)
+        if 'results' not in results or 'bindings' not in results['results']:
+            _logger.warning('Unexpected result from Wikidata Query Service {}'.format(results))
+            return [None] * len(terms)
+
+        results_by_term = [[] for _ in terms]
+        for result in results['results']['bindings']:
+            i = int(result[_batch_discriminator.name]['value'])
+            results_by_term[i].append(self._binding_to_tuple(terms[i], result))
+        return results_by_term
+
+    def _binding_to_tuple(self, term: Select, binding: dict) -> Tuple[Union[Entity, Literal]]:
+        return tuple(self._sparql_term_to_resource(binding[arg.name]) for arg in term.args)
+
     @lru_cache(maxsize=8192)
     def _execute_sparql_query(self, query: str):
+        # Whitespaces could be significant in literals: the exact query is used
+        cache_key = 'sparql:' + hashlib.sha256(query.encode('utf-8')).hexdigest()
+        result = self._sparql_cache.get(cache_key)
+        if result is not None:
+            return result
+
         response = self._request_session_sparql.post(
             self._wikidata_sparql_endpoint_ui,
             data=query.replace('\t', ''),
-            headers={'Accept': 'application/sparql-results+json', 'Content-Type': 'application/sparql-query'})
+            headers={'Accept': 'application/sparql-results+json', 'Content-Type': 'application/sparql-query'},
+            timeout=request_timeout())
         response.raise_for_status()
         try:
-            return response.json()
+            result = response.json()
+            self._sparql_cache.set(cache_key, result)
+            return result
         except JSONDecodeError:
             _logger.warning('Unexpected response from Wikidata Query Service: {}'.format(response))
             return {
@@ -535,8 +868,8 @@ class WikidataKnowledgeBase(KnowledgeBase):
         if term['type'] == 'uri':
             if term['value'].startswith('http://www.wikidata.org/entity/Q'):
                 return NamedIndividual(term['value'])
-            elif term['value'] in self._property_for_iri:
-                return self._property_for_iri[term['value']]
+            elif term['value'] in self._vocabulary.property_for_iri:
+                return self._vocabulary.property_for_iri[term['value']]
             else:
                 return XSDAnyURILiteral(term['value'])
         elif term['type'] == 'literal':
@@ -564,7 +897,7 @@ class WikidataKnowledgeBase(KnowledgeBase):
         value = interpretation_result.result
         # TODO: instead of using datatypes as @type, use Literal?
         if isinstance(value, Entity):
-            result = self._format_entity(value.iri, accept_language)
+            result = dict(self._format_entity(value.iri, accept_language))  # The cached value should not be modified
         elif isinstance(value, Literal):
             if isinstance(value, GeoWKTLiteral):
                 if isinstance(value.shape, Point):
@@ -604,25 +937,71 @@ class WikidataKnowledgeBase(KnowledgeBase):
                 _logger.info('Unmapped property: {}'.format(interpretation_result.context_predicate.iri))
         return result
 
-    @lru_cache(maxsize=8192)
+    def format_all_to_jsonld(self, results: Iterable[QAInterpretationResult],
+                             accept_language: str) -> List[Optional[dict]]:
+        results = list(results)
+        iris = set()
+        for result in results:
+            if isinstance(result.result, Entity):
+                iris.add(result.result.iri)
+            if result.context_subject is not None and result.context_predicate is not None:
+                iris.add(result.context_subject.iri)
+        self._prefetch_entities(iris, accept_language)
+        return super().format_all_to_jsonld(results, accept_language)
+
+    def _prefetch_entities(self, iris: Iterable[str], accept_language: str):
+        """
+        Fills the _format_entity cache by fetching the entities concurrently
+        """
+        iris = list(iris)
+        if len(iris) <= 1:
+            return  # Nothing to parallelize
+        deadline = current_deadline()
+
+        def fetch(iri):
+            try:
+                if deadline is None:
+                    self._format_entity(iri, accept_language)
+                else:
+                    with deadline:
+                        self._format_entity(iri, accept_language)
+            except (requests.exceptions.RequestException, TimeoutError) as e:
+                _logger.warning('Entity {} prefetching failed: {}'.format(iri, e))
+
+        for _ in self._entity_fetch_executor.map(fetch, iris):
+            pass
+
     def _format_entity(self, iri: str, accept_language: str) -> dict:
+        languages = language_chain(accept_language)
+        entity = self._entity_cache.get(iri, languages)
+        if entity is not None:
+            return entity
+
         response = self._request_session_kb.get(self._kb_wikidata_uri + '/entity/' +
                                                 urllib.parse.quote(
                                                     iri.replace('http://www.wikidata.org/entity/', 'wd:'), safe=''),
-                                                headers={'Accept-Language': accept_language})
+                                                headers={'Accept-Language': ', '.join(languages)} if languages else {},
+                                                timeout=request_timeout())
         # TODO: we should not need to reduce URIs
         try:
-            return response.json()
+            entity = response.json()
         except JSONDecodeError:
             _logger.warning(
                 'Unexpected {} response for entity {} from Wikidata service: {}'.format(response.status_code, iri,
                                                                                         response.text))
             return {'@id': iri}
+        if response.status_code != 200 or not isinstance(entity, dict) or 'error' in entity:
+            # Not cached: the error may be transient
+            _logger.warning('Error {} for entity {} from Wikidata service: {}'.format(response.status_code, iri,
+                                                                                     entity))
+            return {'@id': iri}
+        return self._entity_cache.add(iri, languages, entity, response.headers.get('Content-Language'))
 
     def get_label(self, entity: Entity, accept_language: str) -> Optional[str]:
-        if accept_language in self._label_for_iri and entity.iri in self._label_for_iri[accept_language]:
-            return self._label_for_iri[accept_language][entity.iri]
-        elif entity.iri.startsWith('http://www.wikidata.org/entity/'):
+        vocabulary = self._vocabulary.get_loaded(accept_language)
+        if vocabulary is not None and entity.iri in vocabulary.label_for_iri:
+            return vocabulary.label_for_iri[entity.iri]
+        elif entity.iri.startswith('http://www.wikidata.org/entity/'):
             entity = self._format_entity(entity.iri, accept_language)
             if 'name' in entity:
                 return entity['name']
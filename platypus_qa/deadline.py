@@ -0,0 +1,106 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+import time
+from concurrent.futures import TimeoutError
+from typing import Optional
+
+_local = threading.local()
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    """
+    Time budget of a processing. It is activated for the current thread using a with statement.
+    A deadline created while another one is active could not expire after it and is cancelled with it.
+    The processing should call check_deadline regularly and use request_timeout for its blocking calls.
+    """
+
+    def __init__(self, timeout: float):
+        self._parent = current_deadline()
+        self._expires = time.monotonic() + timeout
+        if self._parent is not None:
+            self._expires = min(self._expires, self._parent._expires)
+        self._cancelled = False
+
+    def remaining(self) -> float:
+        return self._expires - time.monotonic()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled or (self._parent is not None and self._parent.cancelled)
+
+    def cancel(self):
+        self._cancelled = True
+
+    def check(self):
+        """
+        :raise DeadlineExceeded if the deadline has expired or has been cancelled
+        """
+        if self.cancelled:
+            raise DeadlineExceeded('Processing cancelled')
+        if self.remaining() <= 0:
+            raise DeadlineExceeded('Processing timeout')
+
+    def __enter__(self):
+        if not hasattr(_local, 'deadlines'):
+            _local.deadlines = []
+        _local.deadlines.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _local.deadlines.pop()
+        return False
+
+
+def current_deadline() -> Optional[Deadline]:
+    """
+    :return: the deadline active in the current thread, if any
+    """
+    deadlines = getattr(_local, 'deadlines', None)
+    return deadlines[-1] if deadlines else None
+
+
+def check_deadline():
+    """
+    :raise DeadlineExceeded if the deadline active in the current thread has expired or has been cancelled
+    """
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.check()
+
+
+def request_timeout(default: Optional[float] = None) -> Optional[float]:
+    """
+    :return: the timeout to use for a blocking call: the remaining time of the active deadline if it is lower than
+    default
+    :raise DeadlineExceeded if the active deadline has already expired
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return default
+    deadline.check()
+    if default is None:
+        return deadline.remaining()
+    return min(default, deadline.remaining())
@@ -0,0 +1,250 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from functools import lru_cache
+from typing import List, Optional
+
+from pyld import jsonld
+
+_node_keywords = {'@id', '@type', '@reverse'}
+_value_keywords = {'@value', '@type', '@language'}
+
+
+class _UnsupportedDocument(Exception):
+    pass
+
+
+class JsonLdCompactor:
+    """
+    JSON-LD compaction against a fixed context.
+
+    The context and its inverse are processed once. Documents only using nodes, literals and @reverse are compacted
+    directly and the other ones (lists, graphs, indexes, local contexts...) are given to pyld.
+    The output is the same as the one of pyld jsonld.compact.
+    The IRI expansion and compaction of pyld are private APIs: the pyld version is pinned in requirements.txt.
+    """
+
+    def __init__(self, context: dict):
+        self._context = context
+        self._processor = jsonld.JsonLdProcessor()
+        options = {'base': '', 'documentLoader': jsonld.load_document}
+        self._active_context = self._processor.process_context(
+            self._processor._get_initial_context(options), context, options)
+        self._enabled = '@language' not in self._active_context and all(
+            definition is None or not ({'@container', '@language', '@reverse'} & definition.keys())
+            for definition in self._active_context['mappings'].values())
+        self._expand_iri = lru_cache(maxsize=65536)(self._do_expand_iri)
+        self._compact_iri = lru_cache(maxsize=65536)(self._do_compact_iri)
+        self._compact_id = lru_cache(maxsize=65536)(self._do_compact_id)
+        self._expand_key = lru_cache(maxsize=65536)(self._do_expand_key)
+
+        self._collection_type = self._compact_iri('http://www.w3.org/ns/hydra/core#Collection', None)
+        self._member_key = self._compact_iri('http://www.w3.org/ns/hydra/core#member', ('@id',))
+        self._total_items_key = self._compact_iri('http://www.w3.org/ns/hydra/core#totalItems', ('@none',))
+
+    def compact(self, document: dict) -> dict:
+        """
+        :return: the same as jsonld.compact({'@context': context, **document}, context)
+        """
+        if self._enabled and '@context' not in document:
+            try:
+                node = self._expand_node(document)
+                # pyld drops top level nodes without properties
+                if node.keys() - {'@id'}:
+                    result = {'@context': self._context}
+                    result.update(self._compact_node(node))
+                    return result
+            except _UnsupportedDocument:
+                pass
+        return jsonld.compact(dict(document, **{'@context': self._context}), self._context)
+
+    def compact_collection(self, members: List[dict]) -> dict:
+        """
+        :return: the compacted hydra:Collection with the given members
+        """
+        if self._enabled:
+            try:
+                compacted_members = [self._compact_node(self._expand_node(member)) for member in members]
+                return {
+                    '@context': self._context,
+                    '@type': self._collection_type,
+                    self._member_key: compacted_members[0] if len(compacted_members) == 1 else compacted_members,
+                    self._total_items_key: len(members)
+                }
+            except _UnsupportedDocument:
+                pass
+        return jsonld.compact({
+            '@context': self._context,
+            '@type': 'hydra:Collection',
+            'totalItems': len(members),
+            'member': members
+        }, self._context)
+
+    def _do_expand_iri(self, value: str, vocab: bool) -> Optional[str]:
+        return self._processor._expand_iri(self._active_context, value, base=True, vocab=vocab)
+
+    def _do_expand_key(self, key: str) -> tuple:
+        """
+        :return: the property IRI or None if the key should be ignored and the type the values are coerced to
+        """
+        property = self._expand_iri(key, True)
+        if property is None or ':' not in property:
+            return None, None
+        if property.startswith('@'):
+            raise _UnsupportedDocument()
+        definition = self._active_context['mappings'].get(key)
+        return property, definition.get('@type') if definition is not None else None
+
+    def _do_compact_iri(self, iri: str, value_kind: Optional[tuple], reverse: bool = False) -> str:
+        # Term selection only depends on the kind of the value
+        if value_kind is None:
+            value = None
+        elif value_kind[0] == '@id':
+            value = {'@id': ''}
+        elif value_kind[0] == '@none':
+            value = {'@value': ''}
+        else:
+            value = {'@value': '', value_kind[0]: value_kind[1]}
+        return self._processor._compact_iri(self._active_context, iri, value=value, vocab=True, reverse=reverse)
+
+    def _do_compact_id(self, iri: str) -> str:
+        return self._processor._compact_iri(self._active_context, iri, vocab=False)
+
+    def _expand_node(self, node: dict) -> dict:
+        result = {}
+        for key, value in node.items():
+            if key == '@context':
+                self._check_local_context(value)
+                continue
+            if key == '@id':
+                if not isinstance(value, str):
+                    raise _UnsupportedDocument()
+                result['@id'] = self._expand_iri(value, False)
+            elif key == '@type':
+                types = value if isinstance(value, list) else [value]
+                if not all(isinstance(type, str) for type in types):
+                    raise _UnsupportedDocument()
+                result['@type'] = [self._expand_iri(type, True) for type in types]
+            elif key == '@reverse':
+                if not isinstance(value, dict):
+                    raise _UnsupportedDocument()
+                reverse = self._expand_node(value)
+                if reverse.keys() & _node_keywords:
+                    raise _UnsupportedDocument()
+                if any('@value' in item for values in reverse.values() for item in values):
+                    raise _UnsupportedDocument()
+                result['@reverse'] = reverse
+            elif key.startswith('@'):
+                raise _UnsupportedDocument()
+            else:
+                property, coercion = self._expand_key(key)
+                if property is None:
+                    continue  # pyld drops the properties that are not IRIs
+                if property in result:
+                    raise _UnsupportedDocument()
+                if value is None:
+                    continue
+                values = value if isinstance(value, list) else [value]
+                result[property] = [self._expand_value(item, coercion) for item in values if item is not None]
+        return result
+
+    def _expand_value(self, value, coercion: Optional[str]) -> dict:
+        if isinstance(value, dict):
+            if '@value' in value:
+                if value.keys() - _value_keywords or value['@value'] is None or \
+                        isinstance(value['@value'], (dict, list)) or ('@type' in value and '@language' in value) or \
+                        not isinstance(value.get('@type', ''), str) or not isinstance(value.get('@language', ''), str):
+                    raise _UnsupportedDocument()
+                result = {'@value': value['@value']}
+                if '@type' in value:
+                    result['@type'] = self._expand_iri(value['@type'], True)
+                if '@language' in value:
+                    result['@language'] = value['@language'].lower()
+                return result
+            return self._expand_node(value)
+        if isinstance(value, list) or coercion in ('@id', '@vocab'):
+            raise _UnsupportedDocument()
+        if coercion is not None:
+            return {'@value': value, '@type': coercion}
+        return {'@value': value}
+
+    def _check_local_context(self, context):
+        # Local contexts are only supported if they do not change anything
+        if not isinstance(context, dict) or any(context[key] != self._context.get(key) for key in context):
+            raise _UnsupportedDocument()
+
+    def _compact_node(self, node: dict) -> dict:
+        result = {}
+        for property in sorted(node.keys()):
+            values = node[property]
+            if property == '@id':
+                result['@id'] = self._compact_id(values)
+            elif property == '@type':
+                types = [self._compact_iri(type, None) for type in values]
+                result['@type'] = types[0] if len(types) == 1 else types
+            elif property == '@reverse':
+                result['@reverse'] = self._compact_properties(values, True)
+            else:
+                self._add_property(result, property, values, False)
+        return result
+
+    def _compact_properties(self, properties: dict, reverse: bool) -> dict:
+        result = {}
+        for property in sorted(properties.keys()):
+            self._add_property(result, property, properties[property], reverse)
+        return result
+
+    def _add_property(self, result: dict, property: str, values: List[dict], reverse: bool):
+        if not values:
+            result[self._compact_iri(property, ('@id',), reverse)] = []
+            return
+        for value in values:
+            key = self._compact_iri(property, self._value_kind(value), reverse)
+            compacted = self._compact_value(key, value)
+            if key not in result:
+                result[key] = compacted
+            elif isinstance(result[key], list):
+                result[key].append(compacted)
+            else:
+                result[key] = [result[key], compacted]
+
+    @staticmethod
+    def _value_kind(value: dict) -> tuple:
+        if '@value' not in value:
+            return '@id',
+        if '@language' in value:
+            return '@language', value['@language']
+        if '@type' in value:
+            return '@type', value['@type']
+        return '@none',
+
+    def _compact_value(self, key: str, value: dict):
+        if '@value' not in value:
+            if value.keys() == {'@id'}:
+                return {'@id': self._compact_id(value['@id'])}
+            return self._compact_node(value)
+        definition = self._active_context['mappings'].get(key)
+        if '@type' in value:
+            if definition is not None and definition.get('@type') == value['@type']:
+                return value['@value']
+            return {'@type': self._compact_iri(value['@type'], None), '@value': value['@value']}
+        if '@language' in value:
+            return {'@language': value['@language'], '@value': value['@value']}
+        return value['@value']
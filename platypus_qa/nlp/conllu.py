@@ -18,157 +18,156 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
-from collections import OrderedDict
-from collections import defaultdict
-from typing import Optional, List
+import mmap
+import threading
+from array import array
+from typing import Callable, Dict, Iterable, Iterator, List
 
-from platypus_qa.nlp.model import Token, Sentence
+from platypus_qa.nlp.model import Sentence, CompactSentence, DecodedColumn
 from platypus_qa.nlp.universal_dependencies import UDDependency, UDPOSTag
 
 
-class _CoNLLUToken(Token):
-    def __init__(self, conll_token, sentence):
-        """
-        :param sentence _CoNLLUSentence
-        """
-        self._conll_token = conll_token
-        self._sentence = sentence
-
-    @property
-    def id(self) -> int:
-        if not self._conll_token['ID'].isdecimal():
-            raise ValueError('This CONLLU token has not an integer id {}'.format(self._conll_token))
-        return int(self._conll_token['ID'])
-
-    @property
-    def ud_pos(self) -> UDPOSTag:
-        return UDPOSTag.from_str(self._conll_token['UPOSTAG'])
-
-    @property
-    def word(self) -> str:
-        return self._conll_token['FORM']
-
-    @property
-    def lemma(self) -> str:
-        return self._conll_token['LEMMA']
-
-    @property
-    def main_ud_dependency(self) -> UDDependency:
-        return UDDependency.from_str(self._conll_token['DEPREL'])
-
-    @property
-    def head(self) -> Optional[Token]:
-        if self._conll_token['HEAD'] == '0' or self._conll_token['HEAD'] == '_':
-            return None
-        else:
-            return self._sentence.token_for_id(self._conll_token['HEAD'])
-
-    @property
-    def left_children(self) -> List[Token]:
-        return self._sentence.left_children_for_id(self._conll_token['ID'])
-
-    @property
-    def right_children(self) -> List[Token]:
-        return self._sentence.right_children_for_id(self._conll_token['ID'])
-
-    @property
-    def prev(self) -> Optional[Token]:
-        if not self._conll_token['ID'].isdecimal():
-            return None
-        return self._sentence[int(self._conll_token['ID']) - 2]
-
-    @property
-    def next(self) -> Optional[Token]:
-        if not self._conll_token['ID'].isdecimal():
-            return None
-        return self._sentence[int(self._conll_token['ID'])]
-
-
-class _CoNLLUSentence(Sentence):
-    def __init__(self, conll_sentence, language_code: str):
-        self._language_code = language_code
-        self._tokens = []
-        self._token_by_id = {}
-        self._left_children_ids = defaultdict(list)
-        self._right_children_ids = defaultdict(list)
-        self._root = None
-
-        for conll_token in conll_sentence:
-            token = _CoNLLUToken(conll_token, self)
-
-            self._token_by_id[conll_token['ID']] = token
-            if conll_token['ID'].isdecimal():
-                self._tokens.insert(int(conll_token['ID']), token)
-
-            if conll_token['HEAD'] == '0':
-                self._root = token
-            else:
-                if conll_token['HEAD'] in self._token_by_id:
-                    self._right_children_ids[conll_token['HEAD']].append(conll_token['ID'])
+# Code of the strings that cannot be decoded
+_UNDECODED = 0xFFFF
+
+
+class _CodeTable:
+    """
+    Decodes tag strings into small integers indexing a table of enum members.
+    Each distinct string is decoded only once. The strings that cannot be decoded get the _UNDECODED code.
+    """
+
+    def __init__(self, decode: Callable[[str], object]):
+        self.decode = decode
+        self._codes = {}
+        self._lock = threading.Lock()
+        self.members = []
+
+    def code(self, string: str) -> int:
+        code = self._codes.get(string)
+        if code is None:
+            try:
+                member = self.decode(string)
+            except (KeyError, ValueError):
+                # Not remembered: the table should not grow with each invalid tag of the documents
+                return _UNDECODED
+            with self._lock:
+                if member in self.members:
+                    code = self.members.index(member)
                 else:
-                    self._left_children_ids[conll_token['HEAD']].append(conll_token['ID'])
-
-    @property
-    def language_code(self) -> str:
-        return self._language_code
-
-    def __getitem__(self, i: int) -> Token:
-        return self._tokens[i]
-
-    def __iter__(self):
-        return self._tokens.__iter__()
+                    code = len(self.members)
+                    self.members.append(member)
+                self._codes[string] = code
+        return code
+
+
+_pos_codes = _CodeTable(UDPOSTag.from_str)
+_dependency_codes = _CodeTable(lambda string: None if string == '_' else UDDependency.from_str(string))
+
+
+class _CoNLLUColumns:
+    """
+    The ten fields of the words of a CoNLL-U sentence stored in parallel arrays.
+    Multiword tokens and empty nodes are skipped: they are not part of the dependency tree.
+    """
+
+    __slots__ = ('ids', 'forms', 'lemmas', 'upos', 'xpos', 'feats', 'heads', 'deprels', 'deps', 'misc',
+                 'undecoded_upos', 'undecoded_deprels')
+
+    def __init__(self):
+        self.ids = array('i')
+        self.forms = []
+        self.lemmas = []
+        self.upos = array('H')
+        self.xpos = []
+        self.feats = []
+        self.heads = array('i')  # -1 if unknown
+        self.deprels = array('H')
+        self.deps = []
+        self.misc = []
+        self.undecoded_upos = {}  # position -> UPOS that cannot be decoded
+        self.undecoded_deprels = {}  # position -> DEPREL that cannot be decoded
 
     def __len__(self) -> int:
-        return len(self._tokens)
-
-    @property
-    def root(self):
-        return self._root
+        return len(self.ids)
+
+    def append(self, line: str):
+        fields = line.split('\t')
+        if not fields[0].isdecimal():
+            return
+        if len(fields) < 10:
+            fields.extend(['_'] * (10 - len(fields)))
+        position = len(self.ids)
+        self.ids.append(int(fields[0]))
+        self.forms.append(fields[1])
+        self.lemmas.append(fields[2])
+        self.upos.append(self._code(_pos_codes, fields[3], position, self.undecoded_upos))
+        self.xpos.append(fields[4])
+        self.feats.append(fields[5])
+        self.heads.append(int(fields[6]) if fields[6].isdecimal() else -1)
+        self.deprels.append(self._code(_dependency_codes, fields[7], position, self.undecoded_deprels))
+        self.deps.append(fields[8])
+        self.misc.append(fields[9])
+
+    @staticmethod
+    def _code(table: _CodeTable, string: str, position: int, undecoded: Dict[int, str]) -> int:
+        code = table.code(string)
+        if code == _UNDECODED:
+            undecoded[position] = string
+        return code
+
+    def to_sentence(self, language_code: str) -> Sentence:
+        position_by_id = {id: position for position, id in enumerate(self.ids)}
+        root = None
+        heads = array('i')
+        for position, head in enumerate(self.heads):
+            if head == 0:
+                root = position
+            heads.append(position_by_id.get(head, -1))
+        return CompactSentence(
+            language_code,
+            self.forms,
+            self.lemmas,
+            DecodedColumn(self.upos, self.undecoded_upos, _pos_codes.decode, _pos_codes.members),
+            DecodedColumn(self.deprels, self.undecoded_deprels, _dependency_codes.decode, _dependency_codes.members),
+            heads,
+            root
+        )
 
-    def token_for_id(self, id: str) -> Token:
-        """
-        Private function. Unstable.
-        """
-        return self._token_by_id[id]
 
-    def left_children_for_id(self, id: str):
+class CoNLLUParser:
+    def parse(self, file_text: str, language_code: str) -> List[Sentence]:
         """
-        Private function. Unstable.
+        :return: List[Sentence]
         """
-        if id in self._left_children_ids:
-            return [self._token_by_id[child_id] for child_id in self._left_children_ids[id]]
-        else:
-            return []
+        return list(self.iter_parse(file_text.split('\n'), language_code))
 
-    def right_children_for_id(self, id: str):
+    def iter_parse(self, lines: Iterable[str], language_code: str) -> Iterator[Sentence]:
         """
-        Private function. Unstable.
+        :param lines: the lines of a CoNLL-U document, with or without their line terminators
+        :return: the sentences of the document, read one at a time
         """
-        if id in self._right_children_ids:
-            return [self._token_by_id[child_id] for child_id in self._right_children_ids[id]]
-        else:
-            return []
-
-
-class CoNLLUParser:
-    def parse(self, file_text: str, language_code: str):
+        columns = _CoNLLUColumns()
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if not line:
+                if len(columns):
+                    yield columns.to_sentence(language_code)
+                    columns = _CoNLLUColumns()
+            elif line[0] != '#':
+                columns.append(line)
+        if len(columns):
+            yield columns.to_sentence(language_code)
+
+    def parse_file(self, path: str, language_code: str) -> Iterator[Sentence]:
         """
-        :return: List[Sentence]
+        Reads the sentences of a UTF-8 CoNLL-U file through a memory map without loading the whole file
         """
-        sentences = []
-        current_sentence_conll = []
-        for line in file_text.split('\n'):
-            if not line:
-                if current_sentence_conll:
-                    sentences.append(_CoNLLUSentence(current_sentence_conll, language_code))
-                    current_sentence_conll = []
-            elif line[0] == '#':
-                continue
-            else:
-                current_sentence_conll.append(OrderedDict(zip(
-                    ['ID', 'FORM', 'LEMMA', 'UPOSTAG', 'XPOSTAG', 'FEATS', 'HEAD', 'DEPREL', 'DEPS', 'MISC'],
-                    line.split('\t')
-                )))
-        if current_sentence_conll:
-            sentences.append(_CoNLLUSentence(current_sentence_conll, language_code))
-        return sentences
+        with open(path, 'rb') as file:
+            try:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Empty file
+                return
+            with buffer:
+                yield from self.iter_parse(
+                    (line.decode('utf-8') for line in iter(buffer.readline, b'')), language_code)
@@ -19,67 +19,16 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 import json
-import random
 from functools import lru_cache
 from json import JSONDecodeError
-from typing import List
-from typing import Optional
+from typing import List, Optional
 
-import requests
-
-from platypus_qa.nlp.model import Sentence, Token, NLPParser
+from platypus_qa.backend_pool import BackendPool
+from platypus_qa.cache import DictCache, DummyDictCache
+from platypus_qa.nlp.model import Sentence, NLPParser, CompactSentence, DecodedColumn, normalize_text
 from platypus_qa.nlp.universal_dependencies import UDPOSTag, UDDependency
 
 
-class _CoreNLPToken(Token):
-    def __init__(self, data, sentence):
-        """
-        :param sentence _CoreNLPSentence
-        """
-        self._data = data
-        self._sentence = sentence
-
-    @property
-    def id(self) -> int:
-        return self._data['dep_id']
-
-    @property
-    def ud_pos(self) -> UDPOSTag:
-        return UDPOSTag.from_str(self._data['pos'])
-
-    @property
-    def word(self) -> str:
-        return self._data['word']
-
-    @property
-    def lemma(self) -> str:
-        return self._data['lemma']
-
-    @property
-    def main_ud_dependency(self) -> UDDependency:
-        return UDDependency.from_str(self._data['dep'])
-
-    @property
-    def head(self) -> Optional[Token]:
-        return self._sentence.token_for_dep_position(self._data['governor'])
-
-    @property
-    def left_children(self) -> List[Token]:
-        return self._sentence.left_children_for_dep_position(self._data['dep_id'])
-
-    @property
-    def right_children(self) -> List[Token]:
-        return self._sentence.right_children_for_dep_position(self._data['dep_id'])
-
-    @property
-    def prev(self) -> Optional[Token]:
-        return self._sentence.token_for_dep_position(self._data['dep_id'] - 1)
-
-    @property
-    def next(self) -> Optional[Token]:
-        return self._sentence.token_for_dep_position(self._data['dep_id'] + 1)
-
-
 # TODO improve with http://universaldependencies.org/tagset-conversion/en-penn-uposf.html or better http://universaldependencies.org/en/overview/morphology.html
 _upen_pos_tag_to_ud = {
     'NN|SYM': UDPOSTag.NOUN,
@@ -306,138 +255,60 @@ _ancora_pos_tag_to_ud = {  # See https://nlp.stanford.edu/software/spanish-faq.s
 }
 
 
-class _EnglishCoreNLPToken(_CoreNLPToken):
-    def __init__(self, data, sentence):
-        super().__init__(data, sentence)
-
-    @property
-    def ud_pos(self) -> UDPOSTag:
-        return _upen_pos_tag_to_ud[self._data['pos']]
-
-    @property
-    def main_ud_dependency(self) -> UDDependency:
-        return UDDependency.from_str(self._data['dep'])
-
-
-class _GermanCoreNLPToken(_CoreNLPToken):
-    def __init__(self, data, sentence):
-        super().__init__(data, sentence)
-
-    @property
-    def ud_pos(self) -> UDPOSTag:
-        return _de_pos_tag_to_ud[self._data['pos']]
-
-    @property
-    def main_ud_dependency(self) -> UDDependency:
-        return UDDependency.from_str(self._data['dep'])
-
-
-class _SpanishCoreNLPToken(_CoreNLPToken):
-    def __init__(self, data, sentence):
-        super().__init__(data, sentence)
+_pos_tag_to_ud_by_language = {
+    'de': _de_pos_tag_to_ud,
+    'en': _upen_pos_tag_to_ud,
+    'es': _ancora_pos_tag_to_ud
+}
 
-    @property
-    def ud_pos(self) -> UDPOSTag:
-        return _ancora_pos_tag_to_ud[self._data['pos']]
 
-    @property
-    def main_ud_dependency(self) -> UDDependency:
-        return UDDependency.from_str(self._data['dep'])
+def _decode_dependency(dep: Optional[str]) -> Optional[UDDependency]:
+    return None if dep is None else UDDependency.from_str(dep)
 
 
-class _CoreNLPSentence(Sentence):
+def _build_sentence(core_nlp_output, language_code: str) -> Sentence:
     # TODO: we do not support dependency DAGs (only used with improved dependencies)
-
-    def __init__(self, core_nlp_output, language_code):
-        self._language_code = language_code
-        dependencies_data = sorted(core_nlp_output['basicDependencies'],
-                                   key=lambda current_dep: current_dep['dependent'])
-
-        self._tokens = []
-        self._token_by_dependency_id = [None] * (len(dependencies_data) + 1)
-        self._left_children_ids_by_governor_id = [[] for i in range(len(dependencies_data) + 1)]
-        self._right_children_ids_by_governor_id = [[] for i in range(len(dependencies_data) + 1)]
-
-        # Parse tokens and adds to them a dependency id
-        current_dep_i = 0
-        num_dep_i = len(dependencies_data)
-        for token_data in core_nlp_output['tokens']:
-            if current_dep_i < num_dep_i and dependencies_data[current_dep_i]['dependentGloss'] == token_data['word']:
-                current_dep = dependencies_data[current_dep_i]
-                token_data['dep_id'] = current_dep['dependent']
-                token_data['dep'] = current_dep['dep']
-                token_data['governor'] = current_dep['governor']
-                token = self._build_token(token_data)
-                self._tokens.append(token)
-                self._token_by_dependency_id[current_dep['dependent']] = token
-            else:
-                self._tokens.append(self._build_token(token_data))
-            current_dep_i += 1
-
-        # Fill dependencies map
-        for dependency_data in dependencies_data:
-            if dependency_data['dep'] == 'ROOT':
-                self._root_dependency_id = dependency_data['dependent']
-            else:
-                if dependency_data['governor'] >= dependency_data['dependent']:
-                    self._left_children_ids_by_governor_id[dependency_data['governor']].append(
-                        dependency_data['dependent'])
-                else:
-                    self._right_children_ids_by_governor_id[dependency_data['governor']].append(
-                        dependency_data['dependent'])
-
-    def _build_token(self, core_nlp_data) -> Token:
-        return _CoreNLPToken(core_nlp_data, self)
-
-    def __getitem__(self, i: int) -> Token:
-        return self._tokens[i]
-
-    def __iter__(self):
-        return self._tokens.__iter__()
-
-    def __len__(self) -> int:
-        return len(self._tokens)
-
-    @property
-    def root(self):
-        return self._token_by_dependency_id[self._root_dependency_id]
-
-    def token_for_dep_position(self, i: int) -> Token:
-        """
-        Private function. Unstable.
-        """
-        return self._token_by_dependency_id[i]
-
-    def left_children_for_dep_position(self, i: int):
-        """
-        Private function. Unstable.
-        """
-        return [self._token_by_dependency_id[child] for child in self._left_children_ids_by_governor_id[i]]
-
-    def right_children_for_dep_position(self, i: int):
-        """
-        Private function. Unstable.
-        """
-        return [self._token_by_dependency_id[child] for child in self._right_children_ids_by_governor_id[i]]
-
-    @property
-    def language_code(self) -> str:
-        return self._language_code
-
-
-class _EnglishCoreNLPSentence(_CoreNLPSentence):
-    def _build_token(self, core_nlp_data) -> Token:
-        return _EnglishCoreNLPToken(core_nlp_data, self)
-
-
-class _GermanCoreNLPSentence(_CoreNLPSentence):
-    def _build_token(self, core_nlp_data) -> Token:
-        return _GermanCoreNLPToken(core_nlp_data, self)
-
-
-class _SpanishCoreNLPSentence(_CoreNLPSentence):
-    def _build_token(self, core_nlp_data) -> Token:
-        return _SpanishCoreNLPToken(core_nlp_data, self)
+    dependencies_data = sorted(core_nlp_output['basicDependencies'],
+                               key=lambda current_dep: current_dep['dependent'])
+    tokens_data = core_nlp_output['tokens']
+
+    # Aligns tokens with their dependency
+    dependency_by_position = []
+    position_by_dependency_id = {}
+    current_dep_i = 0
+    num_dep_i = len(dependencies_data)
+    for position, token_data in enumerate(tokens_data):
+        if current_dep_i < num_dep_i and dependencies_data[current_dep_i]['dependentGloss'] == token_data['word']:
+            current_dep = dependencies_data[current_dep_i]
+            dependency_by_position.append(current_dep)
+            position_by_dependency_id[current_dep['dependent']] = position
+        else:
+            dependency_by_position.append(None)
+        current_dep_i += 1
+
+    heads = []
+    root = None
+    for position, dependency_data in enumerate(dependency_by_position):
+        if dependency_data is None:
+            heads.append(-1)
+        elif dependency_data['dep'] == 'ROOT':
+            heads.append(-1)
+            root = position
+        else:
+            heads.append(position_by_dependency_id.get(dependency_data['governor'], -1))
+
+    pos_tag_to_ud = _pos_tag_to_ud_by_language.get(language_code)
+    return CompactSentence(
+        language_code,
+        [token_data['word'] for token_data in tokens_data],
+        [token_data['lemma'] for token_data in tokens_data],
+        DecodedColumn.from_strings((token_data['pos'] for token_data in tokens_data),
+                                   UDPOSTag.from_str if pos_tag_to_ud is None else pos_tag_to_ud.__getitem__),
+        DecodedColumn.from_strings((None if dependency_data is None else dependency_data['dep']
+                                    for dependency_data in dependency_by_position), _decode_dependency),
+        heads,
+        root
+    )
 
 
 _config_by_language = {
@@ -465,12 +336,24 @@ _config_by_language = {
 
 
 class CoreNLPParser(NLPParser):
-    def __init__(self, server_urls):
+    def __init__(self, server_urls, parse_cache: DictCache = DummyDictCache(), model_version: str = '',
+                 pool_size: int = 16, timeout: Optional[float] = 10):
         """
         :param server_urls: List[str] URLs of coreNLP servers running version 3.6
+        :param parse_cache: cache of the parser outputs shared between processes
+        :param model_version: version of the models used by the servers. It should be changed when they are updated
+        in order to not reuse the cached parses.
+        :param pool_size: the maximal number of connections kept open with each server
+        :param timeout: time in seconds after which a server that has not answered is considered failed, None to
+        never time out
         """
-        self._servers = server_urls
-        self._request_session = requests.session()
+        self._servers = BackendPool(server_urls, pool_size=pool_size, timeout=timeout)
+        self._parse_cache = parse_cache
+        self._model_version = model_version
+
+    @property
+    def backend_stats(self) -> dict:
+        return self._servers.stats
 
     @property
     def supported_languages(self) -> List[str]:
@@ -482,30 +365,29 @@ class CoreNLPParser(NLPParser):
         :param language_code: the text language. Only 'en' and 'fr' are currently supported
         :return: List[Sentence]
         """
-        core_nlp_result = self._do_parse(text, language_code)
-        if language_code == 'en':
-            return [_EnglishCoreNLPSentence(core_nlp_sentence, 'en') for core_nlp_sentence in core_nlp_result]
-        elif language_code == 'es':
-            return [_SpanishCoreNLPSentence(core_nlp_sentence, 'es') for core_nlp_sentence in core_nlp_result]
-        elif language_code == 'de':
-            return [_GermanCoreNLPSentence(core_nlp_sentence, 'de') for core_nlp_sentence in core_nlp_result]
-        else:
-            return [_CoreNLPSentence(core_nlp_sentence, language_code) for core_nlp_sentence in core_nlp_result]
+        return [_build_sentence(core_nlp_sentence, language_code)
+                for core_nlp_sentence in self._do_parse(normalize_text(text), language_code)]
 
     @lru_cache(maxsize=2048)
     def _do_parse(self, sentence: str, language_code: str):
         if language_code not in _config_by_language:
             raise ValueError('{} is not supported by CoreNLP'.format(language_code))
 
-        server = random.choice(self._servers)
-        response = self._request_session.post(server,
-                                              params={
-                                                  'properties': json.dumps(_config_by_language[language_code]),
-                                                  'pipelineLanguage': language_code
-                                              }, data=sentence.encode('utf8'))
+        cache_key = json.dumps(['corenlp', self._model_version, _config_by_language[language_code], language_code,
+                                sentence], sort_keys=True)
+        result = self._parse_cache.get(cache_key)
+        if result is not None:
+            return result
+
+        response = self._servers.post(params={
+            'properties': json.dumps(_config_by_language[language_code]),
+            'pipelineLanguage': language_code
+        }, data=sentence.encode('utf8'))
         try:
-            return response.json()['sentences']
+            result = response.json()['sentences']
         except JSONDecodeError:
             raise RuntimeError('CoreNLP invalid response with status code {}: {}'.format(
                 response.status_code, response.text)
             )
+        self._parse_cache.set(cache_key, result)
+        return result
@@ -19,12 +19,15 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 import itertools
-from typing import Optional, List, Iterator, Sequence
+import unicodedata
+from typing import Optional, List, Iterable, Sequence, Callable, Any, Dict
 
 from platypus_qa.nlp.universal_dependencies import UDPOSTag, UDDependency
 
 
 class Form:
+    __slots__ = ()
+
     @property
     def ud_pos(self) -> UDPOSTag:
         """
@@ -56,6 +59,8 @@ class Form:
 
 
 class Token(Form):
+    __slots__ = ()
+
     @property
     def id(self) -> int:
         """
@@ -84,25 +89,25 @@ class Token(Form):
         raise NotImplementedError('Token.head is not implemented')
 
     @property
-    def left_children(self) -> List['Token']:
+    def left_children(self) -> Sequence['Token']:
         """
         :return: The left children with the same order as in the original sentence
         """
         raise NotImplementedError('Token.children is not implemented')
 
     @property
-    def right_children(self) -> List['Token']:
+    def right_children(self) -> Sequence['Token']:
         """
         :return: The right children with the same order as in the original sentence
         """
         raise NotImplementedError('Token.children is not implemented')
 
     @property
-    def children(self) -> List['Token']:
+    def children(self) -> Sequence['Token']:
         """
         :return: The children with the same order as in the original sentence
         """
-        return self.left_children + self.right_children
+        return list(self.left_children) + list(self.right_children)
 
     def children_by_ud_dependency(self, ud_dependency: UDDependency) -> List['Token']:
         return [dependency for dependency in self.children if dependency.main_ud_dependency == ud_dependency]
@@ -130,7 +135,7 @@ class Token(Form):
             return token
 
     @property
-    def subtree(self) -> Iterator['Token']:
+    def subtree(self) -> Iterable['Token']:
         return itertools.chain(
             itertools.chain.from_iterable(dependency.subtree for dependency in self.left_children),
             [self],
@@ -167,6 +172,8 @@ class Sentence:
     A sentence: a bag of tokens
     """
 
+    __slots__ = ()
+
     def __getitem__(self, i: int) -> Token:
         raise NotImplementedError('Sentence.__getitem__(i: int) is not implemented')
 
@@ -188,6 +195,14 @@ class Sentence:
         return str(self.root)
 
 
+def normalize_text(text: str) -> str:
+    """
+    :return: the text with composed unicode characters and without redundant whitespaces. Texts with the same
+    normalization should have the same parse.
+    """
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
 class NLPParser:
     @property
     def supported_languages(self) -> List[str]:
@@ -281,3 +296,202 @@ class EmptyDictionary(Dictionary):
 
     def get_form(self, word: str, ud_pos: UDPOSTag = None) -> Form:
         return SimpleForm(word, word, ud_pos or UDPOSTag.X)
+
+
+class DecodedColumn(Sequence):
+    """
+    Values decoded from the strings returned by a parser.
+    The strings that cannot be decoded, like unknown tags, are kept and only raise their decoding error when their
+    value is read so that the other tokens of the sentence are still usable.
+    """
+
+    __slots__ = ('_values', '_undecoded', '_decode', '_members')
+
+    def __init__(self, values: Sequence, undecoded: Dict[int, Any], decode: Callable[[Any], Any],
+                 members: Optional[Sequence] = None):
+        """
+        :param values: the decoded values or, if members is set, their positions in members. The values at the
+        undecoded positions are ignored.
+        :param undecoded: the strings that cannot be decoded by position
+        :param decode: the decoding function, called again on the undecoded strings when they are read
+        """
+        self._values = values
+        self._undecoded = undecoded
+        self._decode = decode
+        self._members = members
+
+    @staticmethod
+    def from_strings(strings: Iterable, decode: Callable[[Any], Any]) -> 'DecodedColumn':
+        values = []
+        undecoded = {}
+        for i, string in enumerate(strings):
+            try:
+                values.append(decode(string))
+            except (KeyError, ValueError):
+                values.append(None)
+                undecoded[i] = string
+        return DecodedColumn(values, undecoded, decode)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self._values)
+        if i in self._undecoded:
+            return self._decode(self._undecoded[i])
+        value = self._values[i]
+        return value if self._members is None else self._members[value]
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+class _CompactToken(Token):
+    __slots__ = ('_sentence', '_index')
+
+    def __init__(self, sentence: 'CompactSentence', index: int):
+        self._sentence = sentence
+        self._index = index
+
+    @property
+    def id(self) -> int:
+        return self._index + 1
+
+    @property
+    def ud_pos(self) -> UDPOSTag:
+        return self._sentence._ud_pos[self._index]
+
+    @property
+    def word(self) -> str:
+        return self._sentence._words[self._index]
+
+    @property
+    def lemma(self) -> str:
+        return self._sentence._lemmas[self._index]
+
+    @property
+    def main_ud_dependency(self) -> UDDependency:
+        return self._sentence._dependencies[self._index]
+
+    @property
+    def head(self) -> Optional[Token]:
+        head = self._sentence._heads[self._index]
+        return None if head < 0 else self._sentence._tokens[head]
+
+    @property
+    def left_children(self) -> Sequence[Token]:
+        return self._sentence._left_children[self._index]
+
+    @property
+    def right_children(self) -> Sequence[Token]:
+        return self._sentence._right_children[self._index]
+
+    @property
+    def children(self) -> Sequence[Token]:
+        return self._sentence._children[self._index]
+
+    @property
+    def prev(self) -> Optional[Token]:
+        return self._sentence._tokens[self._index - 1] if self._index > 0 else None
+
+    @property
+    def next(self) -> Optional[Token]:
+        tokens = self._sentence._tokens
+        return tokens[self._index + 1] if self._index + 1 < len(tokens) else None
+
+    @property
+    def subtree(self) -> Sequence[Token]:
+        sentence = self._sentence
+        return sentence._subtree_order[sentence._subtree_starts[self._index]:sentence._subtree_ends[self._index]]
+
+    def __eq__(self, other):
+        if isinstance(other, _CompactToken) and other._sentence is self._sentence:
+            return other._index == self._index or super().__eq__(other)
+        return super().__eq__(other)
+
+    def __hash__(self):
+        return super().__hash__()
+
+
+class CompactSentence(Sentence):
+    """
+    Immutable sentence stored as parallel arrays indexed by token position.
+
+    The children of each token and the span of its subtree in the in-order traversal of the dependency tree are
+    computed once at construction so that the tree accessors of the tokens are slices of precomputed tuples.
+    """
+
+    __slots__ = ('_language_code', '_words', '_lemmas', '_ud_pos', '_dependencies', '_heads', '_root', '_tokens',
+                 '_left_children', '_right_children', '_children', '_subtree_order', '_subtree_starts',
+                 '_subtree_ends')
+
+    def __init__(self, language_code: str, words: Sequence[str], lemmas: Sequence[str], ud_pos: Sequence[UDPOSTag],
+                 dependencies: Sequence[Optional[UDDependency]], heads: Sequence[int], root: Optional[int]):
+        """
+        The given sequences are owned by the sentence and should not be modified afterwards.
+        :param heads: the position of the head of each token or -1 if the token has no head
+        :param root: the position of the root of the dependency tree or None if the parser has not found any
+        """
+        self._language_code = language_code
+        self._words = words
+        self._lemmas = lemmas
+        self._ud_pos = ud_pos
+        self._dependencies = dependencies
+        self._heads = heads
+        self._root = root
+        self._tokens = tuple(_CompactToken(self, i) for i in range(len(self._words)))
+
+        left_children = [[] for _ in self._tokens]
+        right_children = [[] for _ in self._tokens]
+        for i, head in enumerate(self._heads):
+            if head >= 0:
+                (left_children if i < head else right_children)[head].append(i)
+        self._left_children = tuple(tuple(self._tokens[j] for j in children) for children in left_children)
+        self._right_children = tuple(tuple(self._tokens[j] for j in children) for children in right_children)
+        self._children = tuple(left + right for left, right in zip(self._left_children, self._right_children))
+
+        # In-order traversal of the dependency forest: each subtree is a contiguous range
+        order = []
+        starts = [0] * len(self._tokens)
+        ends = [0] * len(self._tokens)
+        visited = [False] * len(self._tokens)
+        for tree_root in range(len(self._tokens)):
+            if self._heads[tree_root] >= 0:
+                continue
+            to_visit = [(tree_root, True)]
+            while to_visit:
+                i, entering = to_visit.pop()
+                if not entering:
+                    if i < 0:
+                        order.append(~i)
+                    else:
+                        ends[i] = len(order)
+                    continue
+                if visited[i]:
+                    continue  # Malformed trees with several paths to the same token
+                visited[i] = True
+                starts[i] = len(order)
+                to_visit.append((i, False))
+                to_visit.extend((j, True) for j in reversed(right_children[i]))
+                to_visit.append((~i, False))
+                to_visit.extend((j, True) for j in reversed(left_children[i]))
+        self._subtree_order = tuple(self._tokens[i] for i in order)
+        self._subtree_starts = tuple(starts)
+        self._subtree_ends = tuple(ends)
+
+    @property
+    def language_code(self) -> str:
+        return self._language_code
+
+    def __getitem__(self, i: int) -> Token:
+        return self._tokens[i]
+
+    def __iter__(self):
+        return iter(self._tokens)
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    @property
+    def root(self) -> Optional[Token]:
+        return None if self._root is None else self._tokens[self._root]
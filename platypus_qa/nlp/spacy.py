@@ -1,86 +1,32 @@
 # coding=utf-8
 from typing import List
-from typing import Optional
 
 import spacy
 from spacy.tokens.span import Span
 
-from platypus_qa.nlp.model import Sentence, Token, NLPParser
+from platypus_qa.nlp.model import Sentence, NLPParser, CompactSentence
 from platypus_qa.nlp.universal_dependencies import UDPOSTag, UDDependency
 
 
-class _SpacyToken(Token):
-    def __init__(self, token):
-        self._token = token
-
-    @property
-    def id(self) -> int:
-        return self._token.i
-
-    @property
-    def ud_pos(self) -> UDPOSTag:
-        return UDPOSTag.from_str(self._token.pos_)
-
-    @property
-    def word(self) -> str:
-        return self._token.text
-
-    @property
-    def lemma(self) -> str:
-        return self._token.lemma_
-
-    @property
-    def main_ud_dependency(self) -> UDDependency:
-        return UDDependency.from_str(self._token.dep_)
-
-    @property
-    def head(self) -> Optional[Token]:
-        return _SpacyToken(self._token.head)
-
-    @property
-    def left_children(self) -> List[Token]:
-        return [_SpacyToken(token) for token in self._token.children if token.i < self._token.i]
-
-    @property
-    def right_children(self) -> List[Token]:
-        return [_SpacyToken(token) for token in self._token.children if token.i > self._token.i]
-
-    @property
-    def prev(self) -> Optional[Token]:
-        return _SpacyToken(self._token.nbor[-1])
-
-    @property
-    def next(self) -> Optional[Token]:
-        return _SpacyToken(self._token.nbor[1])
-
-    @property
-    def language_code(self) -> str:
-        return self._token.lang_
-
-
-class _SpacySentence(Sentence):
-    def __init__(self, span: Span):
-        self._tokens = [_SpacyToken(token) for token in span]
-
-    def __getitem__(self, i: int) -> Token:
-        return self._tokens[i]
-
-    def __iter__(self):
-        return self._tokens.__iter__()
-
-    def __len__(self) -> int:
-        return len(self._tokens)
-
-    @property
-    def root(self):
-        for token in self._tokens:
-            if token.main_ud_dependency == UDDependency.root:
-                return token
-        raise ValueError('Sentence without root')
-
-    @property
-    def language_code(self) -> str:
-        return self.root.language_code
+def _build_sentence(span: Span, language_code: str) -> Sentence:
+    heads = []
+    root = None
+    for token in span:
+        if token.head.i == token.i:  # spaCy roots are their own heads
+            heads.append(-1)
+            if root is None and token.dep_.lower() == 'root':
+                root = token.i - span.start
+        else:
+            heads.append(token.head.i - span.start)
+    return CompactSentence(
+        language_code,
+        [token.text for token in span],
+        [token.lemma_ for token in span],
+        [UDPOSTag.from_str(token.pos_) for token in span],
+        [UDDependency.from_str(token.dep_) for token in span],
+        heads,
+        root
+    )
 
 
 class SpacyParser(NLPParser):
@@ -102,4 +48,5 @@ class SpacyParser(NLPParser):
         if self._models_by_language[language_code] is None or self._models_by_language[language_code].parser is None:
             raise ValueError('{} is not supported yet by Spacy'.format(language_code))
 
-        return [_SpacySentence(sentence) for sentence in self._models_by_language[language_code](text).sents]
+        return [_build_sentence(sentence, language_code)
+                for sentence in self._models_by_language[language_code](text).sents]
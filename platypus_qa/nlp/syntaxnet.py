@@ -18,26 +18,39 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
-import random
+import json
 from functools import lru_cache
-from typing import List
+from typing import List, Optional
 
-import requests
 from requests.packages.urllib3.exceptions import HTTPError
 
+from platypus_qa.backend_pool import BackendPool
+from platypus_qa.cache import DictCache, DummyDictCache
 from platypus_qa.nlp.conllu import CoNLLUParser
-from platypus_qa.nlp.model import NLPParser
+from platypus_qa.nlp.model import NLPParser, normalize_text
 
 
 class SyntaxNetParser(NLPParser):
     _corenllu_parser = CoNLLUParser()
 
-    def __init__(self, server_urls):
+    def __init__(self, server_urls, parse_cache: DictCache = DummyDictCache(), model_version: str = '',
+                 pool_size: int = 16, timeout: Optional[float] = 10):
         """
         :param server_urls: List[str] URLs of servers running SyntaNet
+        :param parse_cache: cache of the parser outputs shared between processes
+        :param model_version: version of the models used by the servers. It should be changed when they are updated
+        in order to not reuse the cached parses.
+        :param pool_size: the maximal number of connections kept open with each server
+        :param timeout: time in seconds after which a server that has not answered is considered failed, None to
+        never time out
         """
-        self._servers = server_urls
-        self._request_session = requests.session()
+        self._servers = BackendPool(server_urls, pool_size=pool_size, timeout=timeout)
+        self._parse_cache = parse_cache
+        self._model_version = model_version
+
+    @property
+    def backend_stats(self) -> dict:
+        return self._servers.stats
 
     @property
     def supported_languages(self) -> List[str]:
@@ -51,13 +64,18 @@ class SyntaxNetParser(NLPParser):
         :param language_code: the text language
         :return: List[Sentence]
         """
-        return self._corenllu_parser.parse(self._do_parse(text, language_code), language_code)
+        return self._corenllu_parser.parse(self._do_parse(normalize_text(text), language_code), language_code)
 
     @lru_cache(maxsize=2048)
     def _do_parse(self, text: str, language_code: str) -> str:
-        server = random.choice(self._servers)
-        response = self._request_session.post(server, data=text.strip('?.:!').encode('utf8'),
-                                              headers={'Content-Language': language_code})
+        cache_key = json.dumps(['syntaxnet', self._model_version, language_code, text])
+        result = self._parse_cache.get(cache_key)
+        if result is not None:
+            return result
+
+        response = self._servers.post(data=text.strip('?.:!').encode('utf8'),
+                                      headers={'Content-Language': language_code})
         if response.status_code != 200:
             raise HTTPError('SyntaxNet server error {}:\n{}'.format(response.status_code, response.text))
+        self._parse_cache.set(cache_key, response.text)
         return response.text
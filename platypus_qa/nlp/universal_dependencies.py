@@ -43,11 +43,17 @@ class UDPOSTag(str, Enum):
 
     @staticmethod
     def from_str(string: str):
+        try:
+            return _pos_tag_by_str[string]
+        except KeyError:
+            pass
         tag = string.upper()
         if tag == 'CONJ':
-            return UDPOSTag.CCONJ
+            result = UDPOSTag.CCONJ
         else:
-            return UDPOSTag[string.upper()]
+            result = UDPOSTag[tag]
+        _pos_tag_by_str[string] = result
+        return result
 
     def __str__(self):
         return self.value
@@ -112,40 +118,59 @@ class UDDependency(Enum):
     nmod_poss = ('nmod', 'poss')  # en, fr
     nmod_tmod = ('nmod', 'tmod')  # en
 
+    # The subsumption relation is precomputed as bit sets after the class creation: self >= other if and only if
+    # self._subsumed & other._bit
     def __ge__(self, other: 'UDDependency'):
-        return len(self.value) <= len(other.value) and self.value == other.value[:len(self.value)]
+        return self._subsumed & other._bit != 0
 
     def __gt__(self, other: 'UDDependency'):
-        return len(self.value) < len(other.value) and self.value == other.value[:len(self.value)]
+        return self._strictly_subsumed & other._bit != 0
 
     def __str__(self):
         return ':'.join(self.value)
 
     @property
     def root_dep(self) -> 'UDDependency':
-        if len(self.value) == 1 is None:
-            return self
-        else:
-            return UDDependency[self.value[0]]
+        return self._root_dep
 
     @staticmethod
     def from_str(string: str):
+        try:
+            return _dependency_by_str[string]
+        except KeyError:
+            pass
         dep = string.lower().replace(':', '_')
-
-        # Mapping from UD 1 to UD 2
-        if dep == 'dobj':
-            return UDDependency.obj
-        elif dep == 'nsubjpass':
-            return UDDependency.nsubj_pass
-        elif dep == 'csubjpass':
-            return UDDependency.csubj_pass
-        elif dep == 'auxpass':
-            return UDDependency.aux_pass
-        elif dep == 'mwe':
-            return UDDependency.fixed
-        elif dep == 'name':
-            return UDDependency.flat_name
-        elif dep == 'foreign':
-            return UDDependency.flat_foreign
-        else:
-            return UDDependency[dep]
+        result = _ud1_dependencies.get(dep) or UDDependency[dep]
+        _dependency_by_str[string] = result
+        return result
+
+
+# Mapping from UD 1 to UD 2
+_ud1_dependencies = {
+    'dobj': UDDependency.obj,
+    'nsubjpass': UDDependency.nsubj_pass,
+    'csubjpass': UDDependency.csubj_pass,
+    'auxpass': UDDependency.aux_pass,
+    'mwe': UDDependency.fixed,
+    'name': UDDependency.flat_name,
+    'foreign': UDDependency.flat_foreign
+}
+
+# Raw tag strings to enum members. Other spellings are added when they are first decoded
+_pos_tag_by_str = {}
+for _tag in UDPOSTag:
+    _pos_tag_by_str[_tag.value] = _tag
+    _pos_tag_by_str[_tag.value.lower()] = _tag
+_pos_tag_by_str['CONJ'] = _pos_tag_by_str['conj'] = UDPOSTag.CCONJ
+
+_dependency_by_str = dict(_ud1_dependencies)
+for _i, _dependency in enumerate(UDDependency):
+    _dependency_by_str[_dependency.name] = _dependency
+    _dependency_by_str[str(_dependency)] = _dependency
+    _dependency._bit = 1 << _i
+    _dependency._root_dep = UDDependency[_dependency.value[0]]
+for _dependency in UDDependency:
+    _dependency._strictly_subsumed = sum(other._bit for other in UDDependency
+                                         if len(_dependency.value) < len(other.value) and
+                                         _dependency.value == other.value[:len(_dependency.value)])
+    _dependency._subsumed = _dependency._strictly_subsumed | _dependency._bit
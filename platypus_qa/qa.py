@@ -19,16 +19,21 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 import logging
-import signal
-from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from concurrent.futures import TimeoutError
-from typing import Iterable, List
+from itertools import groupby
+from typing import Iterable, List, Optional, Sequence, Iterator
 
 import langdetect
 
 from platypus_qa.analyzer.grammatical_analyzer import GrammaticalAnalyzer
 from platypus_qa.database.formula import Term
-from platypus_qa.database.model import KnowledgeBase, QAInterpretation, EvaluationError
+from platypus_qa.database.model import KnowledgeBase, QAInterpretation
+from platypus_qa.deadline import Deadline, DeadlineExceeded, current_deadline, request_timeout
 from platypus_qa.nlp.model import NLPParser
 
 _logger = logging.getLogger('request_handler')
@@ -36,18 +41,72 @@ _logger = logging.getLogger('request_handler')
 PROCESSING_TIMEOUT = 15
 
 
-def safe_limited_response_builder(timeout):
-    def raise_timeout_exception(signum, frame):
-        raise TimeoutError()
+# Maximal number of processes running the functions isolated by safe_limited_response_builder at the same time
+_isolated_processes = threading.BoundedSemaphore(4)
+
+
+def _run_isolated_process(connection, timeout: float, func, args):
+    try:
+        with Deadline(timeout):
+            result = ('result', func(*args))
+    except BaseException as e:
+        result = ('error', e)
+    try:
+        connection.send(result)
+    except Exception as e:  # The exception or the result is not picklable
+        connection.send(('error', RuntimeError(repr(result[1]) if result[0] == 'error' else str(e))))
+    finally:
+        connection.close()
+
+
+def _run_isolated(deadline: Deadline, func, args):
+    """
+    Runs func in a forked process killed at the deadline so that code that never checks its deadline cannot keep
+    running after it
+    """
+    if not _isolated_processes.acquire(timeout=max(deadline.remaining(), 0)):
+        raise DeadlineExceeded('No process available to run {}'.format(func.__name__))
+    try:
+        context = multiprocessing.get_context('fork')
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_run_isolated_process, args=(sender, deadline.remaining(), func, args),
+                                  daemon=True)
+        process.start()
+        sender.close()
+        try:
+            if not receiver.poll(max(deadline.remaining(), 0)):
+                raise DeadlineExceeded('Processing timeout')
+            kind, value = receiver.recv()
+        except EOFError:
+            raise RuntimeError('The process running {} has died'.format(func.__name__))
+        finally:
+            receiver.close()
+            if process.is_alive():
+                process.kill()
+            process.join()
+        if kind == 'error':
+            raise value
+        return value
+    finally:
+        _isolated_processes.release()
+
+
+def safe_limited_response_builder(timeout, isolated: bool = False):
+    """
+    Runs the decorated method under a deadline of timeout seconds. It returns [] on failure.
+    The deadline is only enforced when the method checks it, except if isolated is True: the method is then run in a
+    forked process killed at the deadline. Its arguments do not need to be picklable but its result does.
+    Isolation should be used for the methods that may run a long time without checking their deadline, like
+    computations done by third party libraries.
+    """
 
     def wrapper(func):
         def func_wrapper(self, *args):
             try:
-                signal.signal(signal.SIGALRM, raise_timeout_exception)  # TODO: POSIX only
-                signal.alarm(timeout)
-                result = func(self, *args)
-                signal.alarm(0)
-                return result
+                with Deadline(timeout) as deadline:
+                    if isolated:
+                        return _run_isolated(deadline, func, (self,) + args)
+                    return func(self, *args)
             except KeyboardInterrupt:
                 raise
             except TimeoutError:
@@ -62,36 +121,158 @@ def safe_limited_response_builder(timeout):
     return wrapper
 
 
-class LazyThreadPoolExecutor(ThreadPoolExecutor):
-    def map_first_with_result(self, fn, iterable, condition, default):
-        fs = [self.submit(fn, *args) for args in iterable]
+class SharedExecutor:
+    """
+    Long-lived pool of threads shared by all the requests.
+    Each request should use its own ExecutorBudget in order to bound the number of its tasks running at the same time.
+    """
+
+    def __init__(self, max_workers: int = 16):
+        self._max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+
+    def budget(self, max_concurrency: int = 8) -> 'ExecutorBudget':
+        return ExecutorBudget(self, max_concurrency)
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            self._queued += 1
+        self._executor.submit(self._run, fn, args)
+
+    def _run(self, fn, args):
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        try:
+            fn(*args)
+        finally:
+            with self._lock:
+                self._active -= 1
 
-        def result_iterator():
-            try:
-                for future in fs:
-                    result = future.result()
-                    if condition(result):
-                        return result
-                return default
-            finally:
-                for future in fs:
-                    future.cancel()
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {'max_workers': self._max_workers, 'queue_depth': self._queued, 'active_workers': self._active}
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+class ExecutorBudget:
+    """
+    Tasks of a request executed by a SharedExecutor with at most max_concurrency of them running at the same time.
+    When the budget is closed, the tasks that are not running yet are cancelled and never run.
+    The tasks are run with the deadline active when they have been submitted.
+    """
+
+    def __init__(self, executor: SharedExecutor, max_concurrency: int):
+        self._executor = executor
+        self._max_concurrency = max(1, max_concurrency)
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._futures = []
+        self._running = 0
+        self._closed = False
+
+    def submit(self, fn, *args) -> Future:
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Cannot submit a task to a closed budget')
+            self._pending.append((future, current_deadline(), fn, args))
+            self._futures.append(future)
+        self._dispatch()
+        return future
 
-        return result_iterator()
+    def map_first_with_result(self, fn, iterable, condition, default):
+        fs = [self.submit(fn, *args) for args in iterable]
+        try:
+            for future in fs:
+                result = future.result()
+                if condition(result):
+                    return result
+            return default
+        finally:
+            for future in fs:
+                future.cancel()
+
+    def _dispatch(self):
+        to_start = []
+        with self._lock:
+            while self._pending and self._running < self._max_concurrency:
+                to_start.append(self._pending.popleft())
+                self._running += 1
+        for task in to_start:
+            self._executor._submit(self._run, *task)
+
+    def _run(self, future: Future, deadline: Optional[Deadline], fn, args):
+        try:
+            # The future is cancelled if the budget has been closed while the task was queued
+            if future.set_running_or_notify_cancel():
+                try:
+                    if deadline is None:
+                        result = fn(*args)
+                    else:
+                        with deadline:
+                            deadline.check()
+                            result = fn(*args)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+        finally:
+            with self._lock:
+                self._running -= 1
+            self._dispatch()
+
+    def close(self):
+        """
+        Cancels all the tasks that are not running yet
+        """
+        with self._lock:
+            self._closed = True
+            self._pending.clear()
+            futures = self._futures
+            self._futures = []
+        for future in futures:
+            future.cancel()
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.shutdown(wait=False)
+        self.close()
         return False
 
 
 class QAHandler:
-    def __init__(self, parsers: List[NLPParser], knowledge_base: KnowledgeBase, all_interpretations: bool = False):
+    def __init__(self, parsers: List[NLPParser], knowledge_base: KnowledgeBase, all_interpretations: bool = False,
+                 executor: Optional[SharedExecutor] = None, request_concurrency: int = 8,
+                 parser_hedging_delays: Optional[Sequence[float]] = None,
+                 parsing_executor: Optional[SharedExecutor] = None):
+        """
+        :param executor: executor shared by the handlers of the application. A new one is created if it is not set.
+        :param request_concurrency: maximal number of knowledge base tasks running at the same time for a question.
+        :param parser_hedging_delays: if set, the parsers are run concurrently. The i-th parser is started
+        parser_hedging_delays[i] seconds after the question is received (the last delay is used for the following
+        parsers) or as soon as all the previous parsers have failed. The result of a parser is only used if all the
+        parsers before it have failed. answer_iter does not hedge and always runs the parsers one after the other.
+        :param parsing_executor: executor shared by the handlers of the application running the hedged parsers.
+        It must not be the same as executor: the parsing tasks wait for the knowledge base tasks. A new one is created
+        if it is not set and parser_hedging_delays is set.
+        """
         self._parsers = parsers
         self._knowledge_base = knowledge_base
         self._all_interpretations = all_interpretations
+        self._executor = executor if executor is not None else SharedExecutor()
+        self._request_concurrency = request_concurrency
+        self._parser_hedging_delays = parser_hedging_delays
+        if parsing_executor is None and parser_hedging_delays is not None:
+            parsing_executor = SharedExecutor()
+        self._parsing_executor = parsing_executor
 
     @property
     def knowledge_base(self) -> KnowledgeBase:
@@ -105,12 +286,50 @@ class QAHandler:
         """
         language_code = self._clean_language_code(language_code, question)
 
+        if self._parser_hedging_delays is not None:
+            return self._answer_with_hedging(question, language_code)
+
         for parser in self._parsers:
             results = self._do_with_grammatical_analysis(parser, question, language_code)
             if results:
                 return results
         return []
 
+    def _answer_with_hedging(self, question: str, language_code: str) -> List[QAInterpretation]:
+        parsers = [parser for parser in self._parsers if language_code in parser.supported_languages]
+        start = time.monotonic()
+        with Deadline(PROCESSING_TIMEOUT) as deadline, self._parsing_executor.budget(len(parsers)) as budget:
+            futures = []
+            try:
+                while True:
+                    for future in futures:
+                        if not future.done():
+                            break
+                        if future.exception() is None and future.result():
+                            return future.result()
+                    else:
+                        # All the started parsers have failed
+                        if len(futures) == len(parsers):
+                            return []
+                        futures.append(budget.submit(
+                            self._do_with_grammatical_analysis, parsers[len(futures)], question, language_code))
+                        continue
+
+                    elapsed = time.monotonic() - start
+                    while len(futures) < len(parsers) and self._hedging_delay(len(futures)) <= elapsed:
+                        futures.append(budget.submit(
+                            self._do_with_grammatical_analysis, parsers[len(futures)], question, language_code))
+                    timeout = self._hedging_delay(len(futures)) - elapsed if len(futures) < len(parsers) else None
+                    wait([future for future in futures if not future.done()], timeout, FIRST_COMPLETED)
+            finally:
+                # Stops the parsers that are still running
+                deadline.cancel()
+
+    def _hedging_delay(self, parser_position: int) -> float:
+        if not self._parser_hedging_delays:
+            return 0
+        return self._parser_hedging_delays[min(parser_position, len(self._parser_hedging_delays) - 1)]
+
     @staticmethod
     def _clean_language_code(language_code: str, text: str):
         if language_code == 'und':
@@ -121,30 +340,87 @@ class QAHandler:
     def _do_with_grammatical_analysis(self, parser: NLPParser, question: str, language_code: str):
         if language_code not in parser.supported_languages:
             return []
-        return self._do_with_terms(
-            GrammaticalAnalyzer(parser, self._knowledge_base, language_code).analyze(question)
-        )
+        # We only consider more individuals if the most relevant ones do not lead to any answer
+        for limit in self._knowledge_base.individuals_limits():
+            analyzer = GrammaticalAnalyzer(parser, self._knowledge_base, language_code, limit)
+            results = self._do_with_terms(analyzer.analyze(question))
+            if results or not analyzer.individuals_pruned:
+                return results
+        return []
 
     def _do_with_terms(self, parsed_terms: Iterable[Term]):
-        parsed_terms = list(sorted(parsed_terms, key=lambda term: -term.score))
+        interpretations = []
+        tiers = self._iter_tiers_with_terms(parsed_terms)
+        try:
+            for tier_interpretations in tiers:
+                interpretations.extend(tier_interpretations)
+                if interpretations and not self._all_interpretations:
+                    return interpretations
+            return interpretations
+        finally:
+            # Cancels the evaluation of the next tiers now instead of when the generator is garbage collected
+            tiers.close()
 
-        with LazyThreadPoolExecutor(max_workers=8) as executor:
-            futures = [executor.submit(self._knowledge_base.build_interpretation, term) for term in parsed_terms]
-            interpretations = []
-            max_score = 0
-            for future in futures:
-                try:
-                    interpretation = future.result()
-                    if not interpretation.results:
-                        continue
+    def _iter_tiers_with_terms(self, parsed_terms: Iterable[Term]) -> Iterator[List[QAInterpretation]]:
+        """
+        :return: the interpretations with results of each tier of terms with the same score, the best tier first
+        """
+        # Terms with the same score are evaluated together in order to allow the knowledge base to batch them
+        tiers = [list(tier) for _, tier in
+                 groupby(sorted(parsed_terms, key=lambda term: -term.score), key=lambda term: term.score)]
 
-                    if not self._all_interpretations:
-                        if interpretation.interpretation.score < max_score:
-                            return interpretations
-                        max_score = interpretation.interpretation.score
+        with self._executor.budget(self._request_concurrency) as budget:
+            futures = [budget.submit(self._knowledge_base.build_interpretations, tier) for tier in tiers]
+            for future in futures:
+                yield [interpretation for interpretation in future.result(request_timeout())
+                       if interpretation.results]
 
-                    interpretations.append(interpretation)
-                except EvaluationError as e:
-                    _logger.warning(e)
+    def answer_iter(self, question: str, language_code: str = 'und') -> Iterator[QAInterpretation]:
+        """
+        Same as answer but returns the interpretations as soon as they are evaluated, the best ones first.
+        The parsers are always run one after the other: parser_hedging_delays is ignored because the interpretations
+        of a parser may already have been returned when a parser before it succeeds.
+        """
+        language_code = self._clean_language_code(language_code, question)
 
-            return interpretations
+        for parser in self._parsers:
+            found = False
+            for interpretation in self._iter_with_grammatical_analysis(parser, question, language_code):
+                found = True
+                yield interpretation
+            if found:
+                return
+
+    def _iter_with_grammatical_analysis(self, parser: NLPParser, question: str,
+                                        language_code: str) -> Iterator[QAInterpretation]:
+        if language_code not in parser.supported_languages:
+            return
+        # The deadline is only active while processing: the consumer code run between two yields should not see it
+        deadline = Deadline(PROCESSING_TIMEOUT)
+        tiers = None
+        try:
+            for limit in self._knowledge_base.individuals_limits():
+                analyzer = GrammaticalAnalyzer(parser, self._knowledge_base, language_code, limit)
+                with deadline:
+                    tiers = self._iter_tiers_with_terms(analyzer.analyze(question))
+                found = False
+                while True:
+                    with deadline:
+                        interpretations = next(tiers, None)
+                    if interpretations is None:
+                        break
+                    yield from interpretations
+                    found = found or bool(interpretations)
+                    if found and not self._all_interpretations:
+                        return
+                if found or not analyzer.individuals_pruned:
+                    return
+        except TimeoutError:
+            _logger.warning('Processing timout')
+        except Exception as e:
+            _logger.warning(e, exc_info=True)
+        finally:
+            # Stops the evaluations still running if the consumer does not want more interpretations
+            deadline.cancel()
+            if tiers is not None:
+                tiers.close()
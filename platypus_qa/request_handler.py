@@ -20,21 +20,21 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import logging
 import time
-from concurrent.futures import Future, TimeoutError
-from typing import Union, Iterable, List, Optional
+from concurrent.futures import Future, TimeoutError, ThreadPoolExecutor
+from typing import Union, Iterable, List, Optional, Iterator
 
 from calchas_polyparser import is_math, parse_natural, is_interesting, relevance, parse_mathematica, parse_latex, IsMath
 from calchas_sympy import Translator
 from flask import current_app, request, jsonify
-from pyld import jsonld
 from sympy import latex
 from werkzeug.exceptions import NotFound
 
-from platypus_qa import FormatterError, WikidataKnowledgeBase, QAHandler
+from platypus_qa import WikidataKnowledgeBase, QAHandler, QAInterpretation
 from platypus_qa.analyzer.disambiguation import DisambiguationStep, find_process
 from platypus_qa.database.formula import Term, ValueFormula
+from platypus_qa.jsonld_compactor import JsonLdCompactor
 from platypus_qa.logs import DictLogger
-from platypus_qa.qa import safe_limited_response_builder, LazyThreadPoolExecutor
+from platypus_qa.qa import safe_limited_response_builder, SharedExecutor
 
 _logger = logging.getLogger('request_handler')
 
@@ -56,6 +56,7 @@ _platypus_context = {
         '@type': 'xsd:string'
     }
 }
+_platypus_compactor = JsonLdCompactor(_platypus_context)
 
 
 def _first_future_with_cond(futures: List[Future], condition, default, timeout=None):
@@ -83,38 +84,115 @@ class RequestHandler:
         results = self._do_cas(question)
         if not results:
             interpretations = self._qa_handler.answer(question, language_code)
-            results = []
-            existing_results = set()
-            for interpretation in interpretations:
-                for result in interpretation.results:
-                    if result.result in existing_results:
-                        continue
-                    existing_results.add(result.result)
-                    try:
-                        results.append({
-                            'result': self._qa_handler.knowledge_base.format_to_jsonld(result, accept_language),
-                            'resultScore': interpretation.interpretation.score / 100,
-                            'platypus:term': str(interpretation.interpretation)
-                        })
-                    except FormatterError as e:
-                        _logger.warning(e)
+            results = list(self._format_results(interpretations, set(), accept_language))
 
+        self._log_request(question, language_code, bool(results), timestamp)
+
+        return _platypus_compactor.compact_collection(results)
+
+    def ask_stream(self, question: str, language_code: str, accept_language: Optional[str]) -> Iterator[dict]:
+        """
+        Same as ask but yields the compacted results one by one as soon as the interpretations are evaluated
+        """
+        timestamp = time.time()
+        with_results = False
+        try:
+            results = self._do_cas(question)
+            if results:
+                formatted_results = iter(results)
+            else:
+                existing_results = set()
+                formatted_results = (formatted_result
+                                     for interpretation in self._qa_handler.answer_iter(question, language_code)
+                                     for formatted_result in
+                                     self._format_results([interpretation], existing_results, accept_language))
+            for formatted_result in formatted_results:
+                with_results = True
+                yield _platypus_compactor.compact(formatted_result)
+        finally:
+            self._log_request(question, language_code, with_results, timestamp)
+
+    def _format_results(self, interpretations: List[QAInterpretation], existing_results: set,
+                        accept_language: Optional[str]) -> Iterator[dict]:
+        # All the results are formatted together in order to allow the knowledge base to fetch them in parallel
+        results = []
+        for interpretation in interpretations:
+            for result in interpretation.results:
+                if result.result in existing_results:
+                    continue
+                existing_results.add(result.result)
+                results.append((interpretation, result))
+        formatted_results = self._qa_handler.knowledge_base.format_all_to_jsonld(
+            [result for _, result in results], accept_language)
+        for (interpretation, _), formatted_result in zip(results, formatted_results):
+            if formatted_result is not None:
+                yield {
+                    'result': formatted_result,
+                    'resultScore': interpretation.interpretation.score / 100,
+                    'platypus:term': str(interpretation.interpretation)
+                }
+
+    def _log_request(self, question: str, language_code: str, with_results: bool, timestamp: float):
         self._request_logger.log({
             'question': question,
             'language': language_code,
-            'with_results': bool(results),
+            'with_results': with_results,
             'timestamp': timestamp,
             'answer_time': time.time() - timestamp
         })
 
-        return jsonld.compact({
-            '@context': _platypus_context,
-            '@type': 'hydra:Collection',
-            'totalItems': len(results),
-            'member': results
-        }, _platypus_context)
+    def ask_batch(self, questions: Iterable[dict], accept_language: Optional[str], max_workers: int = 8,
+                  chunk_size: int = 1024) -> Iterator[dict]:
+        """
+        Answers a stream of questions serialized like {"q": "question", "lang": "en"} ("lang" is optional).
+        The questions are read by chunks of chunk_size. Inside a chunk, identical questions are answered only once
+        and the questions are submitted ordered by language to max_workers threads, so that the questions of a language
+        are processed close together and share the parse and knowledge base caches. There is no other batching.
+        If the returned iterator is closed before its end (e.g. the client is gone), the questions not started yet are
+        cancelled and the method returns without waiting for the running ones.
+        :return: an iterator on {"q": ..., "lang": ..., "answer": ...} in the same order as questions, with "error"
+        instead of "answer" if the question is invalid
+        """
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            chunk = []
+            for question in questions:
+                chunk.append(question)
+                if len(chunk) >= chunk_size:
+                    yield from self._ask_chunk(chunk, accept_language, executor)
+                    chunk = []
+            yield from self._ask_chunk(chunk, accept_language, executor)
+        finally:
+            executor.shutdown(wait=False)
+
+    def _ask_chunk(self, chunk: List[dict], accept_language: Optional[str], executor: ThreadPoolExecutor):
+        keys = []
+        for question in chunk:
+            if isinstance(question, dict) and isinstance(question.get('q'), str):
+                keys.append((question['q'], question.get('lang', 'und')))
+            else:
+                keys.append(None)
+        futures = {}
+        try:
+            # The sort is stable: the questions of a language are submitted in the chunk order
+            for key in sorted((key for key in keys if key is not None), key=lambda key: key[1]):
+                if key not in futures:
+                    futures[key] = executor.submit(self.ask, key[0], key[1], accept_language)
+            for question, key in zip(chunk, keys):
+                if key is None:
+                    yield {'error': 'Invalid question: {}'.format(question)}
+                    continue
+                try:
+                    result = {'q': key[0], 'lang': key[1], 'answer': futures[key].result()}
+                except Exception as e:
+                    _logger.warning(e, exc_info=True)
+                    result = {'q': key[0], 'lang': key[1], 'error': str(e)}
+                yield result
+        finally:
+            for future in futures.values():
+                future.cancel()
 
-    @safe_limited_response_builder(5)
+    @safe_limited_response_builder(5, isolated=True)
     def _do_cas(self, question: str):
         math_notation = is_math(question)
         if math_notation == IsMath.No:
@@ -169,9 +247,12 @@ class SimpleWikidataSparqlHandler:
 
 
 class DisambiguatedWikidataSparqlHandler:
-    def __init__(self, qa_handler: QAHandler, knowledge_base: WikidataKnowledgeBase):
+    def __init__(self, qa_handler: QAHandler, knowledge_base: WikidataKnowledgeBase,
+                 executor: Optional[SharedExecutor] = None, request_concurrency: int = 8):
         self._qa_handler = qa_handler
         self._knowledge_base = knowledge_base
+        self._executor = executor if executor is not None else SharedExecutor()
+        self._request_concurrency = request_concurrency
 
     def build_sparql(self):
         question = request.args['q']
@@ -181,8 +262,8 @@ class DisambiguatedWikidataSparqlHandler:
 
         # TODO: sorting
         disambiguation_tree = find_process(sorted(parsed_terms, key=lambda term: -term.score))
-        with LazyThreadPoolExecutor(max_workers=8) as executor:
-            return jsonify(self._serialize_disambiguation_tree(disambiguation_tree, executor))
+        with self._executor.budget(self._request_concurrency) as budget:
+            return jsonify(self._serialize_disambiguation_tree(disambiguation_tree, budget))
 
     def _serialize_disambiguation_tree(self, disambiguation_tree: Union[DisambiguationStep, Iterable[Term]], executor):
         if isinstance(disambiguation_tree, DisambiguationStep):
@@ -18,7 +18,7 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from platypus_qa.database.formula import Select, VariableFormula, TripleFormula, ValueFormula, EqualityFormula
 from platypus_qa.database.model import KnowledgeBase
@@ -35,12 +35,15 @@ class SimpleKnowledgeBase(KnowledgeBase):
         self._properties_by_label = properties_by_label
         self._type_properties = type_properties
 
-    def individuals_from_label(self, label: str, language_code: str, type_filter: Class = owl_Thing) -> List[Select]:
+    def individuals_from_label(self, label: str, language_code: str, type_filter: Class = owl_Thing,
+                               limit: Optional[int] = None) -> List[Select]:
         if label not in self._individuals_by_label:
             return []
         individuals = self._individuals_by_label[label]
         if type_filter != owl_Thing:
             individuals = [individual for individual in individuals if type in individual.types]
+        if limit is not None:
+            individuals = individuals[:limit]
         return [Select(_s, EqualityFormula(_s, ValueFormula(individual, label))) for individual in individuals]
 
     def relations_from_label(self, label: str, language_code: str) -> List[Select]:
@@ -0,0 +1,77 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+
+from platypus_qa.database.entity_cache import EntityCache, language_chain
+
+_douglas_adams = {
+    '@id': 'wd:Q42',
+    '@type': 'Person',
+    'name': [{'@value': 'Douglas Adams', '@language': 'en'}, {'@value': 'Douglas Adams', '@language': 'fr'}],
+    'description': {'@value': 'écrivain', '@language': 'fr'},
+    'birthDate': '1952-03-11'
+}
+
+
+class LanguageChainTest(unittest.TestCase):
+    def testLanguageChain(self):
+        self.assertEqual(('en',), language_chain('en-US,en;q=0.9'))
+        self.assertEqual(('en',), language_chain('en-GB,en;q=0.8'))
+        self.assertEqual(('fr', 'en', 'pt-br'), language_chain('en;q=0.5, fr-FR, pt-BR;q=0.2, de;q=0, *'))
+        self.assertEqual((), language_chain(None))
+
+
+class EntityCacheTest(unittest.TestCase):
+    def testSharedBetweenLanguageChains(self):
+        cache = EntityCache()
+        self.assertIsNone(cache.get('wd:Q42', ('fr', 'en')))
+        self.assertEqual({
+            '@id': 'wd:Q42',
+            '@type': 'Person',
+            'name': {'@value': 'Douglas Adams', '@language': 'fr'},
+            'description': {'@value': 'écrivain', '@language': 'fr'},
+            'birthDate': '1952-03-11'
+        }, cache.add('wd:Q42', ('fr', 'en'), _douglas_adams))
+        self.assertIsNotNone(cache.get('wd:Q42', ('fr', 'en')))
+        self.assertIsNotNone(cache.get('wd:Q42', ('fr',)))
+        self.assertIsNone(cache.get('wd:Q42', ('en',)))  # The English values are not complete
+
+        cache.add('wd:Q42', ('en',), {'@id': 'wd:Q42', 'name': 'Douglas Adams', 'description': 'writer'})
+        self.assertEqual('writer', cache.get('wd:Q42', ('en', 'fr'))['description'])
+        self.assertEqual({'@value': 'écrivain', '@language': 'fr'}, cache.get('wd:Q42', ('fr', 'en'))['description'])
+        self.assertEqual({'hits': 4, 'misses': 2, 'entities': 1}, {key: value for key, value in cache.stats.items()
+                                                                   if key != 'size'})
+
+    def testFallbackToOtherLanguages(self):
+        cache = EntityCache()
+        cache.add('wd:Q42', ('de',), {'@id': 'wd:Q42', 'name': {'@value': 'Douglas Adams', '@language': 'en'}})
+        self.assertEqual({'@value': 'Douglas Adams', '@language': 'en'}, cache.get('wd:Q42', ('de',))['name'])
+
+    def testEviction(self):
+        cache = EntityCache(max_size=200)
+        for i in range(10):
+            cache.add('wd:Q{}'.format(i), ('en',), {'@id': 'wd:Q{}'.format(i), 'name': 'entity {}'.format(i)})
+            cache.get('wd:Q0', ('en',))
+        self.assertLessEqual(cache.stats['size'], 200)
+        self.assertIsNotNone(cache.get('wd:Q0', ('en',)))
+        self.assertIsNotNone(cache.get('wd:Q9', ('en',)))
+        self.assertIsNone(cache.get('wd:Q1', ('en',)))
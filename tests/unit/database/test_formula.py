@@ -18,6 +18,7 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import pickle
 import unittest
 
 from platypus_qa.database.formula import *
@@ -109,6 +110,13 @@ class _FormulaTest(unittest.TestCase):
         self.assertEqual(Type.bottom(),
                          Type.tuple(Type.from_entity(schema_Person), Type.from_entity(xsd_string))[2])
 
+    def testTypeInterning(self):
+        person_or_string = Type.from_entity(schema_Person) | Type.from_entity(xsd_string)
+        self.assertIs(person_or_string, Type.from_entity(xsd_string) | Type.from_entity(schema_Person))
+        self.assertIs(Type.from_entity(schema_Person), person_or_string & Type.from_entity(owl_NamedIndividual))
+        self.assertIs(Type.bottom(), Type.from_entity(schema_Person) & Type.from_entity(xsd_string))
+        self.assertIs(person_or_string, pickle.loads(pickle.dumps(person_or_string)))
+
     def testValueFormula(self):
         self.assertEqual(Type.from_entity(schema_Person),
                          ValueFormula(NamedIndividual('wd:Q42', (schema_Person,))).type)
@@ -176,6 +184,17 @@ class _FormulaTest(unittest.TestCase):
             EqualityFormula(_y, _y) & (TripleFormula(_x, _schema_name, _foo) | TripleFormula(_x, _schema_name, _bar))
         )
 
+    def testAndFormulaFactored(self):
+        variables = [VariableFormula('v{}'.format(i)) for i in range(3)]
+        disjunctions = [OrFormula([EqualityFormula(variable, ValueFormula(XSDDecimalLiteral(Decimal(i))))
+                                   for i in range(5)]) for variable in variables]
+        statistics = dnf_statistics()
+        formula = AndFormula(disjunctions + [TripleFormula(_x, _schema_name, variables[0])])
+        self.assertIsInstance(formula, AndFormula)
+        self.assertEqual(4, len(formula.args))
+        self.assertEqual(statistics.get('factored', 0) + 1, dnf_statistics()['factored'])
+        self.assertIsInstance(AndFormula(disjunctions[:2]), OrFormula)
+
     def testOrFormula(self):
         self.assertEqual(false_formula, OrFormula([]))
         self.assertEqual(true_formula, AndFormula([true_formula]))
@@ -248,6 +267,19 @@ class _FormulaTest(unittest.TestCase):
 
         self.assertEqual(false_formula, ExistsFormula(_x, EqualityFormula(_x, _foo) & EqualityFormula(_x, _false)))
 
+    def testCachedValues(self):
+        formula = ExistsFormula(_y, TripleFormula(_y, _schema_name, _x) & TripleFormula(_y, _schema_name, _foo))
+        self.assertIsInstance(formula, ExistsFormula)
+        self.assertIs(formula.type, formula.type)
+        self.assertIs(formula._variables_types(), formula._variables_types())
+        self.assertEqual(hash(formula), hash(formula.substitute(_y, _y)))
+        z = VariableFormula('z')
+        self.assertEqual(hash(Select(_x, formula)), hash(Select(z, formula.substitute(_x, z))))
+        self.assertEqual(Select(_x, formula), Select(z, formula.substitute(_x, z)))
+        self.assertNotEqual(formula, formula.substitute(_x, _bar))
+        with self.assertRaises(AttributeError):
+            formula.foo = 'bar'
+
     def testTripleFormula(self):
         self.assertEqual(false_formula, TripleFormula(_0, _schema_name, _foo))
         self.assertEqual(false_formula, TripleFormula(_JohnDoe, _1, _foo))
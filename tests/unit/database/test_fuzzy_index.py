@@ -0,0 +1,46 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+
+import editdistance
+
+from platypus_qa.database.fuzzy_index import BKTree
+
+_words = ['capital', 'capitals', 'capita', 'population', 'birth', 'birth date', 'date of birth', 'bird', 'bith',
+          'author', 'authors', 'autor', 'mother', 'father', 'brother', 'a', 'ab', '']
+
+
+class BKTreeTest(unittest.TestCase):
+    def testSearch(self):
+        tree = BKTree(_words)
+        for word in ['capital', 'birth', 'author', 'motter', 'foo', 'a', '']:
+            for max_distance in range(0, 4):
+                expected = {ref: editdistance.eval(word, ref) for ref in _words
+                            if editdistance.eval(word, ref) <= max_distance}
+                self.assertEqual(expected, tree.search(word, max_distance))
+
+    def testEmpty(self):
+        self.assertEqual({}, BKTree().search('foo', 2))
+
+    def testDuplicates(self):
+        tree = BKTree(['foo', 'foo'])
+        self.assertEqual({'foo': 0}, tree.search('foo', 0))
@@ -18,14 +18,19 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import os
+import tempfile
+import threading
 import unittest
 from decimal import Decimal
 
+from platypus_qa.cache import DictCache
 from platypus_qa.database.formula import Select, VariableFormula, EqualityFormula, ValueFormula, TripleFormula, \
-    ExistsFormula, ZeroOrMorePathFormula
+    ExistsFormula, ZeroOrMorePathFormula, OrFormula
+from platypus_qa.database.model import QAInterpretationResult
 from platypus_qa.database.owl import RDFLangStringLiteral, XSDDecimalLiteral, XSDIntegerLiteral, rdf_langString, \
     DatatypeProperty, xsd_decimal, ObjectProperty, owl_NamedIndividual, NamedIndividual
-from platypus_qa.database.wikidata import _WikidataQuerySparqlBuilder
+from platypus_qa.database.wikidata import _WikidataQuerySparqlBuilder, WikidataKnowledgeBase, _RelationsVocabulary
 
 _x = VariableFormula('x')
 _y = VariableFormula('y')
@@ -43,31 +48,31 @@ _P4 = ValueFormula(DatatypeProperty('http://www.wikidata.org/prop/direct/P4', ow
 
 _sparql_to_tree = [
     (
-        'SELECT DISTINCT ?x WHERE {\n\tBIND(wd:Q2 AS ?x)\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
+        'SELECT DISTINCT ?x ?sitelinksCount WHERE {\n\tBIND(wd:Q2 AS ?x)\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
         Select(_x, EqualityFormula(_x, _Q2))
     ),
     (
-        'SELECT DISTINCT ?x WHERE {\n\t{\n\t\tBIND("foo"@fr AS ?x)\n\t} UNION {\n\t\tBIND(wd:Q2 AS ?x)\n\t}\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
+        'SELECT DISTINCT ?x ?sitelinksCount WHERE {\n\tVALUES ?x { "foo"@fr wd:Q2 }\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
         Select(_x, EqualityFormula(_x, _foo) | EqualityFormula(_x, _Q2))
     ),
     (
-        'SELECT DISTINCT ?x WHERE {\n\t?x wdt:P2 wd:Q2 .\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
+        'SELECT DISTINCT ?x ?sitelinksCount WHERE {\n\t?x wdt:P2 wd:Q2 .\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
         Select(_x, TripleFormula(_x, _P2, _Q2))
     ),
     (
-        'SELECT DISTINCT ?x WHERE {\n\twd:Q2 wdt:P2 ?x .\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
+        'SELECT DISTINCT ?x ?sitelinksCount WHERE {\n\twd:Q2 wdt:P2 ?x .\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
         Select(_x, TripleFormula(_Q2, _P2, _x))
     ),
     (
-        'SELECT DISTINCT ?x WHERE {\n\t?x wdt:P3 "foo"@fr .\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
+        'SELECT DISTINCT ?x ?sitelinksCount WHERE {\n\t?x wdt:P3 "foo"@fr .\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
         Select(_x, TripleFormula(_x, _P3, _foo))
     ),
     (
-        'SELECT DISTINCT ?x WHERE {\n\t{\n\t\twd:Q2 wdt:P2 ?x .\n\t} UNION {\n\t\twd:Q2 wdt:P3 ?x .\n\t}\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
+        'SELECT DISTINCT ?x ?sitelinksCount WHERE {\n\t{\n\t\twd:Q2 wdt:P2 ?x .\n\t} UNION {\n\t\twd:Q2 wdt:P3 ?x .\n\t}\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
         Select(_x, TripleFormula(_Q2, _P2, _x) | TripleFormula(_Q2, _P3, _x))
     ),
     (
-        'SELECT DISTINCT ?x WHERE {\n\t{\n\t\twd:Q2 wdt:P2 ?x .\n\t} UNION {\n\t\twd:Q2 wdt:P3 ?x .\n\t}\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
+        'SELECT DISTINCT ?x ?sitelinksCount WHERE {\n\t{\n\t\twd:Q2 wdt:P2 ?x .\n\t} UNION {\n\t\twd:Q2 wdt:P3 ?x .\n\t}\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
         Select(_x, ExistsFormula(_y, (TripleFormula(_y, _P2, _x) | TripleFormula(_y, _P3, _x)) &
                                  EqualityFormula(_y, _Q2)))
     ),
@@ -76,7 +81,7 @@ _sparql_to_tree = [
         Select(_x, ExistsFormula(_y, TripleFormula(_Q2, _P4, _y) & EqualityFormula(_x, _2 * _y - _1)))
     ),
     (
-        'SELECT DISTINCT ?x WHERE {\n\tFILTER(?y < ?z)\n\twd:Q2 wdt:P4 ?y .\n\twd:Q3 wdt:P4 ?z .\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
+        'SELECT DISTINCT ?x ?sitelinksCount WHERE {\n\tFILTER(?y < ?z)\n\twd:Q2 wdt:P4 ?y .\n\twd:Q3 wdt:P4 ?z .\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
         Select(_x, ExistsFormula(_y, ExistsFormula(_z, TripleFormula(_Q2, _P4, _y) & TripleFormula(_Q3, _P4, _z) & (
             _y < _z))))
     ),
@@ -89,19 +94,19 @@ _sparql_to_tree = [
         Select(_x, EqualityFormula(_x, ValueFormula(XSDIntegerLiteral(1))))
     ),
     (
-        'SELECT DISTINCT ?s ?p ?x WHERE {\n\t?s ?p ?x .\n\tBIND(wd:Q2 AS ?s)\n\tBIND(wdt:P3 AS ?p)\n\tOPTIONAL { ?s wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
+        'SELECT DISTINCT ?s ?p ?x ?sitelinksCount WHERE {\n\t?s ?p ?x .\n\tBIND(wd:Q2 AS ?s)\n\tBIND(wdt:P3 AS ?p)\n\tOPTIONAL { ?s wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
         Select((_s, _p, _x), TripleFormula(_s, _p, _x) & EqualityFormula(_s, _Q2) & EqualityFormula(_p, _P3))
     ),
     (
-        'SELECT DISTINCT ?x WHERE {\n\t?x wdt:P3 wd:Q2 .\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
+        'SELECT DISTINCT ?x ?sitelinksCount WHERE {\n\t?x wdt:P3 wd:Q2 .\n\tOPTIONAL { ?x wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
         Select(_x, TripleFormula(_x, _P3, _Q2))
     ),
     (
-        'SELECT DISTINCT ?s ?p ?x WHERE {\n\t?s ?p ?x .\n\tBIND(wdt:P3 AS ?p)\n\twd:Q2 wdt:P2 ?s .\n\tOPTIONAL { ?s wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
+        'SELECT DISTINCT ?s ?p ?x ?sitelinksCount WHERE {\n\t?s ?p ?x .\n\tBIND(wdt:P3 AS ?p)\n\twd:Q2 wdt:P2 ?s .\n\tOPTIONAL { ?s wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
         Select((_s, _p, _x), TripleFormula(_s, _p, _x) & EqualityFormula(_p, _P3) & TripleFormula(_Q2, _P2, _s))
     ),
     (
-        'SELECT DISTINCT ?s ?p ?x WHERE {\n\t{\n\t\t?s ?p ?x .\n\t\tBIND(wdt:P3 AS ?p)\n\t} UNION {\n\t\t?s ?p ?x .\n\t\tBIND(wdt:P4 AS ?p)\n\t}\n\tOPTIONAL { ?s wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
+        'SELECT DISTINCT ?s ?p ?x ?sitelinksCount WHERE {\n\t{\n\t\t?s ?p ?x .\n\t\tBIND(wdt:P3 AS ?p)\n\t} UNION {\n\t\t?s ?p ?x .\n\t\tBIND(wdt:P4 AS ?p)\n\t}\n\tOPTIONAL { ?s wikibase:sitelinks ?sitelinksCount . }\n} ORDER BY DESC(?sitelinksCount) LIMIT 100',
         Select((_s, _p, _x), (TripleFormula(_s, _p, _x) & EqualityFormula(_p, _P3)) |
                (TripleFormula(_s, _p, _x) & EqualityFormula(_p, _P4))),
     ),
@@ -122,3 +127,272 @@ class _WikidataQuerySparqlBuilderTest(unittest.TestCase):
     def testBuild(self):
         for (sparql, tree) in _sparql_to_tree:
             self.assertEqual(sparql, self._builder.build(tree))
+
+    def testBuildValues(self):
+        items = [ValueFormula(NamedIndividual('http://www.wikidata.org/entity/Q{}'.format(i))) for i in range(100)]
+        term = Select(_x, ExistsFormula(_y, OrFormula([EqualityFormula(_y, item) for item in items]) &
+                                        TripleFormula(_y, _P2, _x)))
+        self.assertEqual(
+            'SELECT DISTINCT ?x WHERE {\n\t?y wdt:P2 ?x .\n\tVALUES ?y { ' +
+            ' '.join(sorted('wd:Q{}'.format(i) for i in range(100))) + ' }\n} LIMIT 100',
+            self._builder.build(term, False)
+        )
+
+    def testBuildBatch(self):
+        self.assertEqual(
+            'SELECT * WHERE {\n\t{\n\t\t{\n\t\t\tSELECT DISTINCT ?x WHERE {\n\t\t\t\twd:Q2 wdt:P2 ?x .\n\t\t\t} LIMIT 100\n\t\t}\n\t\tBIND(0 AS ?b)\n\t} UNION {\n\t\t{\n\t\t\tSELECT DISTINCT ?y WHERE {\n\t\t\t\t?y wdt:P3 wd:Q2 .\n\t\t\t} LIMIT 100\n\t\t}\n\t\tBIND(1 AS ?b)\n\t}\n} ORDER BY ?b DESC(?sitelinksCount)',
+            self._builder.build_batch([Select(_x, TripleFormula(_Q2, _P2, _x)), Select(_y, TripleFormula(_y, _P3, _Q2))],
+                                      VariableFormula('b'), False)
+        )
+
+
+class _BatchWikidataKnowledgeBase(WikidataKnowledgeBase):
+    def __init__(self):
+        super().__init__('http://example.com')
+        self.queries = []
+
+    def _execute_sparql_query(self, query: str):
+        self.queries.append(query)
+        return {'results': {'bindings': [
+            {'x': {'type': 'uri', 'value': 'http://www.wikidata.org/entity/Q3'},
+             'platypusBatchBranch': {'type': 'literal', 'value': '1'}},
+            {'x': {'type': 'uri', 'value': 'http://www.wikidata.org/entity/Q2'},
+             'platypusBatchBranch': {'type': 'literal', 'value': '1'}}
+        ]}}
+
+
+class _UnorderedSparqlKnowledgeBase(WikidataKnowledgeBase):
+    """
+    Query service that does not keep the order of the sub-queries results in the enclosing query
+    """
+
+    _rows = [(1, 'Q2', 10), (0, 'Q5', 1), (1, 'Q4', 30), (0, 'Q6', 5), (1, 'Q3', 20)]
+
+    def __init__(self):
+        super().__init__('http://example.com')
+
+    def _execute_sparql_query(self, query: str):
+        rows = self._rows
+        if query.endswith('ORDER BY ?platypusBatchBranch DESC(?sitelinksCount)'):
+            rows = sorted(rows, key=lambda row: (row[0], -row[2]))
+        return {'results': {'bindings': [
+            {'x': {'type': 'uri', 'value': 'http://www.wikidata.org/entity/' + item},
+             'sitelinksCount': {'type': 'literal', 'value': str(count)},
+             'platypusBatchBranch': {'type': 'literal', 'value': str(branch)}}
+            for branch, item, count in rows
+        ]}}
+
+
+class _CountingSparqlBuilder(_WikidataQuerySparqlBuilder):
+    def __init__(self):
+        self.built = 0
+
+    def build(self, term, do_ranking=True):
+        self.built += 1
+        return super().build(term, do_ranking)
+
+
+class _ConcurrentWikidataKnowledgeBase(WikidataKnowledgeBase):
+    def __init__(self):
+        super().__init__('http://example.com', sparql_batch_size=1, sparql_concurrency=2)
+        self._sparql_builder = _CountingSparqlBuilder()
+        self._barrier = threading.Barrier(2)
+        self.queries = []
+
+    def _execute_sparql_query(self, query: str):
+        self.queries.append(query)
+        self._barrier.wait(5)  # Fails if the queries are not evaluated concurrently
+        return {'results': {'bindings': []}}
+
+
+class _VocabularyWikidataKnowledgeBase(WikidataKnowledgeBase):
+    _vocabulary = _RelationsVocabulary()
+
+    def __init__(self, vocabulary_file=None):
+        self.queries = []
+        super().__init__('http://example.com', preload_languages=('en',), vocabulary_file=vocabulary_file)
+
+    def _execute_sparql_query(self, query: str):
+        self.queries.append(query)
+        return {'results': {'bindings': [
+            {'directProperty': {'type': 'uri', 'value': 'http://www.wikidata.org/prop/direct/P2'},
+             'propertyType': {'type': 'uri', 'value': 'http://wikiba.se/ontology#WikibaseItem'},
+             'label': {'type': 'literal', 'value': 'Foo', 'xml:lang': 'en'},
+             'propertyLabel': {'type': 'literal', 'value': 'foo', 'xml:lang': 'en'}},
+            {'directProperty': {'type': 'uri', 'value': 'http://www.wikidata.org/prop/direct/P2'},
+             'propertyType': {'type': 'uri', 'value': 'http://wikiba.se/ontology#WikibaseItem'},
+             'label': {'type': 'literal', 'value': 'bar', 'xml:lang': 'en'},
+             'propertyLabel': {'type': 'literal', 'value': 'foo', 'xml:lang': 'en'}}
+        ]}}
+
+
+class _SearchWikidataKnowledgeBase(WikidataKnowledgeBase):
+    def __init__(self, **kwargs):
+        super().__init__('http://example.com', **kwargs)
+        self.searches = []
+
+    def _execute_entity_search(self, label: str, language_code: str, type_filter):
+        self.searches.append(label)
+        return [{'@id': 'wd:Q{}'.format(i), 'sameAs': ['x'] * i} for i in range(5) if label != 'empty']
+
+
+class _EntityResponse:
+    headers = {}
+
+    def __init__(self, url, error=False):
+        self._url = url
+        self.status_code = 503 if error else 200
+
+    def json(self):
+        if self.status_code != 200:
+            return {'error': 'Service unavailable'}
+        return {'@id': self._url.replace('http://example.com/entity/wd%3A', 'wd:')}
+
+
+class _EntitySession:
+    def __init__(self, errors=0):
+        self.urls = []
+        self.threads = set()
+        self._lock = threading.Lock()
+        self._errors = errors
+
+    def get(self, url, headers=None, timeout=None):
+        with self._lock:
+            self.urls.append(url)
+            self.threads.add(threading.get_ident())
+            error = len(self.urls) <= self._errors
+        threading.Event().wait(0.01)
+        return _EntityResponse(url, error)
+
+
+class _SparqlResponse:
+    def __init__(self, query):
+        self._query = query
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {'boolean': self._query.endswith('"a  b" }')}
+
+
+class _SparqlSession:
+    def post(self, url, data, headers, timeout):
+        return _SparqlResponse(data)
+
+
+class _MemoryDictCache(DictCache):
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key: str):
+        return self.values.get(key)
+
+    def set(self, key: str, value):
+        self.values[key] = value
+
+
+class WikidataKnowledgeBaseTest(unittest.TestCase):
+    def testSparqlCacheKeepsLiterals(self):
+        knowledge_base = WikidataKnowledgeBase('http://example.com', sparql_cache=_MemoryDictCache())
+        knowledge_base._request_session_sparql = _SparqlSession()
+        self.assertEqual({'boolean': True}, knowledge_base._execute_sparql_query('ASK { ?x rdfs:label "a  b" }'))
+        self.assertEqual({'boolean': False}, knowledge_base._execute_sparql_query('ASK { ?x rdfs:label "a b" }'))
+        self.assertEqual(2, len(knowledge_base._sparql_cache.values))
+
+    def testVocabularyFile(self):
+        knowledge_base = _VocabularyWikidataKnowledgeBase()
+        relations = {label: knowledge_base.relations_from_label(label, 'en') for label in ('foo', 'bar', 'baz')}
+        self.assertEqual(1, len(knowledge_base.queries))
+        self.assertEqual(1, len(relations['foo']))
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'vocabulary.json.gz')
+            knowledge_base.save_vocabulary(file_name, ('en',))
+            _VocabularyWikidataKnowledgeBase._vocabulary = _RelationsVocabulary()
+
+            knowledge_base = _VocabularyWikidataKnowledgeBase(file_name)
+            self.assertEqual([], knowledge_base.queries)
+            self.assertEqual(relations,
+                             {label: knowledge_base.relations_from_label(label, 'en') for label in relations})
+            self.assertEqual('foo', knowledge_base.get_label(_P2.term, 'en'))
+
+    def testVocabularyLoadedOnce(self):
+        _VocabularyWikidataKnowledgeBase._vocabulary = _RelationsVocabulary()
+        first = _VocabularyWikidataKnowledgeBase()
+        second = _VocabularyWikidataKnowledgeBase()
+        self.assertEqual(1, len(first.queries))
+        self.assertEqual([], second.queries)
+        self.assertEqual(first.relations_from_label('foo', 'en'), second.relations_from_label('foo', 'en'))
+        with self.assertRaises(TypeError):
+            first._vocabulary.property_for_iri['foo'] = None
+
+    def testBuildInterpretations(self):
+        knowledge_base = _BatchWikidataKnowledgeBase()
+        terms = [Select(_x, TripleFormula(_x, _P2, _Q2)), Select(_x, TripleFormula(_x, _P2, _Q3))]
+        interpretations = knowledge_base.build_interpretations(terms)
+        self.assertEqual(1, len(knowledge_base.queries))
+        self.assertEqual(terms, [interpretation.interpretation for interpretation in interpretations])
+        self.assertEqual([], interpretations[0].results)
+        self.assertEqual([_Q3.term, _Q2.term], [result.result for result in interpretations[1].results])
+
+    def testBuildInterpretationsKeepsRanking(self):
+        terms = [Select(_x, TripleFormula(_x, _P2, _Q2)), Select(_x, TripleFormula(_x, _P2, _Q3))]
+        interpretations = _UnorderedSparqlKnowledgeBase().build_interpretations(terms)
+        self.assertEqual([['Q6', 'Q5'], ['Q4', 'Q3', 'Q2']],
+                         [[result.result.iri.rsplit('/', 1)[1] for result in interpretation.results]
+                          for interpretation in interpretations])
+
+    def testBuildInterpretationsConcurrentChunks(self):
+        knowledge_base = _ConcurrentWikidataKnowledgeBase()
+        terms = [Select(_x, TripleFormula(_x, _P2, _Q2)), Select(_x, TripleFormula(_x, _P2, _Q3))]
+        interpretations = knowledge_base.build_interpretations(terms)
+        self.assertEqual(terms, [interpretation.interpretation for interpretation in interpretations])
+        self.assertEqual(2, len(knowledge_base.queries))
+        self.assertEqual(2, knowledge_base._sparql_builder.built)  # Each query is only built once
+
+    def testFormatAllToJsonld(self):
+        knowledge_base = WikidataKnowledgeBase('http://example.com', entity_fetch_concurrency=4)
+        knowledge_base._request_session_kb = _EntitySession()
+        subject = NamedIndividual('http://www.wikidata.org/entity/Q10')
+        predicate = ObjectProperty('http://www.wikidata.org/prop/direct/P50', owl_NamedIndividual)
+        results = [QAInterpretationResult(NamedIndividual('http://www.wikidata.org/entity/Q{}'.format(i)))
+                   for i in range(20, 28)]
+        results.append(QAInterpretationResult(_Q2.term, subject, predicate))
+
+        formatted = knowledge_base.format_all_to_jsonld(results, 'fr')
+        self.assertEqual(['wd:Q{}'.format(i) for i in range(20, 28)] + ['wd:Q2'],
+                         [result['@id'] for result in formatted])
+        self.assertEqual(10, len(knowledge_base._request_session_kb.urls))  # Each entity is fetched once
+        self.assertGreater(len(knowledge_base._request_session_kb.threads), 1)
+        self.assertEqual({'@id': 'wd:Q2'}, knowledge_base._format_entity(_Q2.term.iri, 'fr'))
+
+    def testEntityErrorNotCached(self):
+        knowledge_base = WikidataKnowledgeBase('http://example.com')
+        knowledge_base._request_session_kb = _EntitySession(errors=1)
+        self.assertEqual({'@id': 'http://www.wikidata.org/entity/Q2'},
+                         knowledge_base._format_entity('http://www.wikidata.org/entity/Q2', 'fr'))
+        self.assertEqual({'@id': 'wd:Q2'}, knowledge_base._format_entity('http://www.wikidata.org/entity/Q2', 'fr'))
+        self.assertEqual({'@id': 'wd:Q2'}, knowledge_base._format_entity('http://www.wikidata.org/entity/Q2', 'fr'))
+        self.assertEqual(2, len(knowledge_base._request_session_kb.urls))
+
+    def testIndividualsFromLabel(self):
+        knowledge_base = _SearchWikidataKnowledgeBase(individuals_limits=(2, 10000))
+        self.assertEqual((2, None), knowledge_base.individuals_limits())
+        self.assertEqual(['http://www.wikidata.org/entity/Q4', 'http://www.wikidata.org/entity/Q3'],
+                         [select.body.right.term.iri for select in
+                          knowledge_base.individuals_from_label('foo', 'en', limit=2)])
+        self.assertEqual(5, len(knowledge_base.individuals_from_label('foo', 'en')))
+        self.assertEqual(5, knowledge_base.individuals_count('foo', 'en'))
+        self.assertEqual([], knowledge_base.individuals_from_label('empty', 'en', limit=2))
+        self.assertEqual([], knowledge_base.individuals_from_label('empty', 'en'))
+        self.assertEqual(['foo', 'empty'], knowledge_base.searches)
+
+    def testIndividualsTermsCached(self):
+        knowledge_base = _SearchWikidataKnowledgeBase(compacted_individuals=True)
+        first = knowledge_base.individuals_from_label('foo', 'en', limit=2)
+        second = knowledge_base.individuals_from_label('foo', 'en', limit=2)
+        self.assertEqual(first, second)
+        self.assertIs(first[0], second[0])
+        self.assertEqual(2, len(first[0].body.args))
+        self.assertIsNot(first[0], knowledge_base.individuals_from_label('foo', 'en')[0])
+        self.assertEqual(5, len(knowledge_base.individuals_from_label('foo', 'en')[0].body.args))
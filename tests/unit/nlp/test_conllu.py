@@ -0,0 +1,97 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import tempfile
+import unittest
+
+from platypus_qa.nlp.conllu import CoNLLUParser
+from platypus_qa.nlp.universal_dependencies import UDPOSTag, UDDependency
+
+_document = '# sent_id = 1\n' \
+            '# text = Où est-il ?\n' \
+            '1	Où	où	ADV	_	_	2	advmod	_	_\n' \
+            '2-3	est-il	_	_	_	_	_	_	_	_\n' \
+            '2	est	être	VERB	_	_	0	root	_	_\n' \
+            '3	il	il	PRON	_	_	2	nsubj	_	_\n' \
+            '4	?	?	PUNCT	_	_	2	punct	_	_\n' \
+            '\n' \
+            '1	Paris	Paris	PROPN	_	_	0	root	_	_\n' \
+            '1.1	est	être	AUX	_	_	_	_	1:cop	_\n' \
+            '2	!	!	PUNCT	_	_	1	punct	_	_\n'
+
+
+class CoNLLUParserTest(unittest.TestCase):
+    _parser = CoNLLUParser()
+
+    def _check(self, sentences):
+        self.assertEqual(len(sentences), 2)
+        self.assertEqual([token.word for token in sentences[0]], ['Où', 'est', 'il', '?'])
+        self.assertEqual(sentences[0].root.lemma, 'être')
+        self.assertEqual([token.ud_pos for token in sentences[0]],
+                         [UDPOSTag.ADV, UDPOSTag.VERB, UDPOSTag.PRON, UDPOSTag.PUNCT])
+        self.assertEqual([token.main_ud_dependency for token in sentences[0].root.children],
+                         [UDDependency.advmod, UDDependency.nsubj, UDDependency.punct])
+        self.assertEqual(sentences[0][2].head.word, 'est')
+        self.assertEqual([token.word for token in sentences[1]], ['Paris', '!'])
+        self.assertEqual(sentences[1].root.word, 'Paris')
+
+    def test_parse(self):
+        self._check(self._parser.parse(_document, 'fr'))
+
+    def test_iter_parse(self):
+        self._check(list(self._parser.iter_parse(_document.splitlines(True), 'fr')))
+
+    def test_parse_file(self):
+        with tempfile.NamedTemporaryFile('wb', suffix='.conllu', delete=False) as file:
+            file.write(_document.encode('utf-8'))
+        try:
+            self._check(list(self._parser.parse_file(file.name, 'fr')))
+        finally:
+            os.remove(file.name)
+
+    def test_parse_empty_file(self):
+        with tempfile.NamedTemporaryFile('wb', suffix='.conllu', delete=False) as file:
+            pass
+        try:
+            self.assertEqual(list(self._parser.parse_file(file.name, 'fr')), [])
+        finally:
+            os.remove(file.name)
+
+    def test_missing_dependencies(self):
+        sentence = self._parser.parse('1	Paris	Paris	PROPN	_	_	_	_	_	_', 'fr')[0]
+        self.assertIsNone(sentence.root)
+        self.assertIsNone(sentence[0].main_ud_dependency)
+        self.assertIsNone(sentence[0].head)
+
+    def test_unknown_tags(self):
+        sentence = self._parser.parse('1	Who	who	_	_	_	2	foo	_	_\n'
+                                      '2	sings	sing	VERB	_	_	0	root	_	_\n'
+                                      '3	?	?	FOO	_	_	2	punct	_	_', 'en')[0]
+        # Only the tokens with unknown tags fail and only when the tags are read
+        self.assertEqual(sentence.root.word, 'sings')
+        self.assertEqual(sentence[1].ud_pos, UDPOSTag.VERB)
+        with self.assertRaises(KeyError):
+            sentence[0].ud_pos
+        with self.assertRaises(KeyError):
+            sentence[0].main_ud_dependency
+        with self.assertRaises(KeyError):
+            sentence[2].ud_pos
+        self.assertEqual(sentence[2].main_ud_dependency, UDDependency.punct)
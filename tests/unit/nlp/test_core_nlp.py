@@ -0,0 +1,52 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+
+from platypus_qa.nlp.core_nlp import _build_sentence
+from platypus_qa.nlp.universal_dependencies import UDPOSTag, UDDependency
+
+
+def _output(tokens):
+    return {
+        'tokens': [{'word': word, 'lemma': word.lower(), 'pos': pos} for word, pos, _, _ in tokens],
+        'basicDependencies': [{'dependent': i + 1, 'dependentGloss': word, 'dep': dep, 'governor': governor}
+                              for i, (word, _, dep, governor) in enumerate(tokens)]
+    }
+
+
+class CoreNLPSentenceTest(unittest.TestCase):
+    def test_build_sentence(self):
+        sentence = _build_sentence(_output([('Who', 'WP', 'nsubj', 2), ('sings', 'VBZ', 'ROOT', 0)]), 'en')
+        self.assertEqual(sentence.root.word, 'sings')
+        self.assertEqual(sentence[0].ud_pos, UDPOSTag.PRON)
+        self.assertEqual(sentence[0].main_ud_dependency, UDDependency.nsubj)
+
+    def test_unknown_tags(self):
+        sentence = _build_sentence(
+            _output([('Who', 'FOO', 'nsubj', 2), ('sings', 'VBZ', 'ROOT', 0), ('?', '.', 'foo', 2)]), 'en')
+        # Only the tokens with unknown tags fail and only when the tags are read
+        self.assertEqual(sentence.root.word, 'sings')
+        self.assertEqual(sentence[1].ud_pos, UDPOSTag.VERB)
+        with self.assertRaises(KeyError):
+            sentence[0].ud_pos
+        self.assertEqual(sentence[0].main_ud_dependency, UDDependency.nsubj)
+        with self.assertRaises(KeyError):
+            sentence[2].main_ud_dependency
@@ -0,0 +1,80 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+
+from platypus_qa.nlp.conllu import CoNLLUParser
+from platypus_qa.nlp.model import CompactSentence
+from platypus_qa.nlp.universal_dependencies import UDPOSTag, UDDependency
+
+
+class CompactSentenceTest(unittest.TestCase):
+    _sentence = CoNLLUParser().parse(
+        '1	Where	where	ADV	WRB	_	4	advmod	_	_\n'
+        '2	is	be	AUX	VBZ	_	4	cop	_	_\n'
+        '3	the	the	DET	DT	_	4	det	_	_\n'
+        '4	capital	capital	NOUN	NN	_	0	root	_	_\n'
+        '5	of	of	ADP	IN	_	7	case	_	_\n'
+        '6	South	South	PROPN	NNP	_	7	compound	_	_\n'
+        '7	Africa	Africa	PROPN	NNP	_	4	nmod	_	_\n'
+        '8	?	?	PUNCT	.	_	4	punct	_	_', 'en')[0]
+
+    def _words(self, tokens):
+        return [token.word for token in tokens]
+
+    def test_tree(self):
+        root = self._sentence.root
+        self.assertEqual(root.word, 'capital')
+        self.assertIsNone(root.head)
+        self.assertEqual(self._words(root.left_children), ['Where', 'is', 'the'])
+        self.assertEqual(self._words(root.right_children), ['Africa', '?'])
+        self.assertEqual(self._words(root.children), ['Where', 'is', 'the', 'Africa', '?'])
+        self.assertEqual(self._words(root.children_by_ud_dependency(UDDependency.nmod)), ['Africa'])
+        self.assertEqual(self._sentence[6].head.word, 'capital')
+        self.assertEqual(self._sentence[6].id, 7)
+        self.assertEqual(self._sentence[6].ud_pos, UDPOSTag.PROPN)
+
+    def test_subtree(self):
+        self.assertEqual(self._words(self._sentence.root.subtree), [token.word for token in self._sentence])
+        self.assertEqual(self._words(self._sentence[6].subtree), ['of', 'South', 'Africa'])
+        self.assertEqual(self._words(self._sentence[4].subtree), ['of'])
+
+    def test_neighbours(self):
+        self.assertIsNone(self._sentence[0].prev)
+        self.assertEqual(self._sentence[0].next.word, 'is')
+        self.assertEqual(self._sentence[7].prev.word, 'Africa')
+        self.assertIsNone(self._sentence[7].next)
+
+    def test_non_projective(self):
+        # "A hearing is scheduled on the issue today": "on the issue" depends on "hearing"
+        sentence = CompactSentence(
+            'en',
+            ['A', 'hearing', 'is', 'scheduled', 'on', 'the', 'issue', 'today'],
+            ['a', 'hearing', 'be', 'schedule', 'on', 'the', 'issue', 'today'],
+            [UDPOSTag.DET, UDPOSTag.NOUN, UDPOSTag.AUX, UDPOSTag.VERB, UDPOSTag.ADP, UDPOSTag.DET, UDPOSTag.NOUN,
+             UDPOSTag.NOUN],
+            [UDDependency.det, UDDependency.nsubj, UDDependency.aux, UDDependency.root, UDDependency.case,
+             UDDependency.det, UDDependency.nmod, UDDependency.obl],
+            [1, 3, 3, -1, 6, 6, 1, 3],
+            3
+        )
+        self.assertEqual(self._words(sentence[1].subtree), ['A', 'hearing', 'on', 'the', 'issue'])
+        self.assertEqual(self._words(sentence.root.subtree),
+                         ['A', 'hearing', 'on', 'the', 'issue', 'is', 'scheduled', 'today'])
@@ -0,0 +1,77 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import tempfile
+import unittest
+
+from platypus_qa.cache import SQLiteDictCache
+from platypus_qa.nlp.syntaxnet import SyntaxNetParser
+
+_conllu = '1	Paris	Paris	PROPN	_	_	0	root	_	_\n'
+
+
+class _Response:
+    status_code = 200
+    text = _conllu
+
+
+class _Session:
+    def __init__(self):
+        self.texts = []
+
+    def post(self, url, data, headers, timeout):
+        self.texts.append(data.decode('utf-8'))
+        return _Response()
+
+
+class SyntaxNetParserTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._file_name = os.path.join(self._directory.name, 'parses.sqlite')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _parser(self, model_version=''):
+        parser = SyntaxNetParser(['http://syntaxnet'], parse_cache=SQLiteDictCache(self._file_name),
+                                 model_version=model_version)
+        parser._servers._backends[0].session = _Session()
+        return parser
+
+    @staticmethod
+    def _texts(parser):
+        return parser._servers._backends[0].session.texts
+
+    def testPersistentCache(self):
+        parser = self._parser()
+        self.assertEqual('Paris', parser.parse(' Paris ', 'fr')[0].root.word)
+        self.assertEqual(['Paris'], self._texts(parser))
+
+        # Another process with the same models reuses the parse of the same normalized text
+        other_parser = self._parser()
+        self.assertEqual('Paris', other_parser.parse('Paris', 'fr')[0].root.word)
+        self.assertEqual([], self._texts(other_parser))
+        other_parser.parse('Paris', 'en')
+        self.assertEqual(['Paris'], self._texts(other_parser))
+
+        new_model_parser = self._parser('2')
+        new_model_parser.parse('Paris', 'fr')
+        self.assertEqual(['Paris'], self._texts(new_model_parser))
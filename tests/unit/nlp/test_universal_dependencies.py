@@ -20,7 +20,7 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import unittest
 
-from platypus_qa.nlp.universal_dependencies import UDDependency
+from platypus_qa.nlp.universal_dependencies import UDDependency, UDPOSTag
 
 
 class _UDDependencyTest(unittest.TestCase):
@@ -58,3 +58,23 @@ class _UDDependencyTest(unittest.TestCase):
     def test_root(self):
         self.assertEquals(UDDependency.advcl.root_dep, UDDependency.advcl)
         self.assertTrue(UDDependency.acl_relcl.root_dep, UDDependency.acl)
+
+    def test_from_str(self):
+        self.assertEqual(UDDependency.from_str('nmod:poss'), UDDependency.nmod_poss)
+        self.assertEqual(UDDependency.from_str('nmod_poss'), UDDependency.nmod_poss)
+        self.assertEqual(UDDependency.from_str('ROOT'), UDDependency.root)
+        self.assertEqual(UDDependency.from_str('Nmod:Poss'), UDDependency.nmod_poss)
+        self.assertEqual(UDDependency.from_str('dobj'), UDDependency.obj)
+        self.assertEqual(UDDependency.from_str('nsubjpass'), UDDependency.nsubj_pass)
+        with self.assertRaises(KeyError):
+            UDDependency.from_str('foo')
+
+
+class _UDPOSTagTest(unittest.TestCase):
+    def test_from_str(self):
+        self.assertEqual(UDPOSTag.from_str('NOUN'), UDPOSTag.NOUN)
+        self.assertEqual(UDPOSTag.from_str('noun'), UDPOSTag.NOUN)
+        self.assertEqual(UDPOSTag.from_str('Noun'), UDPOSTag.NOUN)
+        self.assertEqual(UDPOSTag.from_str('CONJ'), UDPOSTag.CCONJ)
+        with self.assertRaises(KeyError):
+            UDPOSTag.from_str('foo')
@@ -0,0 +1,164 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+import unittest
+
+import requests
+
+from platypus_qa.backend_pool import BackendPool
+from platypus_qa.deadline import Deadline, DeadlineExceeded
+
+
+class _Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class _Session:
+    def __init__(self, status_code=200, error=False, event=None, timeout=False):
+        self._status_code = status_code
+        self._error = error
+        self._event = event
+        self._timeout = timeout
+        self.calls = 0
+        self.timeouts = []
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        self.timeouts.append(kwargs['timeout'])
+        if self._event is not None:
+            self._event.wait(5)
+        if self._error:
+            raise requests.ConnectionError('{} is down'.format(url))
+        if self._timeout:
+            raise requests.Timeout('{} is too slow'.format(url))
+        return _Response(self._status_code)
+
+
+def _pool(sessions, **kwargs):
+    pool = BackendPool(['http://server{}'.format(i) for i in range(len(sessions))], **kwargs)
+    for backend, session in zip(pool._backends, sessions):
+        backend.session = session
+    return pool
+
+
+class BackendPoolTest(unittest.TestCase):
+    def testLeastOutstanding(self):
+        sessions = [_Session(), _Session()]
+        pool = _pool(sessions, hedging_percentile=None)
+        pool._backends[0].outstanding = 1
+        pool.post(data=b'foo')
+        self.assertEqual([0, 1], [session.calls for session in sessions])
+
+    def testEjection(self):
+        sessions = [_Session(error=True), _Session()]
+        pool = _pool(sessions, max_failures=2, hedging_percentile=None)
+        pool._backends[1].outstanding = 1  # The first server is tried first
+        for _ in range(2):
+            with self.assertRaises(requests.ConnectionError):
+                pool.post(data=b'foo')
+        self.assertTrue(pool.stats['backends'][0]['ejected'])
+        self.assertEqual(200, pool.post(data=b'foo').status_code)
+        self.assertEqual([2, 1], [session.calls for session in sessions])
+
+    def testAllEjected(self):
+        sessions = [_Session(status_code=503)]
+        pool = _pool(sessions, max_failures=1)
+        self.assertEqual(503, pool.post(data=b'foo').status_code)
+        self.assertTrue(pool.stats['backends'][0]['ejected'])
+        self.assertEqual(503, pool.post(data=b'foo').status_code)
+        self.assertEqual(2, sessions[0].calls)
+
+    def testHedging(self):
+        event = threading.Event()
+        sessions = [_Session(event=event), _Session()]
+        pool = _pool(sessions)
+        for _ in range(BackendPool._hedging_min_samples):
+            pool._release(pool._acquire(), 0.001, False)
+        pool._backends[1].outstanding = 1  # The slow server is tried first
+        try:
+            self.assertEqual(200, pool.post(data=b'foo').status_code)
+        finally:
+            event.set()
+        self.assertEqual([1, 1], [session.calls for session in sessions])
+        self.assertEqual(1, pool.stats['hedged_requests'])
+
+    def testHedgingLimit(self):
+        event = threading.Event()
+        sessions = [_Session(event=event), _Session()]
+        pool = _pool(sessions, max_hedged_in_flight=0)
+        for _ in range(BackendPool._hedging_min_samples):
+            pool._release(pool._acquire(), 0.001, False)
+        pool._backends[1].outstanding = 1  # The slow server is tried first
+        threading.Timer(0.1, event.set).start()
+        self.assertEqual(200, pool.post(data=b'foo').status_code)
+        self.assertEqual([1, 0], [session.calls for session in sessions])
+        self.assertEqual(0, pool.stats['hedged_requests'])
+        self.assertEqual(1, pool.stats['hedges_skipped'])
+
+    def testTimeout(self):
+        sessions = [_Session(timeout=True)]
+        pool = _pool(sessions, max_failures=1, timeout=10)
+        with Deadline(5):
+            # The timeout has been shortened by the deadline: the server is not blamed
+            with self.assertRaises(requests.Timeout):
+                pool.post(data=b'foo')
+        self.assertLessEqual(sessions[0].timeouts[0], 5)
+        self.assertFalse(pool.stats['backends'][0]['ejected'])
+        self.assertEqual(0, pool.stats['backends'][0]['consecutive_failures'])
+        with self.assertRaises(requests.Timeout):
+            pool.post(data=b'foo')
+        self.assertEqual(10, sessions[0].timeouts[1])
+        self.assertTrue(pool.stats['backends'][0]['ejected'])
+
+    def testDeadlineExceeded(self):
+        sessions = [_Session()]
+        pool = _pool(sessions, max_failures=1, timeout=10)
+        with Deadline(0) as deadline:
+            deadline.cancel()
+            with self.assertRaises(DeadlineExceeded):
+                pool.post(data=b'foo')
+        self.assertEqual(0, sessions[0].calls)
+        self.assertEqual({'outstanding': 0, 'consecutive_failures': 0, 'ejected': False},
+                         {key: pool.stats['backends'][0][key] for key in ('outstanding', 'consecutive_failures',
+                                                                            'ejected')})
+
+    def testCancelledRequestReleased(self):
+        event = threading.Event()
+        pool = _pool([_Session(), _Session()], pool_size=1)
+        try:
+            # All the threads are busy: the request stays queued
+            for _ in range(2):
+                pool._executor.submit(event.wait, 5)
+            future = pool._submit(pool._acquire(), {'data': b'foo', 'timeout': None})
+            self.assertEqual(1, sum(backend['outstanding'] for backend in pool.stats['backends']))
+            self.assertTrue(future.cancel())
+        finally:
+            event.set()
+        self.assertEqual(0, sum(backend['outstanding'] for backend in pool.stats['backends']))
+
+    def testDefaultTimeout(self):
+        sessions = [_Session(timeout=True)]
+        pool = _pool(sessions, max_failures=1)
+        with self.assertRaises(requests.Timeout):
+            pool.post(data=b'foo')
+        self.assertEqual([10], sessions[0].timeouts)
+        self.assertTrue(pool.stats['backends'][0]['ejected'])
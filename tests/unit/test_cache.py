@@ -0,0 +1,160 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+
+from platypus_qa.cache import SQLiteDictCache, SingleFlightCache
+from platypus_qa.deadline import DeadlineExceeded
+
+
+class SQLiteDictCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._file_name = os.path.join(self._directory.name, 'cache.sqlite')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def testGetSet(self):
+        cache = SQLiteDictCache(self._file_name)
+        self.assertIsNone(cache.get('foo'))
+        cache.set('foo', {'bar': [1, 2]})
+        self.assertEqual({'bar': [1, 2]}, cache.get('foo'))
+        self.assertEqual({'hits': 1, 'misses': 1}, cache.stats)
+
+    def testSharedFile(self):
+        SQLiteDictCache(self._file_name).set('foo', 'bar')
+        self.assertEqual('bar', SQLiteDictCache(self._file_name).get('foo'))
+
+    def testTTL(self):
+        cache = SQLiteDictCache(self._file_name, ttl=-1)
+        cache.set('foo', 'bar')
+        self.assertIsNone(cache.get('foo'))
+
+    def testEviction(self):
+        cache = SQLiteDictCache(self._file_name, max_size=100)
+        for i in range(10):
+            cache.set('key{}'.format(i), 'v' * 20)
+        cache.evict()
+        self.assertIsNone(cache.get('key0'))
+        self.assertEqual('v' * 20, cache.get('key9'))
+
+
+class SingleFlightCacheTest(unittest.TestCase):
+    def testCoalescing(self):
+        cache = SingleFlightCache()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return ['foo']
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('key', compute))) for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while cache.stats['coalesced'] < 3:
+            threading.Event().wait(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([['foo']] * 4, results)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(['foo'], cache.get('key', lambda: ['bar']))
+
+    def testNegativeTTL(self):
+        cache = SingleFlightCache(negative_ttl=60)
+        self.assertEqual([], cache.get('key', lambda: []))
+        self.assertEqual([], cache.get('key', lambda: ['foo']))
+        cache = SingleFlightCache(negative_ttl=-1)
+        self.assertEqual([], cache.get('key', lambda: []))
+        self.assertEqual(['foo'], cache.get('key', lambda: ['foo']))
+
+    def testFailuresNotCached(self):
+        cache = SingleFlightCache()
+
+        def fail():
+            raise ValueError('foo')
+
+        with self.assertRaises(ValueError):
+            cache.get('key', fail)
+        self.assertEqual(['foo'], cache.get('key', lambda: ['foo']))
+
+    def testMaxSize(self):
+        cache = SingleFlightCache(max_size=2, max_negative_size=1, size_of=len)
+        for key in ('a', 'b', 'c'):
+            cache.get(key, lambda: [key])
+        cache.get('d', lambda: [])
+        cache.get('e', lambda: [])
+        self.assertEqual(['new'], cache.get('a', lambda: ['new']))
+        self.assertEqual(['c'], cache.get('c', lambda: ['new']))
+        self.assertEqual(['new'], cache.get('d', lambda: ['new']))
+
+    def testMaxSizeByValueSize(self):
+        cache = SingleFlightCache(max_size=4, size_of=len)
+        cache.get('small', lambda: ['s'])
+        cache.get('large', lambda: ['l'] * 3)
+        self.assertEqual({'entries': 2, 'size': 4}, {key: cache.stats[key] for key in ('entries', 'size')})
+        cache.get('other', lambda: ['o'] * 2)
+        self.assertEqual({'entries': 1, 'size': 2}, {key: cache.stats[key] for key in ('entries', 'size')})
+        self.assertEqual(['o', 'o'], cache.get('other', lambda: ['new']))
+
+    def testOwnerDeadlineNotShared(self):
+        cache = SingleFlightCache()
+        started = threading.Event()
+        release = threading.Event()
+
+        def timing_out():
+            started.set()
+            release.wait(5)
+            raise DeadlineExceeded()
+
+        errors = []
+
+        def owner():
+            try:
+                cache.get('key', timing_out)
+            except DeadlineExceeded as e:
+                errors.append(e)
+
+        owner_thread = threading.Thread(target=owner)
+        owner_thread.start()
+        started.wait(5)
+        results = []
+        waiter_thread = threading.Thread(target=lambda: results.append(cache.get('key', lambda: ['foo'])))
+        waiter_thread.start()
+        while cache.stats['coalesced'] < 1:
+            threading.Event().wait(0.001)
+        release.set()
+        owner_thread.join()
+        waiter_thread.join()
+        self.assertEqual(1, len(errors))
+        # The waiter has computed the value itself
+        self.assertEqual([['foo']], results)
+        self.assertEqual(2, cache.stats['misses'])
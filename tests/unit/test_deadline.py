@@ -0,0 +1,59 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+import unittest
+
+from platypus_qa.deadline import Deadline, DeadlineExceeded, check_deadline, current_deadline, request_timeout
+
+
+class DeadlineTest(unittest.TestCase):
+    def testNoDeadline(self):
+        self.assertIsNone(current_deadline())
+        check_deadline()
+        self.assertIsNone(request_timeout())
+        self.assertEqual(3, request_timeout(3))
+
+    def testExpired(self):
+        with Deadline(-1):
+            with self.assertRaises(DeadlineExceeded):
+                check_deadline()
+            with self.assertRaises(DeadlineExceeded):
+                request_timeout(3)
+        self.assertIsNone(current_deadline())
+
+    def testNested(self):
+        with Deadline(10) as outer:
+            self.assertLessEqual(request_timeout(), 10)
+            with Deadline(100) as inner:
+                self.assertIs(inner, current_deadline())
+                self.assertLessEqual(inner.remaining(), 10)
+                outer.cancel()
+                with self.assertRaises(DeadlineExceeded):
+                    check_deadline()
+            self.assertIs(outer, current_deadline())
+
+    def testThreadLocal(self):
+        seen = []
+        with Deadline(-1):
+            thread = threading.Thread(target=lambda: seen.append(current_deadline()))
+            thread.start()
+            thread.join()
+        self.assertEqual([None], seen)
@@ -0,0 +1,110 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+
+from pyld import jsonld
+
+from platypus_qa.jsonld_compactor import JsonLdCompactor
+
+_context = {
+    '@vocab': 'http://schema.org/',
+    'goog': 'http://schema.googleapis.com/',
+    'hydra': 'http://www.w3.org/ns/hydra/core#',
+    'platypus': 'http://askplatyp.us/vocab#',
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'wd': 'http://www.wikidata.org/entity/',
+    'xsd': 'http://www.w3.org/2001/XMLSchema#',
+    'resultScore': 'goog:resultScore',
+    'totalItems': 'hydra:totalItems',
+    'member': 'hydra:member',
+    'platypus:term': {
+        '@type': 'xsd:string'
+    }
+}
+
+_documents = [
+    {
+        'result': {
+            '@id': 'http://www.wikidata.org/entity/Q42',
+            '@type': ['Person', 'http://schema.org/Thing'],
+            'name': {'@value': 'Douglas Adams', '@language': 'EN'},
+            'http://schema.org/description': ['writer'],
+            'sameAs': [],
+            'image': {},
+            'url': None,
+            'birthPlace': {'@id': 'wd:Q350'},
+            'wd:P31': [{'@id': 'wd:Q5'}, {'@id': 'relative'}]
+        },
+        'resultScore': 0.5,
+        'platypus:term': 'λx.⊤'
+    },
+    {
+        'result': {
+            '@id': 'geo:1,2',
+            '@type': 'GeoCoordinates',
+            'latitude': 1.0,
+            'longitude': 2,
+            '@context': {'@vocab': 'http://schema.org/'}
+        }
+    },
+    {
+        'result': {
+            '@type': 'http://www.w3.org/2001/XMLSchema#decimal',
+            'name': '1',
+            'http://www.w3.org/1999/02/22-rdf-syntax-ns#value': {
+                '@value': '1', '@type': 'http://www.w3.org/2001/XMLSchema#decimal'
+            },
+            '@reverse': {'author': [{'@id': 'wd:Q1'}, {'@id': 'wd:Q2', 'name': 'foo'}]}
+        }
+    },
+    {
+        'http://askplatyp.us/vocab#term': 'x',
+        'http://schema.org/member': 'w',
+        'member': 'z',
+        'b': True,
+        'x:y': [1, 'a', None],
+        'http://askplatyp.us/vocab#term2': {'@value': 'x', '@type': 'xsd:string'}
+    },
+    {'result': {'@id': 'wd:Q1', 'foo': {'@list': [1, 2]}}},
+    {'result': {'@context': {'foo': 'http://example.com/'}, 'foo': 'bar'}},
+    {'result': {'@id': 'wd:Q1'}},
+    {'@id': 'wd:Q1'}
+]
+
+
+class JsonLdCompactorTest(unittest.TestCase):
+    def setUp(self):
+        self.compactor = JsonLdCompactor(_context)
+
+    def testCompactConformance(self):
+        for document in _documents:
+            self.assertEqual(jsonld.compact(dict(document, **{'@context': _context}), _context),
+                             self.compactor.compact(document))
+
+    def testCompactCollectionConformance(self):
+        for members in ([], _documents[:1], _documents[:4], _documents):
+            self.assertEqual(jsonld.compact({
+                '@context': _context,
+                '@type': 'hydra:Collection',
+                'totalItems': len(members),
+                'member': members
+            }, _context), self.compactor.compact_collection(members))
@@ -0,0 +1,250 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+import time
+import unittest
+
+from platypus_qa.deadline import Deadline, current_deadline, check_deadline
+from platypus_qa.database.model import QAInterpretation
+from platypus_qa.qa import SharedExecutor, safe_limited_response_builder, QAHandler
+
+
+class ExecutorBudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.executor = SharedExecutor(max_workers=4)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def testSubmit(self):
+        with self.executor.budget(2) as budget:
+            futures = [budget.submit(lambda x: x * 2, i) for i in range(10)]
+            self.assertEqual([i * 2 for i in range(10)], [future.result() for future in futures])
+
+    def testConcurrencyLimit(self):
+        lock = threading.Lock()
+        running = [0, 0]  # current, max
+
+        def task():
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            threading.Event().wait(0.01)
+            with lock:
+                running[0] -= 1
+
+        with self.executor.budget(2) as budget:
+            for future in [budget.submit(task) for _ in range(8)]:
+                future.result()
+        self.assertEqual(2, running[1])
+
+    def testCloseCancelsQueuedTasks(self):
+        release = threading.Event()
+        executed = []
+        with self.executor.budget(1) as budget:
+            first = budget.submit(release.wait)
+            others = [budget.submit(executed.append, i) for i in range(5)]
+        release.set()
+        self.assertTrue(first.result())
+        self.assertTrue(all(future.cancelled() for future in others))
+        self.executor.shutdown()
+        self.assertEqual([], executed)
+
+    def testMapFirstWithResult(self):
+        with self.executor.budget(2) as budget:
+            self.assertEqual(2, budget.map_first_with_result(lambda x: x, ((i,) for i in [0, 2, 3]), bool, None))
+            self.assertIsNone(budget.map_first_with_result(lambda x: x, ((i,) for i in [0, 0]), bool, None))
+
+    def testDeadlinePropagation(self):
+        with self.executor.budget(2) as budget:
+            with Deadline(10) as deadline:
+                future = budget.submit(current_deadline)
+            self.assertIs(deadline, future.result())
+            with Deadline(-1):
+                future = budget.submit(current_deadline)
+            with self.assertRaises(TimeoutError):
+                future.result()
+
+    def testStats(self):
+        self.assertEqual({'max_workers': 4, 'queue_depth': 0, 'active_workers': 0}, self.executor.stats)
+
+
+class _SlowHandler:
+    @safe_limited_response_builder(0.05)
+    def answer(self, iterations):
+        for _ in range(iterations):
+            threading.Event().wait(0.01)
+            Deadline(10).check()
+        return ['ok']
+
+
+class _NonCooperativeHandler:
+    @safe_limited_response_builder(0.2, isolated=True)
+    def answer(self, never_returns):
+        # Never checks its deadline
+        while never_returns:
+            sum(range(1000))
+        return ['ok']
+
+
+class SafeLimitedResponseBuilderTest(unittest.TestCase):
+    def testNonCooperativeIsolated(self):
+        handler = _NonCooperativeHandler()
+        start = time.monotonic()
+        # More stuck calls than processes allowed at the same time: the stuck processes are killed
+        for _ in range(6):
+            self.assertEqual([], handler.answer(True))
+        self.assertLess(time.monotonic() - start, 5)
+        start = time.monotonic()
+        self.assertEqual(['ok'], handler.answer(False))
+        self.assertLess(time.monotonic() - start, 0.2)
+
+    def testNonCooperativeIsolatedInThreads(self):
+        handler = _NonCooperativeHandler()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(handler.answer(True))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual([[]] * 4, results)
+        self.assertEqual(['ok'], handler.answer(False))
+
+    def testIsolatedError(self):
+        class _FailingHandler:
+            @safe_limited_response_builder(5, isolated=True)
+            def answer(self):
+                raise ValueError('foo')
+
+        self.assertEqual([], _FailingHandler().answer())
+
+    def testTimeoutInThread(self):
+        results = []
+        threads = [threading.Thread(target=lambda i=i: results.append(_SlowHandler().answer(i))) for i in (1, 100)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted([['ok'], []]), sorted(results))
+
+
+class _FakeParser:
+    def __init__(self, delay, result):
+        self.delay = delay
+        self.result = result
+        self.supported_languages = ['en']
+
+
+class _HedgingQAHandler(QAHandler):
+    def __init__(self, parsers, delays, parsing_executor=None):
+        super().__init__(parsers, None, parser_hedging_delays=delays, parsing_executor=parsing_executor)
+        self.started = []
+
+    @safe_limited_response_builder(5)
+    def _do_with_grammatical_analysis(self, parser, question, language_code):
+        self.started.append(parser)
+        for _ in range(int(parser.delay * 100)):
+            threading.Event().wait(0.01)
+            check_deadline()
+        return parser.result
+
+
+class QAHandlerHedgingTest(unittest.TestCase):
+    def testPriority(self):
+        slow = _FakeParser(0.2, ['slow'])
+        fast = _FakeParser(0, ['fast'])
+        handler = _HedgingQAHandler([slow, fast], (0,))
+        self.assertEqual(['slow'], handler.answer('foo', 'en'))
+        self.assertEqual([slow, fast], handler.started)
+
+    def testFallback(self):
+        failing = _FakeParser(0.1, [])
+        fast = _FakeParser(0, ['fast'])
+        self.assertEqual(['fast'], _HedgingQAHandler([failing, fast], (0, 10)).answer('foo', 'en'))
+        self.assertEqual([], _HedgingQAHandler([failing, failing], (0,)).answer('foo', 'en'))
+
+    def testHedgingDelay(self):
+        first = _FakeParser(0.05, ['first'])
+        second = _FakeParser(0, ['second'])
+        handler = _HedgingQAHandler([first, second], (0, 10))
+        self.assertEqual(['first'], handler.answer('foo', 'en'))
+        self.assertEqual([first], handler.started)
+
+    def testSharedParsingExecutor(self):
+        executor = SharedExecutor(1)
+        parser = _FakeParser(0.1, ['result'])
+        handlers = [_HedgingQAHandler([parser], (0,), executor) for _ in range(2)]
+        results = []
+        threads = [threading.Thread(target=lambda handler=handler: results.append(handler.answer('foo', 'en')))
+                   for handler in handlers]
+        for thread in threads:
+            thread.start()
+        # The parsing tasks of both handlers are run by the single thread of the shared executor
+        threading.Event().wait(0.05)
+        self.assertEqual({'max_workers': 1, 'queue_depth': 1, 'active_workers': 1}, executor.stats)
+        for thread in threads:
+            thread.join()
+        self.assertEqual([['result'], ['result']], results)
+
+
+class _FakeTerm:
+    def __init__(self, name, score):
+        self.name = name
+        self.score = score
+
+
+class _FakeKnowledgeBase:
+    def __init__(self, slow_terms=()):
+        self.release = threading.Event()
+        self.slow_terms = slow_terms
+        self.evaluated = []
+
+    def build_interpretations(self, terms):
+        self.evaluated.extend(term.name for term in terms)
+        if any(term.name in self.slow_terms for term in terms):
+            self.release.wait(5)
+        return [QAInterpretation(term, [term.name] if term.name != 'empty' else []) for term in terms]
+
+
+class QAHandlerTiersTest(unittest.TestCase):
+    def testTiersOrder(self):
+        handler = QAHandler([], _FakeKnowledgeBase())
+        terms = [_FakeTerm('a', 1), _FakeTerm('b', 3), _FakeTerm('empty', 3), _FakeTerm('c', 1)]
+        self.assertEqual([['b'], ['a', 'c']],
+                         [[interpretation.interpretation.name for interpretation in tier]
+                          for tier in handler._iter_tiers_with_terms(terms)])
+        self.assertEqual(['b'], [interpretation.interpretation.name for interpretation in handler._do_with_terms(terms)])
+
+    def testFirstTierStreamedBeforeTheOthers(self):
+        knowledge_base = _FakeKnowledgeBase(slow_terms=('slow',))
+        tiers = QAHandler([], knowledge_base)._iter_tiers_with_terms([_FakeTerm('fast', 2), _FakeTerm('slow', 1)])
+        self.assertEqual(['fast'], [interpretation.interpretation.name for interpretation in next(tiers)])
+        knowledge_base.release.set()
+        self.assertEqual(['slow'], [interpretation.interpretation.name for interpretation in next(tiers)])
+
+    def testNextTiersCancelled(self):
+        knowledge_base = _FakeKnowledgeBase(slow_terms=('slow',))
+        handler = QAHandler([], knowledge_base, request_concurrency=1)
+        terms = [_FakeTerm('fast', 3), _FakeTerm('slow', 2), _FakeTerm('last', 1)]
+        self.assertEqual(['fast'], [interpretation.interpretation.name for interpretation in handler._do_with_terms(terms)])
+        knowledge_base.release.set()
+        threading.Event().wait(0.1)
+        self.assertNotIn('last', knowledge_base.evaluated)
@@ -0,0 +1,110 @@
+# coding=utf-8
+"""
+Copyright (c) 2017 Lexistems SAS and École normale supérieure de Lyon
+
+This file is part of Platypus.
+
+Platypus is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+import time
+import unittest
+
+from pyld import jsonld
+
+from platypus_qa.request_handler import RequestHandler, _platypus_compactor, _platypus_context
+from tests.unit.test_jsonld_compactor import _documents
+
+
+class _BatchRequestHandler(RequestHandler):
+    def __init__(self):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def ask(self, question: str, language_code: str, accept_language):
+        self.calls.append((question, language_code))
+        if question == 'error':
+            raise ValueError('error')
+        if question == 'blocking':
+            self.started.set()
+            self.release.wait(5)
+        return {'q': question}
+
+
+class AskBatchTest(unittest.TestCase):
+    def testOrderAndDeduplication(self):
+        handler = _BatchRequestHandler()
+        questions = [{'q': 'a', 'lang': 'fr'}, {'q': 'b'}, {'q': 'a', 'lang': 'fr'}, {'q': 'a', 'lang': 'en'}]
+        self.assertEqual([
+            {'q': 'a', 'lang': 'fr', 'answer': {'q': 'a'}},
+            {'q': 'b', 'lang': 'und', 'answer': {'q': 'b'}},
+            {'q': 'a', 'lang': 'fr', 'answer': {'q': 'a'}},
+            {'q': 'a', 'lang': 'en', 'answer': {'q': 'a'}}
+        ], list(handler.ask_batch(questions, 'en', 2, 3)))
+        # The duplicate is in the same chunk, the last question in the next one
+        self.assertEqual([('a', 'en'), ('a', 'fr'), ('b', 'und')], sorted(handler.calls))
+
+    def testErrors(self):
+        handler = _BatchRequestHandler()
+        self.assertEqual([
+            {'error': 'Invalid question: invalid'},
+            {'error': "Invalid question: {'lang': 'en'}"},
+            {'q': 'error', 'lang': 'en', 'error': 'error'},
+            {'q': 'a', 'lang': 'en', 'answer': {'q': 'a'}}
+        ], list(handler.ask_batch(['invalid', {'lang': 'en'}, {'q': 'error', 'lang': 'en'}, {'q': 'a', 'lang': 'en'}],
+                                  'en', 2)))
+
+    def testCloseCancelsPendingQuestions(self):
+        handler = _BatchRequestHandler()
+        answers = handler.ask_batch([{'q': 'a'}, {'q': 'blocking'}, {'q': 'c'}, {'q': 'd'}], 'en', 1)
+        self.assertEqual({'q': 'a', 'lang': 'und', 'answer': {'q': 'a'}}, next(answers))
+        self.assertTrue(handler.started.wait(5))
+        # The client is gone: closing does not wait for the running question and the others are never asked
+        start = time.monotonic()
+        answers.close()
+        self.assertLess(time.monotonic() - start, 1)
+        handler.release.set()
+        threading.Event().wait(0.1)
+        self.assertEqual([('a', 'und'), ('blocking', 'und')], handler.calls)
+
+
+_platypus_documents = _documents + [
+    {
+        'result': {
+            '@id': 'http://www.wikidata.org/entity/Q5',
+            '@type': 'http://www.w3.org/2002/07/owl#Class',
+            'http://www.w3.org/2000/01/rdf-schema#label': {'@value': 'human', '@language': 'en'},
+            'http://www.w3.org/2000/01/rdf-schema#subClassOf': {'@id': 'http://www.w3.org/2002/07/owl#Thing'},
+            'http://www.w3.org/2002/07/owl#sameAs': [{'@id': 'wd:Q6'}]
+        },
+        'resultScore': 1
+    }
+]
+
+
+class PlatypusCompactorTest(unittest.TestCase):
+    def testCompactConformance(self):
+        for document in _platypus_documents:
+            self.assertEqual(jsonld.compact(dict(document, **{'@context': _platypus_context}), _platypus_context),
+                             _platypus_compactor.compact(document))
+
+    def testCompactCollectionConformance(self):
+        self.assertEqual(jsonld.compact({
+            '@context': _platypus_context,
+            '@type': 'hydra:Collection',
+            'totalItems': len(_platypus_documents),
+            'member': _platypus_documents
+        }, _platypus_context), _platypus_compactor.compact_collection(_platypus_documents))